@@ -19,7 +19,8 @@
 """
 
 __all__ = ['CommandsDecoderException', 'CriticalDecoderException', \
-    'ClientCommandsDecoder', 'ServerCommandsEncoder']
+    'ClientCommandsDecoder', 'ServerCommandsEncoder', 'BroadcastEncoder', \
+    'PacketSerializer']
 
 import time
 
@@ -28,6 +29,7 @@ from aoprotocol import clientPackets, serverPackets, clientPacketsFlip
 from util import debug_print
 from gamerules import *
 from player import Player
+from ratelimit import TokenBuckets, RATE_DELAY, RATE_DISCONNECT
 import aoprotocol, gamerules, constants, corevars
 
 class CommandsDecoderException(Exception):
@@ -54,888 +56,300 @@ class ClientCommandsDecoder(object):
             print "Error critico: handlers no utilizados: ", missingHandlers
             assert False
 
-    def handleData(self, prot):
-        buf = prot._ao_inbuff
-        cmd = None
-
-        """
-        Los comandos consumen los bytes del buffer de entrada, si faltan
-        datos se dispara un CommandsDecoderException o ByteQueueError.
-        """
-
-        try:
-            try:
-                while len(buf) > 0:
-                    cmd = buf.peekInt8()
-
-                    if cmd < 0 or cmd >= len(self.cmds):
-                        debug_print("cmd out of range:", cmd)
-                        raise CriticalDecoderException()
-
-                    if self.cmds[cmd] is None:
-                        debug_print("cmd not implemented:", cmd, \
-                            "should be:", clientPacketsFlip.get(cmd, '?'))
-                        raise CriticalDecoderException()
-
-                    # Marca la posicion actual por si hay que hacer rollback.
-                    buf.mark()
-
-                    # Invoca al handler del comando cmd.
-                    self.cmds[cmd](prot, buf)
-
-
-                # La operacion commit() destruye los datos del buffer,
-                # por lo que para llamarla tengo que estar seguro
-                # que se leyeron todos los datos del comando actual.
-                #
-                # Llamarla al final de cada comando puede llegar a ser
-                # lento si hay varios comandos encolados.
-
-                buf.commit()
+        # Tablas generadas a partir de aoprotocol.clientPacketsSchema.
+        self.cmdLengths, self.cmdStructs, self.cmdDecoders = \
+            aoprotocol.compilePacketsDecoder(clientPackets, \
+            aoprotocol.clientPacketsSchema)
 
-                prot.lastHandledPacket = time.time()
+        missingSchema = [clientPacketsFlip[x] for x, h in \
+            enumerate(self.cmds) if h is not None and self.cmdStructs[x] is \
+            None and self.cmdDecoders[x] is None]
 
-            except:
-                buf.rollback()
-                raise
-        except ByteQueueError, e:
-            pass
-            debug_print("ByteQueueError", e)
-        except ByteQueueInsufficientData, e:
-            pass
-        except CommandsDecoderException, e:
-            pass
-            # debug_print("CommandsDecoderException")
-        except CriticalDecoderException, e:
-            if cmd is not None:
-                debug_print("CriticalDecoderException", cmd, \
-                    clientPacketsFlip.get(cmd, '?'), e)
-            raise
-        except Exception, e:
-            debug_print("handleData Exception: ", e)
-            raise
-
-    def CheckLogged(fOrig):
-        """Decorator para verificar que el usuario esta logeado"""
-        def fNew(self, prot, buf):
-            if prot.player is None:
-                raise CriticalDecoderException()
-            return fOrig(self, prot, buf, prot.player)
-        return fNew
-
-    def CheckNotLogged(fOrig):
-        """Decorator para verificar que el usuario no esta logeado"""
-        def fNew(self, prot, buf):
-            if prot.player is not None:
-                raise CriticalDecoderException()
-            return fOrig(self, prot, buf, None)
-        return fNew
-
-    @CheckNotLogged
-    def handleCmdLoginExistingChar(self, prot, buf, player):
-        # PacketID
-        cmd = buf.readInt8()
-
-        playerName = buf.readString()
-        playerPass = buf.readString()
-        playerVers = '%d.%d.%d' % (buf.readInt8(), buf.readInt8(),\
-            buf.readInt8())
-
-        error = False
-
-        if not gamerules.isValidPlayerName(playerName, False):
-            prot.cmdout.sendErrorMsg("Nombre invalido")
-            error = True
-            debug_print("Nombre invalido:", repr(playerName))
-        elif corevars.gameServer.playersLimitReached():
-            prot.cmdout.sendErrorMsg("Limite de jugadores alcanzado")
-            error = True
-        elif corevars.gameServer.isPlayerLogged(playerName):
-            prot.cmdout.sendErrorMsg("El jugador ya se encuentra logeado")
-            error = True
-        else:
-            # La instancia de Player se crea recien cuando es válido.
-            prot.player = Player(prot, playerName)
-            prot.player.start()
-
-        if error:
-            prot.loseConnection()
-
-    @CheckNotLogged
-    def handleCmdThrowDices(self, prot, buf, player):
-        prot.cmdout.sendErrorMsg(constants.CREACION_PJS)
-        raise CriticalDecoderException("Not Implemented")
-
-    @CheckNotLogged
-    def handleCmdLoginNewChar(self, prot, buf, player):
-        prot.cmdout.sendErrorMsg(constants.CREACION_PJS)
-        raise CriticalDecoderException("Not Implemented")
-
-    @CheckLogged
-    def handleCmdTalk(self, prot, buf, player):
-        # PacketID
-        cmd = buf.readInt8()
-        msg = buf.readString()
-        player.onTalk(msg, False)
-
-    @CheckLogged
-    def handleCmdWalk(self, prot, buf, player):
-        cmd = buf.readInt8()
-        heading = buf.readInt8()
-        player.move(heading)
-
-    @CheckLogged
-    def handleCmdOnline(self, prot, buf, player):
-        cmd = buf.readInt8()
-        player.cmdout.sendConsoleMsg(\
-            "Online: %d" % corevars.gameServer.playersCount(), \
-            constants.FONTTYPES['SERVER'])
-
-    @CheckLogged
-    def handleCmdQuit(self, prot, buf, player):
-        cmd = buf.readInt8()
-        player.quit()
-
-    @CheckLogged
-    def handleCmdYell(self, prot, buf, player):
-        cmd = buf.readInt8()
-        msg = buf.readString()
-        player.onTalk(msg, True)
-
-    @CheckLogged
-    def handleCmdWhisper(self, prot, buf, player):
-        cmd = buf.readInt8()
-        target = buf.readInt16()
-        msg = buf.readString()
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRequestPositionUpdate(self, prot, buf, player):
-        cmd = buf.readInt8()
-        player.sendPosUpdate()
-
-    @CheckLogged
-    def handleCmdAttack(self, prot, buf, player):
-        cmd = buf.readInt8()
-        player.doAttack()
-
-    @CheckLogged
-    def handleCmdPickUp(self, prot, buf, player):
-        cmd = buf.readInt8()
-        player.doPickUp()
-
-    @CheckLogged
-    def handleCmdSafeToggle(self, prot, buf, player):
-        cmd = buf.readInt8()
-        # FIXME
-
-    @CheckLogged
-    def handleCmdResuscitationSafeToggle(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRequestGuildLeaderInfo(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRequestAtributes(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRequestFame(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRequestSkills(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRequestMiniStats(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdCommerceEnd(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdUserCommerceEnd(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdUserCommerceConfirm(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdCommerceChat(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdBankEnd(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdUserCommerceOk(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdUserCommerceReject(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdDrop(self, prot, buf, player):
-        cmd = buf.readInt8()
-        slot = buf.readInt8()
-        amount = buf.readInt16()
-        player.onDrop(slot, amount)
-
-    @CheckLogged
-    def handleCmdCastSpell(self, prot, buf, player):
-        cmd = buf.readInt8()
-        spellIdx = buf.readInt8()
-        player.onCastSpell(spellIdx)
-
-    @CheckLogged
-    def handleCmdLeftClick(self, prot, buf, player):
-        cmd = buf.readInt8()
-        x, y = buf.readInt8(), buf.readInt8()
-        player.onLookAtTile(x, y)
-
-    @CheckLogged
-    def handleCmdDoubleClick(self, prot, buf, player):
-        cmd = buf.readInt8()
-        x, y = buf.readInt8(), buf.readInt8()
-        player.onDoubleClick(x, y)
-
-    @CheckLogged
-    def handleCmdWork(self, prot, buf, player):
-        cmd = buf.readInt8()
-        skill = buf.readInt8()
-        player.onWork(skill)
-
-    @CheckLogged
-    def handleCmdUseSpellMacro(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdUseItem(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdCraftBlacksmith(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdCraftCarpenter(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdWorkLeftClick(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdCreateNewGuild(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdSpellInfo(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdEquipItem(self, prot, buf, player):
-        cmd = buf.readInt8()
-        slot = buf.readInt8()
-        player.onEquipItem(slot)
-
-    @CheckLogged
-    def handleCmdChangeHeading(self, prot, buf, player):
-        cmd = buf.readInt8()
-        heading = buf.readInt8()
-        
-        if heading < 1 or heading > 4:
-            raise CriticalDecoderException('Invalid heading')
-
-        player.heading = heading
-        player.onCharacterChange()
-
-    @CheckLogged
-    def handleCmdModifySkills(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdTrain(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdCommerceBuy(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdBankExtractItem(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdCommerceSell(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdBankDeposit(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdForumPost(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdMoveSpell(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdMoveBank(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdClanCodexUpdate(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdUserCommerceOffer(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildAcceptPeace(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildRejectAlliance(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildRejectPeace(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildAcceptAlliance(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildOfferPeace(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildOfferAlliance(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildAllianceDetails(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildPeaceDetails(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildRequestJoinerInfo(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildAlliancePropList(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildPeacePropList(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildDeclareWar(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildNewWebsite(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildAcceptNewMember(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildRejectNewMember(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildKickMember(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildUpdateNews(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildMemberInfo(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildOpenElections(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildRequestMembership(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildRequestDetails(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdGuildLeave(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRequestAccountState(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdPetStand(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdPetFollow(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdReleasePet(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdTrainList(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRest(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdMeditate(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdResucitate(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdHeal(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdHelp(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdRequestStats(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdCommerceStart(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdBankStart(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        if len(missingSchema) > 0:
+            print "Error critico: handlers sin esquema: ", missingSchema
+            assert False
 
-    @CheckLogged
-    def handleCmdEnlist(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        # Limites por PacketID, ver setRateLimits.
+        self.rateLimits = [None] * len(self.cmds)
 
-    @CheckLogged
-    def handleCmdInformation(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-    @CheckLogged
-    def handleCmdReward(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def setRateLimits(self, limits):
+        """limits es una tabla de ratelimit.parseRateLimits."""
 
-    @CheckLogged
-    def handleCmdRequestMOTD(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        self.rateLimits = limits + [None] * (len(self.cmds) - len(limits))
 
-    @CheckLogged
-    def handleCmdUpTime(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleData(self, prot, budget=None):
+        """
+        Decodifica y ejecuta todos los comandos completos que hay en el
+        buffer de entrada, o a lo sumo budget comandos. Si el ultimo comando
+        esta incompleto queda en el buffer hasta que lleguen el resto de los
+        datos. Devuelve True si quedaron datos sin procesar por el budget.
 
-    @CheckLogged
-    def handleCmdPartyLeave(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        Los paquetes de tamaño fijo se validan con la tabla cmdLengths y se
+        decodifican con un solo unpack; los que llevan Strings usan el
+        decoder generado. Los handlers reciben los campos ya decodificados.
 
-    @CheckLogged
-    def handleCmdPartyCreate(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        Los paquetes con limite (ver setRateLimits) consumen un token del
+        bucket de la conexion antes de ejecutarse.
+        """
 
-    @CheckLogged
-    def handleCmdPartyJoin(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        buf = prot._ao_inbuff
+        data = buf.data
+        pos = start = buf.pos
+        end = len(data)
 
-    @CheckLogged
-    def handleCmdInquiry(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        cmds = self.cmds
+        lengths = self.cmdLengths
+        structs = self.cmdStructs
+        decoders = self.cmdDecoders
+        limits = self.rateLimits
+        now = time.time()
 
-    @CheckLogged
-    def handleCmdGuildMessage(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        cmd = None
+        more = False
 
-    @CheckLogged
-    def handleCmdPartyMessage(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        try:
+            while pos < end and not prot._ao_closing:
+                if budget is not None:
+                    if budget <= 0:
+                        more = True
+                        break
+                    budget -= 1
+
+                cmd = data[pos]
+
+                if cmd >= len(cmds):
+                    debug_print("cmd out of range:", cmd)
+                    raise CriticalDecoderException()
+
+                handler = cmds[cmd]
+
+                if handler is None:
+                    debug_print("cmd not implemented:", cmd, \
+                        "should be:", clientPacketsFlip.get(cmd, '?'))
+                    raise CriticalDecoderException()
+
+                n = lengths[cmd]
+                if n is not None:
+                    if end - pos < n:
+                        break
+                    args = structs[cmd].unpack_from(data, pos)
+                    pos += n
+                else:
+                    r = decoders[cmd](data, pos, end)
+                    if r is None:
+                        break
+                    pos, args = r
+
+                limit = limits[cmd]
+                if limit is not None:
+                    buckets = prot.rateBuckets
+                    if buckets is None:
+                        buckets = prot.rateBuckets = TokenBuckets(limits, now)
+
+                    if not buckets.take(cmd, limit, now):
+                        action = limit[2]
+                        if action == RATE_DELAY:
+                            # El paquete queda en el buffer.
+                            buckets.delayed = True
+                            corevars.gameServer.inputDelayed(prot)
+                            break
+                        elif action == RATE_DISCONNECT:
+                            raise CriticalDecoderException("Rate limit")
+
+                        buf.pos = pos
+                        continue
+
+                # Los datos del comando ya se consumieron antes de invocar
+                # al handler; si falla no hay que volver atras.
+                buf.pos = pos
+
+                handler(prot, *args)
 
-    @CheckLogged
-    def handleCmdCentinelReport(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        except ByteQueueError, e:
+            debug_print("ByteQueueError", e)
+            raise CriticalDecoderException(str(e))
+        except CriticalDecoderException, e:
+            if cmd is not None:
+                debug_print("CriticalDecoderException", cmd, \
+                    clientPacketsFlip.get(cmd, '?'), e)
+            raise
+        except CommandsDecoderException, e:
+            pass
+            # debug_print("CommandsDecoderException")
+        except Exception, e:
+            debug_print("handleData Exception: ", e)
+            raise
+        finally:
+            if buf.pos != start:
+                prot.lastHandledPacket = time.time()
 
-    @CheckLogged
-    def handleCmdGuildOnline(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+            # La operacion commit() destruye los datos ya consumidos del
+            # buffer. Se llama una sola vez al final y no por cada comando.
+            buf.commit()
 
-    @CheckLogged
-    def handleCmdPartyOnline(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        return more
 
-    @CheckLogged
-    def handleCmdCouncilMessage(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def CheckLogged(fOrig):
+        """Decorator para verificar que el usuario esta logeado"""
+        def fNew(self, prot, *args):
+            if prot.player is None:
+                raise CriticalDecoderException()
+            return fOrig(self, prot, prot.player, *args)
+        return fNew
 
-    @CheckLogged
-    def handleCmdRoleMasterRequest(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def CheckInMap(fOrig):
+        """
+        Decorator para ignorar los comandos que usan el mapa mientras el
+        usuario esta cambiando de mapa. Va debajo de CheckLogged.
+        """
+        def fNew(self, prot, player, *args):
+            if player.transferring:
+                return
+            return fOrig(self, prot, player, *args)
+        return fNew
 
-    @CheckLogged
-    def handleCmdGMRequest(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def CheckNotLogged(fOrig):
+        """Decorator para verificar que el usuario no esta logeado"""
+        def fNew(self, prot, *args):
+            if prot.player is not None:
+                raise CriticalDecoderException()
+            return fOrig(self, prot, None, *args)
+        return fNew
 
-    @CheckLogged
-    def handleCmdbugReport(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckNotLogged
+    def handleCmdLoginExistingChar(self, prot, player, playerName, \
+        playerPass, versA, versB, versC):
 
-    @CheckLogged
-    def handleCmdChangeDescription(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        playerVers = '%d.%d.%d' % (versA, versB, versC)
 
-    @CheckLogged
-    def handleCmdGuildVote(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        error = False
 
-    @CheckLogged
-    def handleCmdPunishments(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        if not gamerules.isValidPlayerName(playerName, False):
+            prot.cmdout.sendErrorMsg("Nombre invalido")
+            error = True
+            debug_print("Nombre invalido:", repr(playerName))
+        elif corevars.gameServer.playersLimitReached():
+            prot.cmdout.sendErrorMsg("Limite de jugadores alcanzado")
+            error = True
+        elif corevars.gameServer.isPlayerLogged(playerName):
+            prot.cmdout.sendErrorMsg("El jugador ya se encuentra logeado")
+            error = True
+        else:
+            # La instancia de Player se crea recien cuando es válido.
+            prot.player = Player(prot, playerName)
+            prot.player.start()
 
-    @CheckLogged
-    def handleCmdChangePassword(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        if error:
+            prot.loseConnection()
 
-    @CheckLogged
-    def handleCmdGamble(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckNotLogged
+    def handleCmdThrowDices(self, prot, player):
+        prot.cmdout.sendErrorMsg(constants.CREACION_PJS)
+        raise CriticalDecoderException("Not Implemented")
 
-    @CheckLogged
-    def handleCmdInquiryVote(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckNotLogged
+    def handleCmdLoginNewChar(self, prot, player):
+        prot.cmdout.sendErrorMsg(constants.CREACION_PJS)
+        raise CriticalDecoderException("Not Implemented")
 
     @CheckLogged
-    def handleCmdLeaveFaction(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdTalk(self, prot, player, msg):
+        player.onTalk(msg, False)
 
     @CheckLogged
-    def handleCmdBankExtractGold(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckInMap
+    def handleCmdWalk(self, prot, player, heading):
+        player.move(heading)
 
     @CheckLogged
-    def handleCmdBankDepositGold(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdOnline(self, prot, player):
+        player.cmdout.sendConsoleMsg(\
+            "Online: %d" % corevars.gameServer.playersCount(), \
+            constants.FONTTYPES['SERVER'])
 
     @CheckLogged
-    def handleCmdDenounce(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdQuit(self, prot, player):
+        player.quit()
 
     @CheckLogged
-    def handleCmdGuildFundate(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdYell(self, prot, player, msg):
+        player.onTalk(msg, True)
 
     @CheckLogged
-    def handleCmdGuildFundation(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
+    def handleCmdWhisper(self, prot, player, target, msg):
+        pass
         # FIXME
 
     @CheckLogged
-    def handleCmdPartyKick(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckInMap
+    def handleCmdRequestPositionUpdate(self, prot, player):
+        player.sendPosUpdate()
 
     @CheckLogged
-    def handleCmdPartySetLeader(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckInMap
+    def handleCmdAttack(self, prot, player):
+        player.doAttack()
 
     @CheckLogged
-    def handleCmdPartyAcceptMember(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckInMap
+    def handleCmdPickUp(self, prot, player):
+        player.doPickUp()
 
     @CheckLogged
-    def handleCmdPing(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
+    def handleCmdSafeToggle(self, prot, player):
+        pass
         # FIXME
 
     @CheckLogged
-    def handleCmdRequestPartyForm(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckInMap
+    def handleCmdDrop(self, prot, player, slot, amount):
+        player.onDrop(slot, amount)
 
     @CheckLogged
-    def handleCmdItemUpgrade(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdCastSpell(self, prot, player, spellIdx):
+        player.onCastSpell(spellIdx)
 
     @CheckLogged
-    def handleCmdGMCommands(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdLeftClick(self, prot, player, x, y):
+        player.onLookAtTile(x, y)
 
     @CheckLogged
-    def handleCmdInitCrafting(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdDoubleClick(self, prot, player, x, y):
+        player.onDoubleClick(x, y)
 
     @CheckLogged
-    def handleCmdHome(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdWork(self, prot, player, skill):
+        player.onWork(skill)
 
     @CheckLogged
-    def handleCmdShowGuildNews(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    def handleCmdEquipItem(self, prot, player, slot):
+        player.onEquipItem(slot)
 
     @CheckLogged
-    def handleCmdShareNpc(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckInMap
+    def handleCmdHome(self, prot, player):
+        player.onHome()
 
     @CheckLogged
-    def handleCmdStopSharingNpc(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+    @CheckInMap
+    def handleCmdChangeHeading(self, prot, player, heading):
+        if heading < 1 or heading > 4:
+            raise CriticalDecoderException('Invalid heading')
 
-    @CheckLogged
-    def handleCmdConsultation(self, prot, buf, player):
-        cmd = buf.readInt8()
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
+        player.heading = heading
+        player.onCharacterChange()
 
-class ServerCommandsEncoder(object):
+# Los send* de los paquetes que figuran en aoprotocol.serverPacketsSchema
+# se generan a partir del esquema.
+ServerPacketsEncoder = aoprotocol.compilePacketsEncoder(serverPackets, \
+    aoprotocol.serverPacketsSchema)
+
+class ServerCommandsEncoder(ServerPacketsEncoder):
     """
     Conjunto de funciones para generar comandos hacia el cliente.
 
-    Es un Wrapper afuera de AoProtocol.
+    Es un Wrapper afuera de AoProtocol. Los paquetes con esquema se heredan
+    de ServerPacketsEncoder; aca quedan los que se escriben a mano.
     """
 
     __slots__ = ('buf', 'prot', )
@@ -944,60 +358,9 @@ class ServerCommandsEncoder(object):
         self.buf = prot.outbuf
         self.prot = prot # K-Pax.
 
-    def sendConsoleMsg(self, msg, font):
-        self.buf.writeInt8(serverPackets['ConsoleMsg'])
-        self.buf.writeString(msg)
-        self.buf.writeInt8(font)
-        self.prot.flushOutBuf()
-
-    def sendLogged(self, userClass):
-        self.buf.writeInt8(serverPackets['Logged'])
-        self.buf.writeInt8(userClass)
-        self.prot.flushOutBuf()
-
-    def sendChangeMap(self, mapNum, vers):
-        self.buf.writeInt8(serverPackets['ChangeMap'])
-        self.buf.writeInt16(mapNum)
-        self.buf.writeInt16(vers)
-        self.prot.flushOutBuf()
-
-    def sendUserIndexInServer(self, idx):
-        self.buf.writeInt8(serverPackets['UserIndexInServer'])
-        self.buf.writeInt16(idx)
-        self.prot.flushOutBuf()
-
-    def sendUserCharIndexInServer(self, idx):
-        self.buf.writeInt8(serverPackets['UserCharIndexInServer'])
-        self.buf.writeInt16(idx)
-        self.prot.flushOutBuf()
-
-    def sendRemoveDialogs(self):
-        self.buf.writeInt8(serverPackets['RemoveDialogs'])
-        self.prot.flushOutBuf()
-
-    def sendRemoveCharDialog(self, chridx):
-        self.buf.writeInt8(serverPackets['RemoveCharDialog'])
-        self.buf.writeInt16(chridx)
-        self.prot.flushOutBuf()
-
-    def sendNavigateToggle(self):
-        self.buf.writeInt8(serverPackets['NavigateToggle'])
-        self.prot.flushOutBuf()
-
-    def sendDisconnect(self):
-        self.buf.writeInt8(serverPackets['Disconnect'])
-        self.prot.flushOutBuf()
-
-    def sendCommerceEnd(self):
-        self.buf.writeInt8(serverPackets['CommerceEnd'])
-        self.prot.flushOutBuf()
-
-    def sendBankEnd(self):
-        self.buf.writeInt8(serverPackets['BankEnd'])
-        self.prot.flushOutBuf()
-
-    def sendCommerceInit(self):
-        self.buf.writeInt8(serverPackets['CommerceInit'])
+    def sendRaw(self, data):
+        """Envia uno o mas paquetes ya serializados."""
+        self.buf.writeRaw(data)
         self.prot.flushOutBuf()
 
     def sendBankInit(self):
@@ -1014,10 +377,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendUserCommerceEnd(self):
-        self.buf.writeInt8(serverPackets['UserCommerceEnd'])
-        self.prot.flushOutBuf()
-
     def sendUserOfferConfirm(self):
         self.buf.writeInt8(serverPackets['UserOfferConfirm'])
         raise CriticalDecoderException('Not Implemented')
@@ -1025,56 +384,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendCommerceChat(self, chat, font):
-        self.buf.writeInt8(serverPackets['CommerceChat'])
-        self.buf.writeString(chat)
-        self.buf.writeInt8(font)
-        self.prot.flushOutBuf()
-
-    def sendShowBlacksmithForm(self):
-        self.buf.writeInt8(serverPackets['ShowBlacksmithForm'])
-        self.prot.flushOutBuf()
-
-    def sendShowCarpenterForm(self):
-        self.buf.writeInt8(serverPackets['ShowCarpenterForm'])
-        self.prot.flushOutBuf()
-
-    def sendUpdateSta(self, sta):
-        self.buf.writeInt8(serverPackets['UpdateSta'])
-        self.buf.writeInt16(sta)
-        self.prot.flushOutBuf()
-
-    def sendUpdateMana(self, mana):
-        self.buf.writeInt8(serverPackets['UpdateMana'])
-        self.buf.writeInt16(mana)
-        self.prot.flushOutBuf()
-
-    def sendUpdateHP(self, hp):
-        self.buf.writeInt8(serverPackets['UpdateHP'])
-        self.buf.writeInt16(hp)
-        self.prot.flushOutBuf()
-
-    def sendUpdateGold(self, gld):
-        self.buf.writeInt8(serverPackets['UpdateGold'])
-        self.buf.writeInt32(gld)
-        self.prot.flushOutBuf()
-
-    def sendUpdateBankGold(self, gld):
-        self.buf.writeInt8(serverPackets['UpdateBankGold'])
-        self.buf.writeInt32(gld)
-        self.prot.flushOutBuf()
-
-    def sendUpdateExp(self, exp):
-        self.buf.writeInt8(serverPackets['UpdateExp'])
-        self.buf.writeInt32(exp)
-        self.prot.flushOutBuf()
-
-    def sendPosUpdate(self, x, y):
-        self.buf.writeInt8(serverPackets['PosUpdate'])
-        self.buf.writeInt8(x)
-        self.buf.writeInt8(y)
-        self.prot.flushOutBuf()
-
     def sendChatOverHead(self, chat, chridx, color):
         self.buf.writeInt8(serverPackets['ChatOverHead'])
         self.buf.writeString(chat)
@@ -1086,89 +395,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendGuildChat(self, msg):
-        self.buf.writeInt8(serverPackets['GuildChat'])
-        self.buf.writeString(msg)
-        self.prot.flushOutBuf()
-
-    def sendShowMessageBox(self, msg):
-        self.buf.writeInt8(serverPackets['ShowMessageBox'])
-        self.buf.writeString(msg)
-        self.prot.flushOutBuf()
-
-    def sendCharacterCreate(self, chridx, body, head, heading, x, y, weapon, shield, helmet, fx, fxloops, name, nickColor, priv):
-        self.buf.writeInt8(serverPackets['CharacterCreate'])
-        self.buf.writeInt16(chridx)
-        self.buf.writeInt16(body)
-        self.buf.writeInt16(head)
-        self.buf.writeInt8(heading)
-        self.buf.writeInt8(x)
-        self.buf.writeInt8(y)
-        self.buf.writeInt16(weapon)
-        self.buf.writeInt16(shield)
-        self.buf.writeInt16(helmet)
-        self.buf.writeInt16(fx)
-        self.buf.writeInt16(fxloops)
-        self.buf.writeString(name)
-        self.buf.writeInt8(nickColor)
-        self.buf.writeInt8(priv)
-        self.prot.flushOutBuf()
-
-    def sendCharacterRemove(self, chridx):
-        self.buf.writeInt8(serverPackets['CharacterRemove'])
-        self.buf.writeInt16(chridx)
-        self.prot.flushOutBuf()
-
-    def sendCharacterChangeNick(self, chridx, nick):
-        self.buf.writeInt8(serverPackets['CharacterChangeNick'])
-        self.buf.writeInt16(chridx)
-        self.buf.writeString(nick)
-        self.prot.flushOutBuf()
-
-    def sendCharacterMove(self, chridx, x, y):
-        self.buf.writeInt8(serverPackets['CharacterMove'])
-        self.buf.writeInt16(chridx)
-        self.buf.writeInt8(x)
-        self.buf.writeInt8(y)
-        self.prot.flushOutBuf()
-
-    def sendForceCharMove(self, heading):
-        self.buf.writeInt8(serverPackets['ForceCharMove'])
-        self.buf.writeInt8(heading)
-        self.prot.flushOutBuf()
-
-    def sendCharacterChange(self, chridx, body, head, heading, weapon, shield, helmet, fx, fxloops):
-        self.buf.writeInt8(serverPackets['CharacterChange'])
-        self.buf.writeInt16(chridx)
-        self.buf.writeInt16(body)
-        self.buf.writeInt16(head)
-        self.buf.writeInt8(heading)
-        self.buf.writeInt16(weapon)
-        self.buf.writeInt16(shield)
-        self.buf.writeInt16(helmet)
-        self.buf.writeInt16(fx)
-        self.buf.writeInt16(fxloops)
-        self.prot.flushOutBuf()
-
-    def sendObjectCreate(self, x, y, grhIdx):
-        self.buf.writeInt8(serverPackets['ObjectCreate'])
-        self.buf.writeInt8(x)
-        self.buf.writeInt8(y)
-        self.buf.writeInt16(grhIdx)
-        self.prot.flushOutBuf()
-
-    def sendObjectDelete(self, x, y):
-        self.buf.writeInt8(serverPackets['ObjectDelete'])
-        self.buf.writeInt8(x)
-        self.buf.writeInt8(y)
-        self.prot.flushOutBuf()
-
-    def sendBlockPosition(self, x, y, b):
-        self.buf.writeInt8(serverPackets['BlockPosition'])
-        for q in [x, y, b]:
-            self.writeInt8(q)
-        self.prot.flushOutBuf()
-
     def sendPlayMidi(self):
         self.buf.writeInt8(serverPackets['PlayMidi'])
         raise CriticalDecoderException('Not Implemented')
@@ -1190,13 +416,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendAreaChanged(self):
-        self.buf.writeInt8(serverPackets['AreaChanged'])
-        raise CriticalDecoderException('Not Implemented')
-        # FIXME
-
-        self.prot.flushOutBuf()
-
     def sendPauseToggle(self):
         self.buf.writeInt8(serverPackets['PauseToggle'])
         raise CriticalDecoderException('Not Implemented')
@@ -1211,22 +430,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendCreateFX(self, fx, fxloops, chridx):
-        self.buf.writeInt8(serverPackets['CreateFX'])
-        for x in [fx, fxloops, chridx]:
-            self.buf.writeInt16(x)
-        self.prot.flushOutBuf()
-
-    def sendUpdateUserStats(self, hpMax, hp, manMax, man, staMax, sta, gld, elv, elu, exp):
-        self.buf.writeInt8(serverPackets['UpdateUserStats'])
-        for x in [hpMax, hp, manMax, man, staMax, sta]:
-            self.buf.writeInt16(x)
-        self.buf.writeInt32(gld)
-        self.buf.writeInt8(elv)
-        self.buf.writeInt32(elu)
-        self.buf.writeInt32(exp)
-        self.prot.flushOutBuf()
-
     def sendWorkRequestTarget(self):
         self.buf.writeInt8(serverPackets['WorkRequestTarget'])
         raise CriticalDecoderException('Not Implemented')
@@ -1234,19 +437,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendChangeInventorySlot(self, slot, objIdx, name, amount, equipped, grhIdx, objType, hitMax, hit, defMax, defMin, price):
-        self.buf.writeInt8(serverPackets['ChangeInventorySlot'])
-        self.buf.writeInt16(objIdx)
-        self.buf.writeString(name)
-        self.buf.writeInt16(amount)
-        self.buf.writeBoolean(equipped)
-        self.buf.writeInt16(grhIdx)
-        self.buf.writeInt16(objType)
-        for x in [hitMax, hit, defMax, defMin]:
-            self.buf.writeInt16(x)
-        self.buf.writeSingle(price)
-        self.prot.flushOutBuf()
-
     def sendChangeBankSlot(self):
         self.buf.writeInt8(serverPackets['ChangeBankSlot'])
         raise CriticalDecoderException('Not Implemented')
@@ -1254,13 +444,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendChangeSpellSlot(self, slot, spellIdx, name):
-        self.buf.writeInt8(serverPackets['ChangeSpellSlot'])
-        self.buf.writeInt8(slot)
-        self.buf.writeInt16(spellIdx)
-        self.buf.writeString(name)
-        self.prot.flushOutBuf()
-
     def sendAtributes(self):
         self.buf.writeInt8(serverPackets['Atributes'])
         raise CriticalDecoderException('Not Implemented')
@@ -1296,11 +479,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendErrorMsg(self, msg):
-        self.buf.writeInt8(serverPackets['ErrorMsg'])
-        self.buf.writeString(msg)
-        self.prot.flushOutBuf()
-
     def sendBlind(self):
         self.buf.writeInt8(serverPackets['Blind'])
         raise CriticalDecoderException('Not Implemented')
@@ -1329,12 +507,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendUpdateHungerAndThirst(self, aguMax, agu, hamMax, ham):
-        self.buf.writeInt8(serverPackets['UpdateHungerAndThirst'])
-        for x in [aguMax, agu, hamMax, ham]:
-            self.buf.writeInt8(x)
-        self.prot.flushOutBuf()
-
     def sendFame(self):
         self.buf.writeInt8(serverPackets['Fame'])
         raise CriticalDecoderException('Not Implemented')
@@ -1628,10 +800,6 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
-    def sendStopWorking(self):
-        self.buf.writeInt8(serverPackets['StopWorking'])
-        self.prot.flushOutBuf()
-
     def sendCancelOfferItem(self):
         self.buf.writeInt8(serverPackets['CancelOfferItem'])
         raise CriticalDecoderException('Not Implemented')
@@ -1639,3 +807,49 @@ class ServerCommandsEncoder(object):
 
         self.prot.flushOutBuf()
 
+class PacketSerializer(ServerCommandsEncoder):
+    """
+    Encoder que no envia nada: acumula los paquetes serializados para
+    obtenerlos con getData() y guardarlos o enviarlos despues con sendRaw.
+    """
+
+    __slots__ = ('outbuf', )
+
+    def __init__(self):
+        self.outbuf = ByteQueue()
+        ServerCommandsEncoder.__init__(self, self)
+
+    def flushOutBuf(self):
+        pass
+
+    def getData(self):
+        data = self.outbuf.readRaw()
+        self.outbuf.commit()
+        return data
+
+class BroadcastEncoder(ServerCommandsEncoder):
+    """
+    Encoder para enviar el mismo paquete a varios jugadores: cada send*
+    serializa el paquete una sola vez y copia los bytes al outbuf de cada
+    destinatario.
+
+    recipients es cualquier iterable de Player; exclude es un Player que no
+    recibe el paquete (normalmente el que lo origino).
+    """
+
+    __slots__ = ('outbuf', 'recipients', 'exclude', )
+
+    def __init__(self, recipients, exclude=None):
+        self.outbuf = ByteQueue()
+        self.recipients = recipients
+        self.exclude = exclude
+        ServerCommandsEncoder.__init__(self, self)
+
+    def flushOutBuf(self):
+        data = self.outbuf.readRaw()
+        self.outbuf.commit()
+
+        exclude = self.exclude
+        for p in self.recipients:
+            if p is not exclude:
+                p.cmdout.sendRaw(data)
@@ -259,6 +259,86 @@ clientPacketsStr = r"""    LoginExistingChar       'OLOGIN
     StopSharingNpc
     Consultation"""
 
+# Esquema de los paquetes del servidor: campo:TipoDeDato en el orden en que
+# viajan, sin contar el PacketID. Con esto se generan los send* de
+# ServerCommandsEncoder. Tipos: Int8, Int16, Int32, Single, Double, Boolean
+# y String (Int16 con el largo seguido de los bytes).
+#
+# Los paquetes que no estan aca se escriben a mano en ServerCommandsEncoder.
+
+serverPacketsSchemaStr = r"""    Logged                  userClass:Int8
+    RemoveDialogs
+    RemoveCharDialog        chridx:Int16
+    NavigateToggle
+    Disconnect
+    CommerceEnd
+    BankEnd
+    CommerceInit
+    UserCommerceEnd
+    CommerceChat            chat:String font:Int8
+    ShowBlacksmithForm
+    ShowCarpenterForm
+    UpdateSta               sta:Int16
+    UpdateMana              mana:Int16
+    UpdateHP                hp:Int16
+    UpdateGold              gld:Int32
+    UpdateBankGold          gld:Int32
+    UpdateExp               exp:Int32
+    ChangeMap               mapNum:Int16 vers:Int16
+    PosUpdate               x:Int8 y:Int8
+    ConsoleMsg              msg:String font:Int8
+    GuildChat               msg:String
+    ShowMessageBox          msg:String
+    UserIndexInServer       idx:Int16
+    UserCharIndexInServer   idx:Int16
+    CharacterCreate         chridx:Int16 body:Int16 head:Int16 heading:Int8 x:Int8 y:Int8 weapon:Int16 shield:Int16 helmet:Int16 fx:Int16 fxloops:Int16 name:String nickColor:Int8 priv:Int8
+    CharacterRemove         chridx:Int16
+    CharacterChangeNick     chridx:Int16 nick:String
+    CharacterMove           chridx:Int16 x:Int8 y:Int8
+    ForceCharMove           heading:Int8
+    CharacterChange         chridx:Int16 body:Int16 head:Int16 heading:Int8 weapon:Int16 shield:Int16 helmet:Int16 fx:Int16 fxloops:Int16
+    ObjectCreate            x:Int8 y:Int8 grhIdx:Int16
+    ObjectDelete            x:Int8 y:Int8
+    AreaChanged             x:Int8 y:Int8
+    BlockPosition           x:Int8 y:Int8 b:Boolean
+    CreateFX                fx:Int16 fxloops:Int16 chridx:Int16
+    UpdateUserStats         hpMax:Int16 hp:Int16 manMax:Int16 man:Int16 staMax:Int16 sta:Int16 gld:Int32 elv:Int8 elu:Int32 exp:Int32
+    ChangeInventorySlot     slot:Int8 objIdx:Int16 name:String amount:Int16 equipped:Boolean grhIdx:Int16 objType:Int16 hitMax:Int16 hit:Int16 defMax:Int16 defMin:Int16 price:Single
+    ChangeSpellSlot         slot:Int8 spellIdx:Int16 name:String
+    ErrorMsg                msg:String
+    UpdateHungerAndThirst   aguMax:Int8 agu:Int8 hamMax:Int8 ham:Int8
+    StopWorking"""
+
+# Esquema de los paquetes del cliente, con el mismo formato que el de los
+# paquetes del servidor. Los paquetes que no estan aca no estan implementados
+# y cierran la conexion.
+
+clientPacketsSchemaStr = r"""    LoginExistingChar       playerName:String playerPass:String versA:Int8 versB:Int8 versC:Int8
+    ThrowDices
+    LoginNewChar
+    Talk                    msg:String
+    Yell                    msg:String
+    Whisper                 target:Int16 msg:String
+    Walk                    heading:Int8
+    RequestPositionUpdate
+    Attack
+    PickUp
+    SafeToggle
+    Drop                    slot:Int8 amount:Int16
+    CastSpell               spellIdx:Int8
+    LeftClick               x:Int8 y:Int8
+    DoubleClick             x:Int8 y:Int8
+    Work                    skill:Int8
+    EquipItem               slot:Int8
+    ChangeHeading           heading:Int8
+    Online
+    Quit
+    Home"""
+
+# Tipo de dato -> formato de struct.
+SCHEMA_TYPES = {'Int8': 'B', 'Int16': 'h', 'Int32': 'l', 'Single': 'f', \
+    'Double': 'd', 'Boolean': 'B', 'String': None}
+
 def makePacketList(s):
     """Genera la lista de paquetes a partir del gran string anterior"""
 
@@ -267,6 +347,251 @@ def makePacketList(s):
     return dict([(x.strip().split(None, 1)[0], a) \
         for a, x in enumerate(s.split('\n'))])
 
+def makePacketSchema(s):
+    """
+    Genera el esquema de paquetes a partir de un string como 
+    serverPacketsSchemaStr: {PacketName: [(campo, tipo), ...]}
+    """
+
+    schema = {}
+
+    for line in s.split('\n'):
+        words = line.split()
+        fields = []
+
+        for w in words[1:]:
+            fieldName, fieldType = w.split(':')
+            if fieldType not in SCHEMA_TYPES:
+                raise ValueError("Tipo desconocido: " + w)
+            fields.append((fieldName, fieldType))
+
+        schema[words[0]] = fields
+
+    return schema
+
+def splitSchemaFields(fields):
+    """
+    Separa los campos de un paquete en tramos de tamaño fijo. Cada String
+    corta un tramo: su largo (Int16) queda al final del tramo anterior y sus
+    bytes van entre los dos tramos.
+
+    Devuelve una lista de (formato, [campos], campoString o None).
+    """
+
+    runs = []
+    fmt, names = '<', []
+
+    for fieldName, fieldType in fields:
+        if fieldType == 'String':
+            runs.append((fmt + 'h', names + ['len(%s)' % fieldName], \
+                fieldName))
+            fmt, names = '<', []
+        else:
+            fmt += SCHEMA_TYPES[fieldType]
+            if fieldType == 'Boolean':
+                names.append('(1 if %s else 0)' % fieldName)
+            else:
+                names.append(fieldName)
+
+    runs.append((fmt, names, None))
+
+    return runs
+
+def generatePacketsEncoder(packets, schema, f, className='ServerPacketsEncoder'):
+    """
+    Generador de codigo para los send* de los paquetes del servidor a partir
+    del esquema. Cada paquete se serializa con un solo struct precompilado
+    por tramo de tamaño fijo y una sola escritura al buffer.
+    """
+
+    p = sorted([x for x in packets.items() if x[0] in schema], \
+        key=lambda x: x[1])
+
+    f.write("""# Automatically generated code.
+
+from bytequeue import getStruct
+from constants import TEXT_ENCODING
+
+""")
+
+    # Los structs van como globales del modulo generado. El PacketID va
+    # al inicio del primer tramo.
+
+    runsByPacket = {}
+
+    for x in p:
+        runs = splitSchemaFields(schema[x[0]])
+        runs[0] = ('<B' + runs[0][0][1:], ['%d' % x[1]] + runs[0][1], \
+            runs[0][2])
+        runsByPacket[x[0]] = runs
+
+        for n, r in enumerate(runs):
+            if r[0] != '<':
+                f.write("ST_%s_%d = getStruct('%s')\n" % (x[0], n, r[0]))
+
+    f.write("""
+class %(ClassName)s(object):
+    __slots__ = ()
+""" % {'ClassName': className})
+
+    for x in p:
+        fields = schema[x[0]]
+        runs = runsByPacket[x[0]]
+
+        args = ''.join([', ' + a for a, b in fields])
+
+        f.write("""
+    def send%(PacketName)s(self%(Args)s):
+""" % {'PacketName': x[0], 'Args': args})
+
+        for fieldName, fieldType in fields:
+            if fieldType == 'String':
+                f.write("""        if type(%(Field)s) is unicode:
+            %(Field)s = %(Field)s.encode(TEXT_ENCODING)
+""" % {'Field': fieldName})
+
+        parts = []
+        for n, r in enumerate(runs):
+            if r[0] != '<':
+                parts.append("ST_%s_%d.pack(%s)" % (x[0], n, ', '.join(r[1])))
+            if r[2] is not None:
+                parts.append(r[2])
+
+        if len(parts) == 1:
+            data = parts[0]
+        else:
+            data = "''.join((%s))" % ', '.join(parts)
+
+        f.write("""        self.buf.writeRaw(%(Data)s)
+        self.prot.flushOutBuf()
+""" % {'Data': data})
+
+def compilePacketsEncoder(packets, schema, className='ServerPacketsEncoder'):
+    """
+    Genera y compila el codigo de generatePacketsEncoder. Devuelve la clase
+    con los send*, pensada para usarse como base de ServerCommandsEncoder.
+    """
+
+    import StringIO
+
+    f = StringIO.StringIO()
+    generatePacketsEncoder(packets, schema, f, className)
+
+    # __name__ hace que los imports del codigo generado sean relativos al
+    # paquete, igual que los de este modulo.
+    ns = {'__name__': __name__}
+    exec compile(f.getvalue(), '<%s>' % className, 'exec') in ns
+    return ns[className]
+
+def generatePacketsDecoder(packets, schema, f):
+    """
+    Generador de codigo para decodificar los paquetes del cliente que llevan
+    Strings. Cada decodeX(data, pos, end) devuelve None si el paquete todavia
+    no llego completo, o (nuevoPos, (campos, ...)) si esta completo. Se lee
+    un solo struct por tramo de tamaño fijo y se espia una sola vez el largo
+    de cada String, sin usar excepciones para los datos incompletos.
+
+    Los paquetes de tamaño fijo no necesitan codigo, ver
+    compilePacketsDecoder.
+    """
+
+    p = sorted([x for x in packets.items() if x[0] in schema and \
+        'String' in [b for a, b in schema[x[0]]]], key=lambda x: x[1])
+
+    f.write("""# Automatically generated code.
+
+from bytequeue import getStruct, ByteQueueError
+
+""")
+
+    runsByPacket = {}
+
+    # El PacketID se saltea con 'x', ya se sabe cual es.
+    for x in p:
+        runs = splitSchemaFields(schema[x[0]])
+        runs[0] = ('<x' + runs[0][0][1:], runs[0][1], runs[0][2])
+        runsByPacket[x[0]] = runs
+
+        for n, r in enumerate(runs):
+            if r[0] != '<':
+                f.write("ST_%s_%d = getStruct('%s')\n" % (x[0], n, r[0]))
+
+    for x in p:
+        runs = runsByPacket[x[0]]
+
+        f.write("""
+def decode%(PacketName)s(data, pos, end):
+    p = pos
+""" % {'PacketName': x[0]})
+
+        for n, r in enumerate(runs):
+            if r[0] == '<':
+                continue
+
+            fieldNames = [('f_' + a if not a.startswith('len(') else \
+                'l_' + a[4:-1]) for a in r[1]]
+
+            f.write("""    st = ST_%(PacketName)s_%(N)d
+    if p + st.size > end:
+        return None
+    %(Fields)s, = st.unpack_from(data, p)
+    p += st.size
+""" % {'PacketName': x[0], 'N': n, 'Fields': ', '.join(fieldNames)})
+
+            if r[2] is not None:
+                f.write("""    if l_%(Field)s < 0:
+        raise ByteQueueError('Largo de String negativo')
+    if p + l_%(Field)s > end:
+        return None
+    f_%(Field)s = str(data[p:p + l_%(Field)s])
+    p += l_%(Field)s
+""" % {'Field': r[2]})
+
+        f.write("""    return p, (%(Fields)s,)
+""" % {'Fields': ', '.join(['f_' + a for a, b in schema[x[0]]])})
+
+def compilePacketsDecoder(packets, schema):
+    """
+    Arma las tablas para decodificar los paquetes del cliente, indexadas por
+    PacketID:
+
+    - lengths: tamaño total de los paquetes de tamaño fijo, o None.
+    - structs: struct para decodificar los paquetes de tamaño fijo, o None.
+    - decoders: funcion generada por generatePacketsDecoder para los
+      paquetes con Strings, o None.
+
+    Los paquetes que no estan en el esquema quedan con None en las tres.
+    """
+
+    import StringIO
+    from bytequeue import getStruct
+
+    lastID = max(packets.values())
+    lengths = [None] * (lastID + 1)
+    structs = [None] * (lastID + 1)
+    decoders = [None] * (lastID + 1)
+
+    f = StringIO.StringIO()
+    generatePacketsDecoder(packets, schema, f)
+
+    ns = {'__name__': __name__}
+    exec compile(f.getvalue(), '<ClientPacketsDecoder>', 'exec') in ns
+
+    for packetName, packetID in packets.items():
+        if packetName not in schema:
+            continue
+
+        fields = schema[packetName]
+
+        if 'String' in [b for a, b in fields]:
+            decoders[packetID] = ns['decode' + packetName]
+        else:
+            st = getStruct('<x' + ''.join([SCHEMA_TYPES[b] for a, b in fields]))
+            structs[packetID] = st
+            lengths[packetID] = st.size
+
+    return lengths, structs, decoders
+
 def generatePacketsHandler(packets, f):
     """Generador de codigo para los handlers de los paquetes del cliente"""
     p = sorted(packets.items(), key=lambda x: x[1])
@@ -274,8 +599,7 @@ def generatePacketsHandler(packets, f):
     for x in p:
         f.write("""
     @CheckLogged
-    def handleCmd%(PacketName)s(self, prot, buf, player):
-        cmd = buf.readInt8()
+    def handleCmd%(PacketName)s(self, prot, player):
         raise CriticalDecoderException('Not Implemented')
         # FIXME
 """ % {'PacketName': x[0]})
@@ -302,6 +626,12 @@ def generatePackets():
     with open('paquetes-servidor.txt', 'wb') as f:
         generatePacketsSender(serverPackets, f)
 
+    with open('paquetes-cliente-decoder.txt', 'wb') as f:
+        generatePacketsDecoder(clientPackets, clientPacketsSchema, f)
+
+    with open('paquetes-servidor-encoder.txt', 'wb') as f:
+        generatePacketsEncoder(serverPackets, serverPacketsSchema, f)
+
 def generatePacketsJava(basePath = None):
     if basePath is None:
         basePath = sys.argv[1]
@@ -413,6 +743,10 @@ public class %(PacketName)s extends ServerPacket {
 serverPackets = makePacketList(serverPacketsStr)
 clientPackets = makePacketList(clientPacketsStr)
 
+# Dado un nombre de paquete devuelve la lista de (campo, tipo).
+serverPacketsSchema = makePacketSchema(serverPacketsSchemaStr)
+clientPacketsSchema = makePacketSchema(clientPacketsSchemaStr)
+
 # Dado un PacketID (0, 1, etc.) devuelve el nombre del paquete.
 serverPacketsFlip = dict([(b, a) for a, b in serverPackets.items()])
 clientPacketsFlip = dict([(b, a) for a, b in clientPackets.items()])
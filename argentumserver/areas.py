@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Areas de vision de un mapa.
+
+El mapa se divide en sectores de AREA_SIZE x AREA_SIZE tiles. Un jugador ve
+su sector y los 8 de alrededor, igual que el cliente, que al recibir
+AreaChanged borra los personajes y objetos que quedan fuera de ese rango.
+La relacion es simetrica: a ve a b si y solo si b ve a a.
+"""
+
+from constants import MAP_SIZE_X, MAP_SIZE_Y
+
+AREA_SIZE = 9
+
+AREAS_X = MAP_SIZE_X // AREA_SIZE + 1
+AREAS_Y = MAP_SIZE_Y // AREA_SIZE + 1
+
+def areaOf(x, y):
+    """Indice del sector que contiene al tile (x, y)."""
+    return (x // AREA_SIZE) + (y // AREA_SIZE) * AREAS_X
+
+def _buildAround():
+    around = []
+    for a in xrange(AREAS_X * AREAS_Y):
+        ax, ay = a % AREAS_X, a // AREAS_X
+        around.append(tuple([bx + by * AREAS_X \
+            for by in xrange(max(ay - 1, 0), min(ay + 2, AREAS_Y)) \
+            for bx in xrange(max(ax - 1, 0), min(ax + 2, AREAS_X))]))
+    return around
+
+# AREAS_AROUND[a]: sectores visibles desde el sector a.
+AREAS_AROUND = _buildAround()
+
+class AreaGrid(object):
+    """
+    Jugadores de un mapa agrupados por sector.
+
+    areas[a] es el set de jugadores que estan en el sector a.
+    """
+
+    __slots__ = ('areas', )
+
+    def __init__(self):
+        self.areas = [set() for x in xrange(AREAS_X * AREAS_Y)]
+
+    def add(self, p, x, y):
+        self.areas[areaOf(x, y)].add(p)
+
+    def remove(self, p, x, y):
+        self.areas[areaOf(x, y)].discard(p)
+
+    def move(self, p, oldpos, newpos):
+        """
+        Mueve p de oldpos a newpos. Si cambio de sector devuelve la tupla
+        (sectores que dejo de ver, sectores que empezo a ver); si no, None.
+        """
+
+        a1 = areaOf(oldpos[0], oldpos[1])
+        a2 = areaOf(newpos[0], newpos[1])
+
+        if a1 == a2:
+            return None
+
+        self.areas[a1].discard(p)
+        self.areas[a2].add(p)
+
+        old, new = AREAS_AROUND[a1], AREAS_AROUND[a2]
+        return ([a for a in old if a not in new], \
+            [a for a in new if a not in old])
+
+    def playersIn(self, areaList):
+        """Lista de jugadores en los sectores de areaList."""
+
+        areas = self.areas
+        ret = []
+        for a in areaList:
+            ret.extend(areas[a])
+        return ret
+
+    def playersAround(self, x, y):
+        """Lista de jugadores que ven el tile (x, y)."""
+        return self.playersIn(AREAS_AROUND[areaOf(x, y)])
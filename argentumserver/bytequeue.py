@@ -28,16 +28,52 @@ class ByteQueueError(Exception):
 class ByteQueueInsufficientData(Exception):
     pass
 
+_structCache = {}
+
+def getStruct(fmt):
+    """
+    Devuelve un struct.Struct precompilado para fmt. Los Struct se guardan
+    en un cache, asi el formato se parsea una sola vez.
+    """
+
+    st = _structCache.get(fmt)
+    if st is None:
+        st = _structCache[fmt] = struct.Struct(fmt)
+    return st
+
+INT8 = getStruct('<B')
+INT16 = getStruct('<h')
+INT32 = getStruct('<l')
+FLOAT = getStruct('<f')
+DOUBLE = getStruct('<d')
+
+# Cantidad minima de bytes consumidos antes de compactar el buffer. Evita
+# mover memoria por cada paquete chico.
+COMPACT_MIN_BYTES = 4096
+
 class ByteQueue(object):
     """
     Clase para leer datos binarios y convertirlos a tipos de datos nativos.
 
     Basada e inspirada en la idea de Maraxus, implementada en morgoao.
+
+    Los datos se guardan en un bytearray mutable: agregar datos al final es
+    O(1) amortizado (no se copia el buffer completo como con str) y las
+    lecturas se hacen con struct.unpack_from directamente sobre el buffer,
+    sin crear slices intermedios. Los str que devuelve readRaw se cortan de
+    un buffer() sobre el bytearray, con una sola copia. El espacio ya
+    consumido se recupera en commit() solamente cuando pasa de
+    COMPACT_MIN_BYTES y es al menos la mitad del buffer: un buffer vaciado
+    no se libera enseguida, asi el proximo addData no tiene que volver a
+    pedir memoria, y el costo de compactar es O(1) amortizado por byte.
     """
 
-    __slots__ = ('data', 'pos', 'markpos', )
+    __slots__ = ('data', 'pos', 'markpos', '_view', )
     def __init__(self, data=""):
-        self.data = data
+        self.data = bytearray(data)
+        # Vista de solo lectura sobre data. Sigue los cambios de tamaño del
+        # bytearray y al cortarla devuelve un str con una sola copia.
+        self._view = buffer(self.data)
         self.pos = 0
         self.markpos = 0
 
@@ -57,12 +93,17 @@ class ByteQueue(object):
         cuando hay que hacerlo.
         """
 
-        assert self.pos >= 0 and self.markpos >= 0
+        pos = self.pos
+        if not pos:
+            return
 
-        if self.pos != 0:
-            self.data = self.data[self.pos:]
-            self.pos = 0
-            self.markpos = 0
+        if pos >= COMPACT_MIN_BYTES and pos * 2 >= len(self.data):
+            # Se mueven como mucho tantos bytes como los ya consumidos.
+            del self.data[:pos]
+            pos = self.pos = 0
+
+        # Lo que quede antes de pos ya no es alcanzable con rollback.
+        self.markpos = pos
 
     def mark(self):
         """
@@ -78,63 +119,111 @@ class ByteQueue(object):
 
         self.pos = self.markpos
 
-    def peekFmt(self, fmt):
-        """Lee desde pos sin avanzar el puntero pos"""
-
-        tam = struct.calcsize(fmt)
+    def peekStruct(self, st):
+        """
+        Lee desde pos sin avanzar el puntero pos. st es un struct.Struct,
+        ver getStruct().
+        """
 
-        if tam > len(self):
+        if st.size > len(self.data) - self.pos:
             raise ByteQueueInsufficientData()
 
         try:
-            # La funcion buffer() es como un slice[a:b] pero 
-            # no hace una copia de los datos.
-            return struct.unpack(fmt, buffer(self.data, self.pos, tam))
+            # unpack_from lee directamente del bytearray, sin copiar.
+            return st.unpack_from(self.data, self.pos)
         except struct.error, e:
             raise ByteQueueError(str(e))
 
+    def readStruct(self, st):
+        """
+        Lee desde pos avanzando el puntero pos. Permite leer de una sola vez
+        una secuencia de campos de tamaño fijo.
+        """
+
+        ret = self.peekStruct(st)
+        self.pos += st.size
+        return ret
+
+    def peekFmt(self, fmt):
+        """Lee desde pos sin avanzar el puntero pos"""
+
+        return self.peekStruct(getStruct(fmt))
+
     def read(self, fmt):
         """Lee desde pos avanzando el puntero pos"""
 
-        ret = self.peekFmt(fmt)
-        self.pos += struct.calcsize(fmt)
-        return ret
+        return self.readStruct(getStruct(fmt))
 
     def readRaw(self, cant=None):
         """Lee cant bytes avanzando pos"""
 
-        assert self.pos <= len(self.data)
+        pos = self.pos
 
         if cant is None:
-            cant = len(self)
-        elif len(self) < cant:
-            raise ByteQueueInsufficientData()
+            end = len(self.data)
+        else:
+            end = pos + cant
+            if end > len(self.data):
+                raise ByteQueueInsufficientData()
+
+        self.pos = end
+
+        return self._view[pos:end]
+
+    def byteAt(self, n):
+        """Devuelve el byte n contando desde pos, sin leerlo."""
+
+        return self.data[self.pos + n]
+
+    def truncate(self, cant):
+        """Descarta todo lo que haya despues de los primeros cant bytes."""
 
-        ret = self.data[self.pos:self.pos+cant]
-        self.pos += cant
+        del self.data[self.pos + cant:]
 
+    def takeFrom(self, n):
+        """
+        Devuelve los bytes que siguen a los primeros n (contando desde pos)
+        y los descarta.
+        """
+
+        start = self.pos + n
+        ret = self._view[start:]
+        del self.data[start:]
         return ret
 
+    def writeStruct(self, st, *args):
+        """
+        Escribe args usando el struct.Struct st. Permite escribir de una sola
+        vez una secuencia de campos de tamaño fijo.
+        """
+
+        self.data += st.pack(*args)
+
+    def writeRaw(self, data):
+        """Escribe los bytes de data tal cual"""
+
+        self.data += data
+
     def writeFmt(self, fmt, *args):
-        self.data += struct.pack(fmt, *args)
+        self.data += getStruct(fmt).pack(*args)
 
     def readInt8(self):
-        return self.read('<B')[0]
+        return self.readStruct(INT8)[0]
 
     def readInt16(self):
-        return self.read('<h')[0]
+        return self.readStruct(INT16)[0]
 
     def readInt32(self):
-        return self.read('<l')[0]
+        return self.readStruct(INT32)[0]
 
     def readFloat(self):
-        return self.read('<f')[0]
+        return self.readStruct(FLOAT)[0]
 
     def readSingle(self):
         return self.readFloat()
 
     def readDouble(self):
-        return self.read('<d')[0]
+        return self.readStruct(DOUBLE)[0]
 
     def readBoolean(self):
         return bool(self.readInt8())
@@ -147,22 +236,22 @@ class ByteQueue(object):
         return self.readRaw(cant)
 
     def peekInt8(self):
-        return self.peekFmt('<B')[0]
+        return self.peekStruct(INT8)[0]
 
     def peekInt16(self):
-        return self.peekFmt('<h')[0]
+        return self.peekStruct(INT16)[0]
 
     def peekInt32(self):
-        return self.peekFmt('<l')[0]
+        return self.peekStruct(INT32)[0]
 
     def peekFloat(self):
-        return self.peekFmt('<f')[0]
+        return self.peekStruct(FLOAT)[0]
 
     def peekSingle(self):
         return self.peekFloat()
 
     def peekDouble(self):
-        return self.peekFmt('<d')[0]
+        return self.peekStruct(DOUBLE)[0]
 
     def peekBoolean(self):
         return bool(self.peekInt8())
@@ -171,25 +260,25 @@ class ByteQueue(object):
         cant = self.peekInt16()
         if len(self) < (cant + 2):
             raise ByteQueueInsufficientData()
-        return self.data[self.pos+2:self.pos+2+cant]
+        return self._view[self.pos+2:self.pos+2+cant]
 
     def writeInt8(self, n):
-        self.writeFmt('<B', n)
+        self.data += INT8.pack(n)
 
     def writeInt16(self, n):
-        self.writeFmt('<h', n)
+        self.data += INT16.pack(n)
     
     def writeInt32(self, n):
-        self.writeFmt('<l', n)
+        self.data += INT32.pack(n)
 
     def writeFloat(self, n):
-        self.writeFmt('<f', n)
+        self.data += FLOAT.pack(n)
 
     def writeSingle(self, n):
         self.writeFloat(n)
 
     def writeDouble(self, n):
-        self.writeFmt('<d', n)
+        self.data += DOUBLE.pack(n)
 
     def writeBoolean(self, n):
         self.writeInt8(1 if bool(n) else 0)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Grilla de colisiones de un mapa: en un solo bytearray, indexado por
+(x - 1) + (y - 1) * MAP_SIZE_X, los tiles bloqueados del MapFile y los
+ocupados por personajes. Un tile se puede pisar si su byte es 0.
+"""
+
+import sys
+
+from constants import MAP_SIZE_X, MAP_SIZE_Y
+
+BLOCKED = 1
+OCCUPIED = 2
+
+class CollisionGrid(object):
+    __slots__ = ('grid', )
+
+    def __init__(self, blocked):
+        self.grid = bytearray([BLOCKED if b else 0 for b in blocked])
+
+    def memoryUsage(self):
+        return sys.getsizeof(self.grid)
+
+    def setOccupied(self, idx, occupied):
+        if occupied:
+            self.grid[idx] |= OCCUPIED
+        else:
+            self.grid[idx] &= ~OCCUPIED & 0xff
+
+    def isFree(self, pos):
+        """True si se puede pisar pos."""
+
+        x, y = pos
+        if 1 <= x <= MAP_SIZE_X and 1 <= y <= MAP_SIZE_Y:
+            return not self.grid[(x - 1) + (y - 1) * MAP_SIZE_X]
+        return False
+
+    def canMove(self, positions):
+        """isFree para cada posicion de positions, en una sola llamada."""
+
+        grid = self.grid
+        return [1 <= x <= MAP_SIZE_X and 1 <= y <= MAP_SIZE_Y and \
+            not grid[(x - 1) + (y - 1) * MAP_SIZE_X] for x, y in positions]
@@ -38,6 +38,10 @@ MAXINVITEMS = 10000 # Por slot
 MAP_SIZE_X = 100
 MAP_SIZE_Y = 100
 
+# Mapa y posicion donde aparecen los jugadores al entrar y con /HOGAR.
+HOME_MAP = 1
+HOME_POS = (50, 50)
+
 NICKCOLOR_CRIMINAL  = 1
 NICKCOLOR_CIUDADANO = 2
 NICKCOLOR_ATACABLE  = 4
@@ -19,7 +19,8 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import os, sys, datetime, time, gc, re, collections, random
+import os, sys, datetime, time, gc, re, collections, random, itertools
+import multiprocessing
 from ConfigParser import SafeConfigParser
 
 from aoprotocol import clientPackets, serverPackets, clientPacketsFlip
@@ -29,6 +30,16 @@ from util import debug_print
 from constants import *
 
 import mapfile, datfile, aoprotocol, corevars, gamerules, util
+from mapobjects import MapObjectsIndex, SectorPackets, findDropPos, \
+    DROP_NO, DROP_EMPTY, DROP_STACK, SPIRAL_OFFSETS
+from areas import AreaGrid, AREAS_AROUND, areaOf
+import worldgraph
+from pathfinding import MapNavigation
+from collision import CollisionGrid
+from outqueue import CoalescingQueue
+from ratelimit import parseRateLimits
+from inputsched import FairInputScheduler
+import network
 
 try:
     import twisted
@@ -36,29 +47,47 @@ except ImportError:
     print "Es necesario instalar python-twisted"
     sys.exit(1)
 
-if sys.platform == 'linux2': # yeah!
-    # En Linux usamos el reactor epoll() que es lo más.
-    from twisted.internet import epollreactor
-    epollreactor.install()
-elif sys.platform == 'win32': # rulz!
-    # En Windows usamos el reactor IOCP que es lo más.
-    from twisted.internet import iocpreactor
-    iocpreactor.install()
-
-from twisted.internet.protocol import Protocol, Factory
-from twisted.internet import reactor, task
+from twisted.internet import defer
 
 # Singletons
 
 cmdDecoder = None       # Handler para recibir paquetes de los clientes
 ServerConfig = None
+netBackend = None       # Loop de eventos, timers y sockets (ver network.py)
+packetSerializer = PacketSerializer()
+
+# Tamaño de un ObjectCreate serializado, ver GameMap._objSnapshots.
+packetSerializer.sendObjectCreate(1, 1, 1)
+OBJECT_CREATE_SIZE = len(packetSerializer.getData())
+
+# Paquetes que se pueden perder sin romper el cliente. Se descartan cuando
+# la cola de salida de una conexion supera OutputHighWatermark.
+OUTPUT_DROPPABLE_PACKETS = frozenset([serverPackets['CharacterMove'], \
+    serverPackets['CreateFX']])
+
+# Maximo de bytes por write cuando hay mucho para enviar, para que Twisted
+# pueda pausar la conexion (pauseProducing) sin que todo termine en su
+# buffer.
+OUTPUT_WRITE_CHUNK = 16384
 
 # ---
 
-class AoProtocol(Protocol):
-    """Interfaz con Twisted para el socket del cliente."""
+class AoProtocol(object):
+    """
+    Interfaz con el socket del cliente. Es un protocolo de Twisted; con el
+    backend asyncio lo maneja network.AsyncioConnection.
+
+    Es tambien el productor de los datos que se escriben en el transport
+    (IPushProducer): cuando el cliente no lee y el buffer del transport se
+    llena, se llama a pauseProducing y los paquetes quedan en outbuf, que es
+    la cola de salida de la conexion. Con OutputCoalescing los paquetes que
+    llegan mientras la conexion esta pausada van a una CoalescingQueue,
+    despues de lo que ya habia en outbuf. Ver flushOutBuf.
+    """
 
     def __init__(self):
+        self.transport = None
+
         # Buffers de datos
         self._ao_inbuff = ByteQueue()
         self.outbuf = ByteQueue()
@@ -70,9 +99,36 @@ class AoProtocol(Protocol):
         self._ao_connLost = False
         self.lastHandledPacket = int(time.time())
 
+        # Hay datos en outbuf esperando el proximo flush.
+        self._ao_outPending = False
+
+        # Control de flujo de salida. _ao_outMark es el largo de outbuf
+        # antes del ultimo paquete escrito.
+        self._ao_outPaused = False
+        self._ao_shedding = False
+        self._ao_outOverflow = False
+        self._ao_outMark = 0
+
+        # Cola con reemplazos, se crea con la primer pausa.
+        self._ao_outQueue = None
+
+        # Paquetes descartados y maximo de bytes en cola, para las
+        # estadisticas (ver GameServer.slowConnections).
+        self.outShedPackets = 0
+        self.outMaxQueued = 0
+
         # la instancia de Player se crea cuando el login es exitoso.
         self.player = None
 
+        # Limites de paquetes por segundo (ver ratelimit.py). Los buckets se
+        # crean con el primer paquete limitado.
+        self.rateBuckets = None
+        self._ao_inputDelayed = False
+
+        # Se dejo de leer del socket porque _ao_inbuff supero
+        # InputMaxBuffered (ver dataReceived).
+        self._ao_inPaused = False
+
         # Wrapper para serializar comandos en outbuf.
         self.cmdout = ServerCommandsEncoder(self)
 
@@ -83,13 +139,59 @@ class AoProtocol(Protocol):
         return id(self) == id(other)
 
     def dataReceived(self, data):
+        """
+        Con InputMode Immediate los comandos se ejecutan apenas llegan; con
+        Fair la conexion se anota en gameServer.inputScheduler y se
+        ejecutan en el proximo tick. Si quedan mas de InputMaxBuffered bytes
+        esperando al tick (o demorados por un limite de paquetes por
+        segundo) se deja de leer del socket hasta que se procesen.
+        """
+
         if not self._ao_closing:
             self._ao_inbuff.addData(data)
-            self._handleData()
+            gameServer.inputReceived(self)
+
+            maxBuffered = gameServer.inputMaxBuffered
+            if maxBuffered and not self._ao_inPaused and \
+                not self._ao_closing and \
+                len(self._ao_inbuff) > maxBuffered and \
+                (gameServer.inputScheduler is not None or \
+                self._ao_inputDelayed):
+                self._ao_inPaused = True
+                self.transport.pauseProducing()
+
+    def handleInput(self, budget=None):
+        """
+        Ejecuta a lo sumo budget comandos del buffer de entrada. Devuelve
+        True si quedaron pendientes (ver FairInputScheduler).
+        """
+
+        if self._ao_closing:
+            return False
+
+        more = self._handleData(budget)
+
+        # Si lo que queda es un comando incompleto hay que seguir leyendo.
+        if self._ao_inPaused and not self._ao_closing and \
+            ((not more and not self._ao_inputDelayed) or \
+            len(self._ao_inbuff) <= gameServer.inputMaxBuffered // 2):
+            self._ao_inPaused = False
+            self.transport.resumeProducing()
+
+        # Las respuestas a los comandos de este cliente salen juntas.
+        self.flushOutBufNow()
+
+        return more
+
+    def makeConnection(self, transport):
+        self.transport = transport
+        self.connectionMade()
 
     def connectionMade(self):
         debug_print("connectionMade")
 
+        self.transport.registerProducer(self, True)
+
         if not gameServer.connectionsLimitReached():
             gameServer.connectionMade(self)
         else:
@@ -110,36 +212,190 @@ class AoProtocol(Protocol):
             self._peer = self.transport.getPeer()
         return self._peer
 
-    def _handleData(self):
+    def _handleData(self, budget=None):
         try:
-            cmdDecoder.handleData(self)
+            return cmdDecoder.handleData(self, budget)
         except CriticalDecoderException, e:
             debug_print("CriticalDecoderException")
             self.loseConnection()
+            return False
 
     def sendData(self, data):
         if not self._ao_connLost:
             self.transport.write(data)
+            gameServer.outputWritten(len(data))
+
+    # IPushProducer
+
+    def pauseProducing(self):
+        """El buffer del transport esta lleno: no escribir mas."""
+        self._ao_outPaused = True
+
+    def resumeProducing(self):
+        """El cliente leyo lo que tenia pendiente."""
+        self._ao_outPaused = False
+        self.flushOutBufNow()
+
+    def stopProducing(self):
+        pass
 
     def flushOutBuf(self):
-        self.sendData(self.outbuf.readRaw())
+        """
+        Los encoders la llaman despues de cada paquete. Si el envio diferido
+        esta activo (OutputFlushMaxDelay > 0) solo se envia cuando outbuf
+        supera OutputFlushMaxBytes; si no, la conexion queda anotada para el
+        proximo flush.
+
+        Con la conexion pausada los paquetes quedan en outbuf, o en
+        _ao_outQueue con OutputCoalescing. Si la cola supera
+        OutputHighWatermark se descartan los paquetes de
+        OUTPUT_DROPPABLE_PACKETS hasta que baje de OutputLowWatermark, y si
+        supera OutputMaxQueued se desconecta al cliente.
+        """
+
+        outbuf = self.outbuf
+        queued = len(outbuf)
+
+        if self._ao_outOverflow:
+            outbuf.truncate(0)
+            return
+
+        if self._ao_shedding and queued > self._ao_outMark and \
+            outbuf.byteAt(self._ao_outMark) in OUTPUT_DROPPABLE_PACKETS:
+            outbuf.truncate(self._ao_outMark)
+            self.outShedPackets += 1
+            return
+
+        if self._ao_outPaused:
+            if gameServer.outputCoalescing and queued > self._ao_outMark:
+                q = self._ao_outQueue
+                if q is None:
+                    q = self._ao_outQueue = CoalescingQueue()
+                q.add(outbuf.takeFrom(self._ao_outMark))
+                queued = self._ao_outMark + len(q)
+            else:
+                self._ao_outMark = queued
+            self._checkOutQueue(queued)
+            return
+
+        self._ao_outMark = queued
+
+        if not gameServer.outputCorking:
+            self.flushOutBufNow()
+        elif queued >= gameServer.outputFlushMaxBytes:
+            gameServer.outputFullFlushes += 1
+            self.flushOutBufNow()
+        elif not self._ao_outPending:
+            self._ao_outPending = True
+            gameServer.outputPending(self)
+
+    def _checkOutQueue(self, queued):
+        """Aplica los limites de la cola de salida (ver flushOutBuf)."""
+
+        if queued > self.outMaxQueued:
+            self.outMaxQueued = queued
+
+        gs = gameServer
+
+        if gs.outputMaxQueued and queued > gs.outputMaxQueued:
+            debug_print("Cliente lento, desconectando:", self.getPeer().host, \
+                queued)
+            gs.outputOverflow(self)
+
+            # Se puede estar recorriendo los jugadores del mapa (broadcast),
+            # asi que la desconexion se hace despues.
+            self._ao_outOverflow = True
+            self._discardOutQueue()
+            netBackend.callLater(0, self.loseConnection, True)
+        elif not self._ao_shedding and gs.outputHighWatermark and \
+            queued > gs.outputHighWatermark:
+            self._ao_shedding = True
+
+    def flushOutBufNow(self):
+        """
+        Envia lo que haya en outbuf y en la cola con reemplazos, con un
+        solo write si no es mucho. Si Twisted pausa la conexion en el medio,
+        lo que falta queda en outbuf hasta resumeProducing.
+        """
+
+        self._ao_outPending = False
+
+        outbuf = self.outbuf
+
+        if self._ao_outPaused:
+            return
+
+        q = self._ao_outQueue
+        if q is not None and len(q):
+            outbuf.writeRaw(q.drain())
+
+        queued = len(outbuf)
+
+        if queued > 0:
+            if queued <= OUTPUT_WRITE_CHUNK:
+                self.sendData(outbuf.readRaw())
+            else:
+                while len(outbuf) > 0 and not self._ao_outPaused:
+                    self.sendData(outbuf.readRaw(min(len(outbuf), \
+                        OUTPUT_WRITE_CHUNK)))
+            outbuf.commit()
+
+            queued = len(outbuf)
+            self._ao_outMark = queued
+
+            if self._ao_shedding and queued <= gameServer.outputLowWatermark:
+                self._ao_shedding = False
+
+    def outQueued(self):
+        """Bytes en la cola de salida, todavia sin pasar al transport."""
+
+        if self._ao_outQueue is not None:
+            return len(self.outbuf) + len(self._ao_outQueue)
+        return len(self.outbuf)
+
+    def outCoalescedPackets(self):
+        """Paquetes reemplazados en la cola de salida (ver outqueue.py)."""
+
+        if self._ao_outQueue is not None:
+            return self._ao_outQueue.superseded
+        return 0
+
+    def _discardOutQueue(self):
+        self.outbuf.truncate(0)
+        self._ao_outMark = 0
+        if self._ao_outQueue is not None:
+            self._ao_outQueue.clear()
+
+    def loseConnection(self, abort=False):
+        """
+        Cierra la conexion. Con abort=True se descarta lo que haya en cola
+        y se cierra el socket sin esperar a que el cliente lea lo que ya se
+        le envio (ver _checkOutQueue).
+        """
 
-    def loseConnection(self):
         if not self._ao_closing:
+            if abort:
+                self._discardOutQueue()
+            else:
+                # Lo que quedo pendiente (ej: un ErrorMsg) sale antes de
+                # cerrar, aunque la conexion este pausada.
+                self._ao_outPaused = False
+                self.flushOutBufNow()
+
             self._ao_closing = True
             self.cmdout = None
             gameServer.connectionLost(self)
 
             if not self._ao_connLost:
-                self.transport.loseConnection()
+                if abort and hasattr(self.transport, 'abortConnection'):
+                    self.transport.abortConnection()
+                else:
+                    self.transport.loseConnection()
 
             if self.player is not None:
                 self.player.quit()
                 self.player = None
 
-class AoProtocolFactory(Factory):
-    protocol = AoProtocol
-
 class GameServer(object):
     """
     Clase que se encarga del 'bookkeeping' de las conexiones y jugadores.
@@ -156,6 +412,52 @@ class GameServer(object):
         self._playersLoginCounter = 0
         self._playersMaxLoginsCount = 0
 
+        # Envio diferido de datos: conexiones con outbuf pendiente.
+        self.outputFlushMaxDelay = ServerConfig.getint('Core', \
+            'OutputFlushMaxDelay')
+        self.outputFlushMaxBytes = ServerConfig.getint('Core', \
+            'OutputFlushMaxBytes')
+        self.outputCorking = self.outputFlushMaxDelay > 0
+        self._outputPending = []
+
+        # Control de flujo de salida (ver AoProtocol.flushOutBuf).
+        self.outputHighWatermark = ServerConfig.getint('Core', \
+            'OutputHighWatermark')
+        self.outputLowWatermark = ServerConfig.getint('Core', \
+            'OutputLowWatermark')
+        self.outputMaxQueued = ServerConfig.getint('Core', 'OutputMaxQueued')
+        self.outputCoalescing = ServerConfig.getboolean('Core', \
+            'OutputCoalescing')
+
+        # Conexiones con paquetes demorados por los limites de paquetes
+        # por segundo, se procesan en el proximo tick.
+        self._inputDelayed = []
+
+        # Ejecucion de los comandos de los clientes (ver
+        # AoProtocol.dataReceived).
+        self.inputMaxBuffered = ServerConfig.getint('Core', \
+            'InputMaxBuffered')
+        inputMode = ServerConfig.get('Core', 'InputMode').lower()
+        if inputMode == 'fair':
+            self.inputScheduler = FairInputScheduler(ServerConfig.getint( \
+                'Core', 'InputCommandsPerTick'))
+            self.inputTickInterval = ServerConfig.getint('Core', \
+                'InputTickInterval')
+        elif inputMode == 'immediate':
+            self.inputScheduler = None
+        else:
+            raise Exception("InputMode invalido: " + inputMode)
+        self._outputOverflows = 0
+
+        # Contadores de escritura a los sockets, acumulados desde que arranco
+        # el servidor: writes, bytes, conexiones enviadas por el timer de
+        # flush y conexiones enviadas antes por superar OutputFlushMaxBytes.
+        self.outputWrites = 0
+        self.outputBytes = 0
+        self.outputTimerFlushes = 0
+        self.outputFullFlushes = 0
+        self._outputStatsLast = (time.time(), 0, 0)
+
     def playersLimitReached(self):
         playersLimit = ServerConfig.getint('Core', 'PlayersCountLimit')
         if len(self._players) >= playersLimit:
@@ -249,24 +551,216 @@ class GameServer(object):
     def playersList(self):
         return list(self._players)
 
+    def broadcast(self, exclude=None):
+        """Encoder para enviar un paquete a todos los jugadores."""
+        return BroadcastEncoder(self._players, exclude)
+
+    def outputPending(self, c):
+        self._outputPending.append(c)
+
+    def flushPendingOutput(self):
+        """Un solo write por cada conexion con datos pendientes."""
+
+        pending = self._outputPending
+        self._outputPending = []
+
+        self.outputTimerFlushes += len(pending)
+
+        for c in pending:
+            c.flushOutBufNow()
+
+    def outputWritten(self, n):
+        self.outputWrites += 1
+        self.outputBytes += n
+
+    def outputStats(self):
+        """
+        Devuelve (writes por segundo, bytes por write) desde la ultima
+        llamada, para ajustar OutputFlushMaxDelay y OutputFlushMaxBytes.
+        Los contadores outputWrites y outputBytes no se modifican.
+        """
+
+        t = time.time()
+        lastTime, lastWrites, lastBytes = self._outputStatsLast
+        elapsed = max(t - lastTime, 0.001)
+        writes = self.outputWrites - lastWrites
+        nbytes = self.outputBytes - lastBytes
+
+        self._outputStatsLast = (t, self.outputWrites, self.outputBytes)
+
+        return (writes / elapsed, float(nbytes) / writes if writes else 0.0)
+
+    def inputReceived(self, c):
+        if self.inputScheduler is not None:
+            self.inputScheduler.add(c)
+        else:
+            c.handleInput()
+
+    def runInputTick(self):
+        """Un tick del planificador de comandos, con InputMode Fair."""
+        self.inputScheduler.runTick()
+
+    def inputDelayed(self, c):
+        if not c._ao_inputDelayed:
+            c._ao_inputDelayed = True
+            self._inputDelayed.append(c)
+
+    def resumeDelayedInput(self):
+        """Vuelve a procesar el buffer de entrada de las conexiones demoradas."""
+
+        delayed = self._inputDelayed
+        self._inputDelayed = []
+
+        for c in delayed:
+            c._ao_inputDelayed = False
+            if not c._ao_closing:
+                self.inputReceived(c)
+
+    def rateLimitStats(self):
+        """
+        Devuelve las conexiones que superaron algun limite de paquetes por
+        segundo como una lista de (conexion, {PacketID: veces}).
+        """
+
+        return [(c, c.rateBuckets.hits) for c in self._connections \
+            if c.rateBuckets is not None and c.rateBuckets.hits]
+
+    def outputOverflow(self, c):
+        self._outputOverflows += 1
+
+    def slowConnections(self, n=5):
+        """
+        Devuelve las n conexiones con mas bytes en cola de salida como una
+        lista de (bytes en cola, maximo en cola, paquetes descartados,
+        paquetes reemplazados, conexion), y la cantidad de desconexiones
+        por OutputMaxQueued.
+        """
+
+        conns = [(c.outQueued(), c.outMaxQueued, c.outShedPackets, \
+            c.outCoalescedPackets(), c) \
+            for c in self._connections if c.outMaxQueued]
+        conns.sort(reverse=True)
+        return conns[:n], self._outputOverflows
+
     def connectionsList(self):
         return list(self._connections)
 
 class GameMap(object):
     """Un mapa"""
 
-    def __init__(self, mapNum):
+    def __init__(self, mapNum, mapFile=None):
+        """
+        mapFile es el MapFile ya cargado (ver GameMapList.load); si es None
+        se carga aca.
+        """
+
         self.players = set()
         self.mapNum = mapNum
-        self.mapFile = mapfile.loadMapFile(mapNum, \
-            ServerConfig.get('Core', 'MapsFilesPath'))
+        self.lastUsed = time.time()
+        if mapFile is None:
+            mapFile = GameMap.loadMapFile(mapNum)
+        self.mapFile = mapFile
         self._playersMatrix = [None] * (MAP_SIZE_X * MAP_SIZE_Y)
 
+        # Mapas a los que se llega por alguna salida, para precargarlos.
+        self.neighbours = tuple(sorted(set([e[0] \
+            for e in mapFile.exits.itervalues() if e[0] != mapNum])))
+
+        # Tiles bloqueados y ocupados juntos, para validPos. Se mantiene en
+        # setPos, por donde tiene que pasar todo movimiento de personajes.
+        self.collision = CollisionGrid(self.mapFile.blocked)
+
+        # Busqueda de caminos, se crea con el primer uso (ver nav).
+        self._nav = None
+
+        # Jugadores por sector. Los paquetes de un tile se envian solamente
+        # a los jugadores que lo ven (ver areas.py).
+        self.areas = AreaGrid()
+
+        # Objetos en el piso. Se mantienen en onTileObjUpdated.
+        self.objects = MapObjectsIndex()
+
+        # ObjectCreate ya serializados de los objetos en el piso de cada
+        # sector. Al entrar un jugador a un sector se le envia todo junto
+        # sin recorrer los tiles. onTileObjUpdated cambia solamente el
+        # paquete del tile en el sector que corresponde.
+        self._objSnapshots = [SectorPackets(OBJECT_CREATE_SIZE) \
+            for x in xrange(len(AREAS_AROUND))]
+
+        mf = self.mapFile
+
+        # Estado de cada tile para dejar objetos (DROP_*), para que
+        # dropObjAt no tenga que revisar cada tile. Se mantiene en setPos y
+        # onTileObjUpdated.
+        self._dropState = bytearray([DROP_NO if b else DROP_EMPTY \
+            for b in mf.blocked])
+
+        # Unica recorrida de los tiles, al cargar el mapa.
+        for idx, objidx in enumerate(mf.objidx):
+            if objidx:
+                x, y = idx % MAP_SIZE_X + 1, idx // MAP_SIZE_X + 1
+                self.objects.set(x, y, objidx, mf.objcant[idx])
+                self._updateDropState(idx)
+                self._updateObjSnapshot(x, y, objidx)
+
+    @staticmethod
+    def loadMapFile(mapNum):
+        """
+        Carga el MapFile. No toca nada del estado del juego, asi que se
+        puede llamar desde otro thread.
+        """
+
+        return mapfile.loadMap(mapNum, \
+            ServerConfig.get('Core', 'MapsFilesPath'), \
+            ServerConfig.get('Core', 'MapsCompiledPath'), \
+            ServerConfig.getboolean('Core', 'SharedStaticData'), \
+            ServerConfig.getboolean('Core', 'LazyTileDecoding'))
+
     def isMapUnused(self):
         return len(self.players) == 0
 
+    def broadcast(self, exclude=None):
+        """Encoder para enviar un paquete a todos los jugadores del mapa."""
+        return BroadcastEncoder(self.players, exclude)
+
+    def broadcastAround(self, x, y, exclude=None):
+        """Encoder para enviar un paquete a los jugadores que ven (x, y)."""
+        return BroadcastEncoder(self.areas.playersAround(x, y), exclude)
+
     def unload(self):
-        pass
+        """
+        Libera los datos del mapa. Solamente se puede llamar si no tiene
+        jugadores; el GameMap no se puede usar despues.
+        """
+
+        assert self.isMapUnused()
+
+        self.mapFile = None
+        self._playersMatrix = None
+        self.collision = None
+        self._dropState = None
+        self._nav = None
+        self.areas = None
+        self.objects = None
+        self._objSnapshots = None
+
+    def memoryUsage(self):
+        """
+        Bytes aproximados que ocupa el mapa en memoria: los tiles (ver
+        MapFile.memoryUsage) y las estructuras que arma el GameMap. Los
+        jugadores no se cuentan.
+        """
+
+        total = self.mapFile.memoryUsage() + \
+            sys.getsizeof(self._playersMatrix) + \
+            sys.getsizeof(self._dropState) + \
+            self.collision.memoryUsage() + \
+            self.objects.memoryUsage() + \
+            sum([sys.getsizeof(a) for a in self.areas.areas]) + \
+            sum([s.memoryUsage() for s in self._objSnapshots])
+        if self._nav is not None:
+            total += self._nav.memoryUsage()
+        return total
 
     def getPos(self, x, y):
         assert x >= 1 and x <= MAP_SIZE_X
@@ -278,7 +772,39 @@ class GameMap(object):
         assert x >= 1 and x <= MAP_SIZE_X
         assert y >= 1 and y <= MAP_SIZE_Y
 
-        self._playersMatrix[(x - 1) + (y - 1) * MAP_SIZE_X] = p
+        idx = (x - 1) + (y - 1) * MAP_SIZE_X
+        self._playersMatrix[idx] = p
+
+        grid = self.collision.grid
+        before = grid[idx]
+        self.collision.setOccupied(idx, p is not None)
+        self._updateDropState(idx)
+
+        if self._nav is not None and (not grid[idx]) != (not before):
+            self._nav.tileChanged(idx)
+
+    def _updateDropState(self, idx):
+        mf = self.mapFile
+
+        if mf.blocked[idx] or self._playersMatrix[idx] is not None:
+            s = DROP_NO
+        elif not mf.objidx[idx]:
+            s = DROP_EMPTY
+        elif mf.objcant[idx] >= MAXINVITEMS:
+            s = DROP_NO
+        else:
+            s = DROP_STACK
+
+        self._dropState[idx] = s
+
+    @property
+    def nav(self):
+        """MapNavigation del mapa, para mover NPCs y ver closestFreePos."""
+
+        if self._nav is None:
+            self._nav = MapNavigation(self.mapFile.blocked, \
+                self.collision.grid)
+        return self._nav
 
     def playerJoin(self, p):
         debug_print("playerJoin", self.mapNum, p.pos)
@@ -289,31 +815,32 @@ class GameMap(object):
 
         x, y = p.pos
         self.setPos(x, y, p)
+        self.areas.add(p, x, y)
 
         p.map = self
         p.cmdout.sendChangeMap(self.mapNum, self.mapFile.mapVers)
 
-        d = p.getCharacterCreateAttrs()
+        around = AREAS_AROUND[areaOf(x, y)]
+        others = self.areas.playersIn(around)
 
-        for a in self.players:
-            # Avisarle al resto del nuevo pj
-            a.cmdout.sendCharacterCreate(**d)
+        # Avisarle al resto del nuevo pj
+        BroadcastEncoder(others).sendCharacterCreate( \
+            **p.getCharacterCreateAttrs())
 
-            # Avisarle al nuevo pj del resto
-            if a != p:
+        # Avisarle al nuevo pj del resto
+        for a in others:
+            if a is not p:
                 p.cmdout.sendCharacterCreate(**a.getCharacterCreateAttrs())
 
         p.sendUserCharIndexInServer()
 
-        # FIXME: Buscar otra forma de no tener que recorrer 10k tiles
+        snapshot = self.objectsSnapshot(around)
+        if snapshot:
+            p.cmdout.sendRaw(snapshot)
 
-        mf = self.mapFile
-
-        for y in xrange(1, MAP_SIZE_Y + 1):
-            for x in xrange(1, MAP_SIZE_X + 1):
-                obj = mf[x, y].objdata()
-                if obj is not None:
-                    p.cmdout.sendObjectCreate(x, y, obj.GrhIndex)
+        # Que los mapas vecinos esten cargados cuando el jugador llegue a
+        # una salida.
+        corevars.mapData.prefetch(self.neighbours)
 
     def playerLeave(self, p):
         debug_print("playerLeave", self.mapNum, p)
@@ -323,18 +850,19 @@ class GameMap(object):
         x, y = p.pos
         self.setPos(x, y, None)
 
-        for a in self.players:
-            a.cmdout.sendCharacterRemove(p.chridx)
+        self.broadcastAround(x, y).sendCharacterRemove(p.chridx)
 
+        self.areas.remove(p, x, y)
         self.players.remove(p)
+        self.lastUsed = time.time()
 
     def playerMove(self, p, oldpos, newpos):
         """
         p: player.
         
         Mueve un jugador dentro del mapa, validando que newpos sea valida y
-        si lo es, actualiza la pos del jugador y notifica al resto de los 
-        pjs del mapa. En caso de pisar un tile exit cambia de mapa al jugador
+        si lo es, actualiza la pos del jugador y notifica a los pjs que lo
+        ven. En caso de pisar un tile exit cambia de mapa al jugador
         """
 
         if not self.validPos(newpos):
@@ -346,123 +874,453 @@ class GameMap(object):
         self.setPos(x, y, p)
         p.pos = newpos
 
-        for a in self.players:
-            if a != p:
-                a.cmdout.sendCharacterMove(p.chridx, x, y)
+        changed = self.areas.move(p, oldpos, newpos)
+
+        if changed is None:
+            self.broadcastAround(x, y, p).sendCharacterMove(p.chridx, x, y)
+        else:
+            self._playerAreaChanged(p, changed[0], changed[1])
 
         # Tile Exit
         exit = self.mapFile[x, y].exit
         if exit is not None:
             m2, x2, y2 = exit
             debug_print("exit:", exit)
-            p.map.playerLeave(p)
-            p.pos = [x2, y2]
-            corevars.mapData[m2].playerJoin(p)
+            self.playerTeleport(p, m2, (x2, y2))
+
+    def playerTeleport(self, p, mapNum, pos):
+        """Saca a p del mapa y lo pone en pos del mapa mapNum."""
+
+        self.playerLeave(p)
+        p.pos = list(pos)
+        corevars.mapData.playerTransfer(p, mapNum)
+
+    def _playerAreaChanged(self, p, lost, gained):
+        """
+        p cambio de sector: deja de ver los sectores lost y empieza a ver
+        los gained.
+        """
+
+        x, y = p.pos
+        areas = self.areas
+
+        # Los que siguen viendo a p solamente reciben el movimiento.
+        kept = [a for a in AREAS_AROUND[areaOf(x, y)] if a not in gained]
+        BroadcastEncoder(areas.playersIn(kept), p).sendCharacterMove( \
+            p.chridx, x, y)
+
+        # El cliente borra solo los pjs y objetos que quedan fuera del area.
+        p.cmdout.sendAreaChanged(x, y)
+
+        gone = areas.playersIn(lost)
+        if gone:
+            BroadcastEncoder(gone).sendCharacterRemove(p.chridx)
+
+        others = areas.playersIn(gained)
+        if others:
+            BroadcastEncoder(others).sendCharacterCreate( \
+                **p.getCharacterCreateAttrs())
+
+            for a in others:
+                p.cmdout.sendCharacterCreate(**a.getCharacterCreateAttrs())
+
+        snapshot = self.objectsSnapshot(gained)
+        if snapshot:
+            p.cmdout.sendRaw(snapshot)
 
     def playerChange(self, p):
         d = p.getCharacterCreateAttrs(True)
 
-        for a in self.players:
-            a.cmdout.sendCharacterChange(**d)
+        x, y = p.pos
+        self.broadcastAround(x, y).sendCharacterChange(**d)
 
     def validPos(self, pos):
-        x, y = pos
+        """True si pos esta dentro del mapa, no bloqueada y libre."""
 
-        if x < 1 or x > MAP_SIZE_X:
-            return False
+        # Es lo mismo que self.collision.isFree(pos), sin la llamada extra:
+        # se ejecuta con cada Walk.
+        x, y = pos
+        if 1 <= x <= MAP_SIZE_X and 1 <= y <= MAP_SIZE_Y:
+            return not self.collision.grid[(x - 1) + (y - 1) * MAP_SIZE_X]
+        return False
 
-        if y < 1 or y > MAP_SIZE_Y:
-            return False
+    def closestFreePos(self, pos):
+        """
+        Devuelve el tile libre (ver validPos) mas cercano a pos, buscando en
+        espiral como dropObjAt, o None si no hay ninguno. Si pos no esta
+        bloqueado solo sirven los tiles a los que se llega caminando desde
+        pos, para no dejar al jugador del otro lado de una pared.
+        """
 
-        if self.mapFile[x, y].blocked:
-            return False
+        x, y = pos
+        grid = self.collision.grid
+        comp = self.nav.components
+        c = comp[(x - 1) + (y - 1) * MAP_SIZE_X]
 
-        if self.getPos(x, y) is not None:
-            return False
+        for dx, dy, d in SPIRAL_OFFSETS:
+            nx, ny = x + dx, y + dy
+            if 1 <= nx <= MAP_SIZE_X and 1 <= ny <= MAP_SIZE_Y:
+                idx = (nx - 1) + (ny - 1) * MAP_SIZE_X
+                if not grid[idx] and (not c or comp[idx] == c):
+                    return (nx, ny)
 
-        return True
+        return None
 
     def dropObjAt(self, objidx, amount, pos):
         assert amount >= 1 and amount <= MAXINVITEMS
         assert corevars.objData[objidx] is not None
 
-        found = False
+        mf = self.mapFile
+        idx = findDropPos(self._dropState, mf.objidx, mf.objcant, objidx, \
+            amount, pos)
 
-        for p in util.espiral(pos):
-            if not self.validPos(p):
-                continue
+        if idx is None:
+            raise gamerules.NoFreeSpaceOnMap()
 
-            tile = self.mapFile[p]
+        if mf.objidx[idx]:
+            amount += mf.objcant[idx]
 
-            if tile.objidx is None:
-                found = True
-                pos = p
-                break
+        mf.objidx[idx] = objidx
+        mf.objcant[idx] = amount
+        self.onTileObjUpdated((idx % MAP_SIZE_X + 1, idx // MAP_SIZE_X + 1))
 
-            if tile.objidx == objidx and tile.objcant + amount <= MAXINVITEMS:
-                amount += tile.objcant
-                found = True
-                pos = p
-                break
+    def objectsSnapshot(self, areaList):
+        """
+        Devuelve los ObjectCreate de todos los objetos de los sectores de
+        areaList ya serializados.
+        """
 
-        if not found:
-            raise NoFreeSpaceOnMap()
+        snapshots = self._objSnapshots
+        return ''.join([str(snapshots[a].data) for a in areaList \
+            if snapshots[a]])
 
-        tile = self.mapFile[pos]
-        tile.objidx = objidx
-        tile.objcant = amount
-        self.onTileObjUpdated(pos)
+    def _updateObjSnapshot(self, x, y, objidx):
+        """Pone o saca (objidx 0) el ObjectCreate del tile en su sector."""
+
+        snapshot = self._objSnapshots[areaOf(x, y)]
+        if objidx:
+            packetSerializer.sendObjectCreate(x, y, \
+                corevars.objData[objidx].GrhIndex)
+            snapshot.set((x, y), packetSerializer.getData())
+        else:
+            snapshot.remove((x, y))
 
     def onTileObjUpdated(self, pos):
+        """
+        Se debe llamar cada vez que cambia el objeto de un tile. Actualiza
+        el indice de objetos y el snapshot, y avisa a los jugadores que ven
+        el tile.
+        """
+
         x, y = pos
-        obj = self.mapFile[x, y].objdata()
+        tile = self.mapFile[x, y]
+        obj = tile.objdata()
 
-        for p in self.players:
-            if obj is not None:
-                p.cmdout.sendObjectCreate(x, y, obj.GrhIndex)
-            else:
-                p.cmdout.sendObjectDelete(x, y)
+        self.objects.set(x, y, tile.objidx, tile.objcant)
+        self._updateObjSnapshot(x, y, tile.objidx or 0)
+        self._updateDropState(tile.idx)
+
+        if obj is not None:
+            self.broadcastAround(x, y).sendObjectCreate(x, y, obj.GrhIndex)
+        else:
+            self.broadcastAround(x, y).sendObjectDelete(x, y)
 
 class GameMapList(object):
-    def __init__(self, mapCount, maxActiveMaps):
+    """
+    Cache de mapas cargados.
+
+    Los mapas se cargan bajo demanda. Cuando se supera maxActiveMaps o
+    maxBytes (0 es sin limite) se descargan los mapas sin jugadores que
+    hace mas tiempo que no se usan; los mapas con jugadores nunca se
+    descargan.
+    """
+
+    def __init__(self, mapCount, maxActiveMaps, maxBytes=0):
         self.maps = [None] * (mapCount + 1)
         self.activeMaps = 0
         self.maxActiveMaps = maxActiveMaps
+        self.maxBytes = maxBytes
+
+        # Bytes de cada mapa cargado, medidos al cargarlo.
+        self._mapBytes = {}
+        self.activeBytes = 0
+
+        # Cargas en curso en otro thread: mapNum -> lista de Deferreds a
+        # disparar con el GameMap.
+        self._pending = {}
+
+        # Se arma en otro thread al iniciar, ver buildWorldGraph. Mientras
+        # tanto _graphWaiters tiene los Deferreds de quienes lo pidieron.
+        self._worldGraph = None
+        self._graphWaiters = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetches = 0
+        self.loadTime = 0.0
+
+    def load(self, n):
+        """
+        Devuelve un Deferred que se dispara con el mapa n. Si no esta
+        cargado, el MapFile se carga en un thread, sin frenar al loop de
+        eventos.
+        """
 
-    def __getitem__(self, n):
         if n < 1:
             raise IndexError()
-        if self.maps[n] is None:
-            self.maps[n] = GameMap(n)
-            self.activeMaps += 1
-            if self.activeMaps > self.maxActiveMaps:
-                self._removeUnusedMaps()
-        return self.maps[n]
-
-    def _removeUnusedMaps(self):
-        # Revisar esto. Tiene sentido?
-
-        randMaps = [(i, m) for i, m in enumerate(self.maps) if m is not None]
-        random.shuffle(randMaps)
-
-        for i, m in randMaps:
-            if m.isMapUnused():
-                m.unload()
-                self.maps[i] = None
-                self.activeMaps -= 1
-                if self.activeMaps < self.maxActiveMaps:
-                    break
+
+        m = self.maps[n]
+        if m is not None:
+            self.hits += 1
+            m.lastUsed = time.time()
+            return defer.succeed(m)
+
+        d = defer.Deferred()
+        if n in self._pending:
+            self._pending[n].append(d)
+        else:
+            self._pending[n] = [d]
+            self._loadInThread(n)
+        return d
+
+    def prefetch(self, mapNums):
+        """
+        Carga en segundo plano los mapas de mapNums que no esten cargados,
+        mientras haya lugar en el cache sin descargar otros mapas.
+        """
+
+        for n in mapNums:
+            if self.maps[n] is not None or n in self._pending:
+                continue
+            if self.activeMaps + len(self._pending) >= self.maxActiveMaps or \
+                (self.maxBytes and self.activeBytes >= self.maxBytes):
+                break
+
+            self.prefetches += 1
+            self._pending[n] = []
+            self._loadInThread(n)
+
+    def addMapFile(self, n, mf):
+        """Agrega el mapa n a partir de un MapFile ya cargado."""
+        return self._mapFileLoaded(mf, n, time.time())
+
+    def _loadInThread(self, n):
+        d = netBackend.deferToThread(GameMap.loadMapFile, n)
+        d.addCallbacks(self._mapFileLoadedInThread, self._mapFileFailed, \
+            callbackArgs=(n, time.time()), errbackArgs=(n, ))
+
+    def _mapFileLoadedInThread(self, mf, n, t):
+        waiters = self._pending.pop(n)
+
+        m = self.maps[n]
+        if m is None:
+            # Puede que ya se haya cargado con addMapFile mientras tanto.
+            m = self._mapFileLoaded(mf, n, t)
+        else:
+            m.lastUsed = time.time()
+
+        for d in waiters:
+            d.callback(m)
+
+    def _mapFileFailed(self, failure, n):
+        waiters = self._pending.pop(n)
+
+        debug_print("Error al cargar el mapa %d: %s" % (n, \
+            failure.getErrorMessage()))
+
+        for d in waiters:
+            d.errback(failure)
+
+    def _mapFileLoaded(self, mf, n, t):
+        self.misses += 1
+
+        self.maps[n] = m = GameMap(n, mf)
+        self.loadTime += time.time() - t
+
+        self.activeMaps += 1
+        self.enforceLimits(n)
+
+        return m
+
+    def enforceLimits(self, keep=None):
+        """
+        Vuelve a medir los mapas cargados, que despues de cargarse crecen
+        con los objetos que se tiran y con los datos de busqueda de
+        caminos, y descarga mapas si se superan los limites. keep es un
+        mapa que no se descarga.
+        """
+
+        for i, m in enumerate(self.maps):
+            if m is not None:
+                self._mapBytes[i] = m.memoryUsage()
+        self.activeBytes = sum(self._mapBytes.itervalues())
+
+        if self._overLimit():
+            self._removeUnusedMaps(keep)
+
+    def _overLimit(self):
+        return self.activeMaps > self.maxActiveMaps or \
+            (self.maxBytes and self.activeBytes > self.maxBytes)
+
+    def _removeUnusedMaps(self, keep):
+        """
+        Descarga mapas sin jugadores, del que hace mas tiempo que no se usa
+        al mas reciente, hasta volver a estar dentro de los limites. keep
+        es el mapa que se acaba de cargar, que no se descarga, o None.
+        """
+
+        candidates = [m for i, m in enumerate(self.maps) \
+            if m is not None and i != keep and m.isMapUnused() \
+            and i not in self._pending]
+        candidates.sort(key=lambda m: m.lastUsed)
+
+        for m in candidates:
+            if not self._overLimit():
+                break
+            self.unload(m.mapNum)
+
+    def unload(self, n):
+        m = self.maps[n]
+        assert m is not None
+
+        m.unload()
+        self.maps[n] = None
+        self.activeMaps -= 1
+        self.activeBytes -= self._mapBytes.pop(n, 0)
+        self.evictions += 1
+
+    def buildWorldGraph(self):
+        """
+        Arma el worldgraph.WorldGraph de los mapas en otro thread, si no
+        esta armado o armandose. Las salidas de los mapas cargados se toman
+        de memoria y las del resto de los metadatos de cada mapa.
+        """
+
+        if self._worldGraph is not None or self._graphWaiters is not None:
+            return
+
+        self._graphWaiters = []
+
+        d = netBackend.deferToThread(worldgraph.loadWorldGraph, \
+            len(self.maps) - 1, ServerConfig.get('Core', 'MapsFilesPath'), \
+            ServerConfig.get('Core', 'MapsCompiledPath'), \
+            dict([(m.mapNum, m.mapFile.exits) for m in self.maps \
+                if m is not None]))
+        d.addCallbacks(self._worldGraphBuilt, self._worldGraphFailed, \
+            callbackArgs=(time.time(), ))
+
+    def _worldGraphBuilt(self, graph, t):
+        debug_print("Grafo del mundo: %d mapas en %.2f segundos." % \
+            (len(graph), time.time() - t))
+
+        self._worldGraph = graph
+        waiters, self._graphWaiters = self._graphWaiters, None
+        for d in waiters:
+            d.callback(graph)
+
+    def _worldGraphFailed(self, failure):
+        debug_print("Error al armar el grafo del mundo: %s" % \
+            failure.getErrorMessage())
+
+        # El proximo pedido lo vuelve a intentar.
+        waiters, self._graphWaiters = self._graphWaiters, None
+        for d in waiters:
+            d.errback(failure)
+
+    def worldGraph(self):
+        """
+        Devuelve un Deferred que se dispara con el WorldGraph, que se arma
+        al iniciar el servidor (ver buildWorldGraph).
+        """
+
+        if self._worldGraph is not None:
+            return defer.succeed(self._worldGraph)
+
+        d = defer.Deferred()
+        self.buildWorldGraph()
+        self._graphWaiters.append(d)
+        return d
+
+    def playerTransfer(self, p, mapNum, joined=None):
+        """
+        Mueve a p, que no esta en ningun mapa, al mapa mapNum en p.pos, o
+        al tile libre mas cercano si p.pos esta ocupado. Si no hay ninguno
+        se desconecta al jugador. Si el mapa no esta cargado el jugador
+        queda en estado "transferring" hasta que termine la carga, que se
+        hace en otro thread. joined se llama despues de que p entra al mapa.
+        """
+
+        def joinMap(m):
+            p.transferring = False
+            if p.closing:
+                return
+
+            pos = m.closestFreePos(p.pos)
+            if pos is None:
+                debug_print("Sin lugar en el mapa", mapNum, p)
+                p.quit()
+                return
+
+            p.pos = list(pos)
+            m.playerJoin(p)
+            if joined is not None:
+                joined()
+
+        def failed(failure):
+            p.transferring = False
+            p.quit()
+
+        p.transferring = True
+        self.load(mapNum).addCallbacks(joinMap, failed)
+
+    def stats(self):
+        """
+        Contadores del cache: (mapas cargados, bytes, aciertos, fallos,
+        mapas descargados, mapas precargados, tiempo total de carga en
+        segundos).
+        """
+
+        return (self.activeMaps, self.activeBytes, self.hits, self.misses, \
+            self.evictions, self.prefetches, self.loadTime)
 
 # Timer
 
+def flushesOutput(f):
+    """
+    Decorator para los timers: lo que se haya encolado para los clientes
+    durante el timer se envia al terminar.
+    """
+    def fNew():
+        try:
+            return f()
+        finally:
+            gameServer.flushPendingOutput()
+    fNew.__name__ = f.__name__
+    fNew.__doc__ = f.__doc__
+    return fNew
+
+@flushesOutput
+def onTimerInput():
+    """Ejecuta los comandos de los clientes; cada InputTickInterval ms."""
+    gameServer.runInputTick()
+
+def onTimerFlush():
+    """Envia los datos pendientes; cada OutputFlushMaxDelay milisegundos."""
+    gameServer.flushPendingOutput()
+
+@flushesOutput
 def onTimerSched():
     """Este timer se ejecuta cinco veces por segundo, cuidado con hacer demasiadas cosas."""
-    pass
 
+    gameServer.resumeDelayedInput()
+
+@flushesOutput
 def onTimer1():
     """Este timer se ejecuta cada un segundo."""
     pass
 
+@flushesOutput
 def onTimer10():
     """Este timer se ejecuta cada 10 segundos."""
 
@@ -479,9 +1337,40 @@ def onTimer10():
         if t - c.lastHandledPacket > maxTime:
             c.loseConnection()
 
+@flushesOutput
 def onTimer60():
     """Este timer se ejecuta cada 60 segundos."""
-    pass
+
+    writesPerSec, bytesPerWrite = gameServer.outputStats()
+    debug_print(("Salida: %.1f writes/s, %.1f bytes/write; %d writes, %d " \
+        "bytes, %d flushes por timer, %d por OutputFlushMaxBytes") % \
+        (writesPerSec, bytesPerWrite, gameServer.outputWrites, \
+        gameServer.outputBytes, gameServer.outputTimerFlushes, \
+        gameServer.outputFullFlushes))
+
+    if gameServer.inputScheduler is not None:
+        debug_print(("Entrada: %d ticks, %.1f conexiones por tick, %d " \
+            "maximo, %d pasaron al tick siguiente") % \
+            gameServer.inputScheduler.stats())
+
+    slow, overflows = gameServer.slowConnections()
+    debug_print("Colas de salida: %d desconexiones por clientes lentos" % \
+        overflows)
+    for queued, maxQueued, shed, coalesced, c in slow:
+        debug_print(("  %s: %d bytes en cola, %d maximo, %d descartados, " \
+            "%d reemplazados") % (c.getPeer().host, queued, maxQueued, shed, \
+            coalesced))
+
+    for c, hits in gameServer.rateLimitStats():
+        debug_print("Limites de paquetes: %s (%s): %s" % (c.getPeer().host, \
+            c.player.playerName if c.player is not None else '-', \
+            ', '.join(["%s %d" % (clientPacketsFlip[cmd], n) \
+                for cmd, n in sorted(hits.items())])))
+
+    corevars.mapData.enforceLimits()
+    debug_print(("Mapas: %d cargados, %d bytes, %d aciertos, %d fallos, " \
+        "%d descargados, %d precargados, %.2f s de carga") % \
+        corevars.mapData.stats())
 
 # Main
 
@@ -489,38 +1378,105 @@ def loadMaps():
     mapCount = ServerConfig.getint('Core', 'MapCount')
     mapLoadingMode = ServerConfig.get('Core', 'MapLoadingMode').lower()
     maxActiveMaps = ServerConfig.getint('Core', 'MaxActiveMapsCount')
-
+    maxActiveBytes = ServerConfig.getint('Core', 'MaxActiveMapsBytes')
 
     if mapLoadingMode == "full":
         corevars.mapData = GameMapList(mapCount, mapCount)
-
-        print "Cargando mapas... "
-
-        for x in xrange(1, mapCount + 1):
-            sys.stdout.write(str(x) + " ")
-            sys.stdout.flush()
-            corevars.mapData[x]
-
-        print
+        loadAllMaps(mapCount)
 
         # Piedad, oh, piedad.
         gc.collect()
     elif mapLoadingMode == "lazy":
-        corevars.mapData = GameMapList(mapCount, maxActiveMaps)
+        corevars.mapData = GameMapList(mapCount, maxActiveMaps, \
+            maxActiveBytes)
 
         print "Carga de mapas en modo Lazy; se cargaran bajo demanda."
     else:
         raise Exception("Opcion no reconocida: MapLoadingMode=" \
             + mapLoadingMode)
 
+    # En modo Full las salidas ya estan en memoria; en Lazy se leen los
+    # metadatos de los mapas en otro thread, sin demorar el inicio.
+    corevars.mapData.buildWorldGraph()
+
+def loadAllMaps(mapCount):
+    """
+    Carga todos los mapas para el modo Full. Los map/inf/dat se leen en
+    MapLoadingProcesses procesos hijos, que devuelven cada mapa en el
+    formato compilado; el proceso principal arma los GameMap.
+    """
+
+    processes = ServerConfig.getint('Core', 'MapLoadingProcesses')
+    if processes <= 0:
+        processes = multiprocessing.cpu_count()
+
+    shared = ServerConfig.getboolean('Core', 'SharedStaticData')
+    args = [(x, ServerConfig.get('Core', 'MapsFilesPath'), \
+        ServerConfig.get('Core', 'MapsCompiledPath'), shared) \
+        for x in xrange(1, mapCount + 1)]
+
+    print "Cargando mapas con %d procesos... " % processes
+
+    tStart = time.time()
+    workersTime = 0.0
+    buildTime = 0.0
+
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(mapfile.loadMapWorker, args)
+    else:
+        pool = None
+        results = itertools.imap(mapfile.loadMapWorker, args)
+
+    try:
+        for mapNum, data, t in results:
+            sys.stdout.write(str(mapNum) + " ")
+            sys.stdout.flush()
+
+            workersTime += t
+
+            t = time.time()
+            if data is None:
+                mf = GameMap.loadMapFile(mapNum)
+            else:
+                mf = mapfile.parseCompiledMap(data)
+            corevars.mapData.addMapFile(mapNum, mf)
+            buildTime += time.time() - t
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    total = time.time() - tStart
+
+    print
+    print "Mapas cargados en %.2f segundos:" % total
+    print "  lectura (suma de los procesos): %.2f s" % workersTime
+    print "  armado de los GameMap:          %.2f s" % buildTime
+    print "  espera de los procesos:         %.2f s" % (total - buildTime)
+
 def loadFiles():
     datFilesPath = ServerConfig.get('Core', 'DatFilesPath')
     
+    if ServerConfig.getboolean('Core', 'SharedStaticData'):
+        if not ServerConfig.get('Core', 'MapsCompiledPath'):
+            raise Exception("SharedStaticData requiere MapsCompiledPath")
+
+        # Tablas de solo lectura, compartidas con mmap entre procesos.
+        datCompiledPath = ServerConfig.get('Core', 'DatCompiledPath')
+
+        def load(loadFunc, datItemClass, fileName):
+            return datfile.loadDatShared(loadFunc, datItemClass, \
+                os.path.join(datFilesPath, fileName), datCompiledPath)
+    else:
+        def load(loadFunc, datItemClass, fileName):
+            return loadFunc(os.path.join(datFilesPath, fileName))
+
     # Objs.
-    corevars.objData = datfile.loadObjDat(os.path.join(datFilesPath, 'obj.dat'))
-    corevars.npcData = datfile.loadNPCsDat(os.path.join(datFilesPath, 'NPCs.dat'))
-    corevars.hechData = datfile.loadHechizosDat(os.path.join(datFilesPath, \
-        'Hechizos.dat'))
+    corevars.objData = load(datfile.loadObjDat, datfile.ObjItem, 'obj.dat')
+    corevars.npcData = load(datfile.loadNPCsDat, datfile.NPCDat, 'NPCs.dat')
+    corevars.hechData = load(datfile.loadHechizosDat, datfile.HechizoDat, \
+        'Hechizos.dat')
 
     # Nombres prohibidos.
     corevars.forbiddenNames = set([x.strip().lower() for x in \
@@ -537,27 +1493,48 @@ def loadServerConfig():
         raise Exception('Error al validar la opcion EncodingSanityCheck del archivo de configuracion: ' + sys.argv[1])
 
 def initServer():
-    global cmdDecoder, gameServer
+    global cmdDecoder, gameServer, netBackend
 
     loadServerConfig()
 
+    try:
+        netBackend = network.createBackend(ServerConfig.get('Core', \
+            'NetworkBackend'))
+    except (ImportError, ValueError), e:
+        print e
+        sys.exit(1)
+
     cmdDecoder = ClientCommandsDecoder()
+    if ServerConfig.has_section('RateLimits'):
+        cmdDecoder.setRateLimits(parseRateLimits( \
+            ServerConfig.items('RateLimits')))
     gameServer = corevars.gameServer = GameServer()
 
 def runServer():
     listenPort = ServerConfig.getint('Core', 'ListenPort')
-    reactor.listenTCP(listenPort, AoProtocolFactory())
+    netBackend.listen(listenPort, AoProtocol)
+
+    netBackend.loopingCall(0.2, onTimerSched)
+    netBackend.loopingCall(1, onTimer1)
+    netBackend.loopingCall(10, onTimer10)
+    netBackend.loopingCall(60, onTimer60)
 
-    task.LoopingCall(onTimerSched).start(0.2)
-    task.LoopingCall(onTimer1).start(1)
-    task.LoopingCall(onTimer10).start(10)
-    task.LoopingCall(onTimer60).start(60)
+    if gameServer.outputCorking:
+        netBackend.loopingCall(gameServer.outputFlushMaxDelay / 1000.0, \
+            onTimerFlush)
 
-    print "Escuchando en el puerto %d, reactor: %s" % ( \
-        listenPort, reactor.__class__.__name__)
+    if gameServer.inputScheduler is not None:
+        netBackend.loopingCall(gameServer.inputTickInterval / 1000.0, \
+            onTimerInput)
+
+    print "Escuchando en el puerto %d, red: %s" % (listenPort, \
+        netBackend.describe())
     print "Para cerrar el servidor presionar Control-C."
 
-    reactor.run()
+    try:
+        netBackend.run()
+    except KeyboardInterrupt:
+        pass
 
 def main():
     print
@@ -31,9 +31,10 @@ existe un pequeño programa llamado "datfixer.py" para corregir los DATs y que
 ConfigParser los pueda entender.
 """
 
-import ConfigParser
+import os, mmap, ConfigParser
 
-from util import MyConfigParser, positiverolist
+from util import MyConfigParser, positiverolist, writeFileAtomic
+from bytequeue import getStruct
 
 class ObjItem(object):
     __slots__ = ('Name', 'GrhIndex', 'ObjType', 'Agarrable', 'Valor', \
@@ -103,3 +104,189 @@ def loadDatFile(parser, maxIdx, datItemClass, attrsList, tiposList, headerStr):
 
     return positiverolist(datItemList)
 
+# Tablas compiladas, para compartirlas entre procesos con mmap.
+#
+# Formato (little endian):
+#
+#   header: magic, version, mtime del .dat, cantidad de items (incluyendo el
+#       0), largo de cada registro.
+#   un registro de largo fijo por item: un byte que indica si el item existe
+#       y, por cada atributo, un byte que indica si tiene valor seguido del
+#       valor. int: int32, bool: int8, str: offset y largo (int32) dentro del
+#       bloque de strings.
+#   bloque de strings.
+
+DAT_MAGIC = 'AODC'
+DAT_VERSION = 1
+DAT_HEADER = getStruct('<4sHdll')
+
+DAT_TYPE_CODES = {int: 'Bl', bool: 'Bb', str: 'Bll'}
+
+def _datRecordStruct(datItemClass):
+    return getStruct('<B' + ''.join([DAT_TYPE_CODES[t] for t in \
+        datItemClass.__tipos__]))
+
+def saveDatTable(items, datItemClass, fileName, srcMtime=0.0):
+    """Guarda una lista de items de datItemClass en el formato compilado."""
+
+    st = _datRecordStruct(datItemClass)
+    strings = []
+    stringsLen = 0
+    records = []
+
+    count = len(items)
+
+    for idx in xrange(count):
+        o = items[idx]
+        if o is None:
+            records.append(st.pack(*([0] * (len(st.format) - 1))))
+            continue
+
+        vals = [1]
+        for attr, t in zip(datItemClass.__slots__, datItemClass.__tipos__):
+            v = getattr(o, attr)
+            if v is None:
+                vals.extend([0] * len(DAT_TYPE_CODES[t]))
+            elif t is str:
+                vals.extend([1, stringsLen, len(v)])
+                strings.append(v)
+                stringsLen += len(v)
+            else:
+                vals.extend([1, v])
+        records.append(st.pack(*vals))
+
+    writeFileAtomic(fileName, [DAT_HEADER.pack(DAT_MAGIC, DAT_VERSION, \
+        srcMtime, count, st.size), ''.join(records), ''.join(strings)])
+
+class SharedDatItem(object):
+    """
+    Vista de un item de una SharedDatTable. Las subclases (una por cada
+    clase de items, ver sharedDatItemClass) tienen una property por
+    atributo que lee el valor del registro; los strings se leen del mmap.
+    """
+
+    __slots__ = ('table', 'values')
+
+    def __init__(self, table, values):
+        self.table = table
+        self.values = values
+
+    def __repr__(self):
+        return "%s<%s>" % (self.__class__.__name__, ', '.join(["%s=%r" % \
+            (x, getattr(self, x)) for x in self.__attrs__]))
+
+_sharedDatItemClasses = {}
+
+def _sharedDatProperty(pos, t):
+    if t is str:
+        def get(self):
+            v = self.values
+            if not v[pos]:
+                return None
+            start = self.table.stringsPos + v[pos + 1]
+            return self.table.mm[start:start + v[pos + 2]]
+    elif t is bool:
+        def get(self):
+            v = self.values
+            return bool(v[pos + 1]) if v[pos] else None
+    else:
+        def get(self):
+            v = self.values
+            return v[pos + 1] if v[pos] else None
+
+    return property(get)
+
+def sharedDatItemClass(datItemClass):
+    """Devuelve (y crea la primera vez) la vista para datItemClass."""
+
+    try:
+        return _sharedDatItemClasses[datItemClass]
+    except KeyError:
+        pass
+
+    d = {'__slots__': (), '__attrs__': datItemClass.__slots__}
+    pos = 1
+    for attr, t in zip(datItemClass.__slots__, datItemClass.__tipos__):
+        d[attr] = _sharedDatProperty(pos, t)
+        pos += len(DAT_TYPE_CODES[t])
+
+    cls = type('Shared' + datItemClass.__name__, (SharedDatItem,), d)
+    _sharedDatItemClasses[datItemClass] = cls
+    return cls
+
+class SharedDatTable(object):
+    """
+    Tabla de solo lectura de un .DAT compilado, leida con mmap. Se usa igual
+    que la lista que devuelve loadDatFile: tabla[idx] es None si el item no
+    existe. Cada acceso devuelve una vista nueva; los datos no se copian,
+    asi que varios procesos que abren el mismo archivo comparten las
+    páginas físicas.
+    """
+
+    __slots__ = ('mm', 'st', 'itemClass', 'count', 'stringsPos')
+
+    def __init__(self, mm, datItemClass, count):
+        self.mm = mm
+        self.st = _datRecordStruct(datItemClass)
+        self.itemClass = sharedDatItemClass(datItemClass)
+        self.count = count
+        self.stringsPos = DAT_HEADER.size + count * self.st.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            raise IndexError('negative')
+        if i >= self.count:
+            raise IndexError('out of range')
+
+        values = self.st.unpack_from(self.mm, DAT_HEADER.size + \
+            i * self.st.size)
+        if not values[0]:
+            return None
+        return self.itemClass(self, values)
+
+    def __setitem__(self, i, v):
+        raise TypeError('read only list')
+
+def loadSharedDatTable(fileName, datItemClass, srcMtime=None):
+    """
+    Abre un .DAT compilado. Devuelve None si el archivo no corresponde a
+    datItemClass o si srcMtime no es None y no coincide con el mtime
+    guardado al compilarlo.
+    """
+
+    with open(fileName, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, mtime, count, recSize = DAT_HEADER.unpack_from(mm, 0)
+    if magic != DAT_MAGIC or version != DAT_VERSION or \
+        recSize != _datRecordStruct(datItemClass).size:
+        return None
+
+    if srcMtime is not None and mtime != srcMtime:
+        return None
+
+    return SharedDatTable(mm, datItemClass, count)
+
+def loadDatShared(loadFunc, datItemClass, fileName, compiledBasePath):
+    """
+    Carga un .DAT como SharedDatTable. Si el compilado no existe o es más
+    viejo que el .DAT se regenera usando loadFunc (loadObjDat, etc).
+    """
+
+    if not os.path.isdir(compiledBasePath):
+        os.makedirs(compiledBasePath)
+
+    srcMtime = os.path.getmtime(fileName)
+    compiledName = os.path.join(compiledBasePath, \
+        os.path.basename(fileName) + '.aodc')
+
+    if os.path.isfile(compiledName):
+        t = loadSharedDatTable(compiledName, datItemClass, srcMtime)
+        if t is not None:
+            return t
+
+    saveDatTable(loadFunc(fileName), datItemClass, compiledName, srcMtime)
+    return loadSharedDatTable(compiledName, datItemClass)
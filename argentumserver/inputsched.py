@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Planificador de los comandos de los clientes por ticks.
+
+En lugar de ejecutar los comandos apenas llegan los datos, las conexiones
+con datos se anotan en una cola y en cada tick se recorren en round-robin:
+cada una ejecuta a lo sumo "budget" comandos, y si le quedan vuelve al
+final de la cola para el proximo tick. Una conexion que manda una rafaga
+grande no demora a las demas mas que "budget" comandos por tick.
+"""
+
+import collections
+
+class FairInputScheduler(object):
+    """
+    Las conexiones tienen que tener el metodo handleInput(budget), que
+    ejecuta a lo sumo budget comandos y devuelve True si le quedaron
+    comandos pendientes.
+    """
+
+    __slots__ = ('budget', '_ready', '_queued', 'ticks', 'served', \
+        'maxReady', 'carried', )
+
+    def __init__(self, budget):
+        self.budget = budget
+        self._ready = collections.deque()
+        self._queued = set()
+
+        # Estadisticas: ticks, conexiones atendidas, maximo de conexiones
+        # en espera en un tick y conexiones que pasaron al tick siguiente
+        # por el budget.
+        self.ticks = 0
+        self.served = 0
+        self.maxReady = 0
+        self.carried = 0
+
+    def __len__(self):
+        return len(self._ready)
+
+    def add(self, c):
+        """Anota la conexion c para el proximo tick."""
+
+        if c not in self._queued:
+            self._queued.add(c)
+            self._ready.append(c)
+
+    def runTick(self):
+        """Atiende una vez a cada conexion que estaba esperando."""
+
+        ready = self._ready
+        queued = self._queued
+        budget = self.budget
+
+        n = len(ready)
+        self.ticks += 1
+        self.served += n
+        if n > self.maxReady:
+            self.maxReady = n
+
+        for x in xrange(n):
+            c = ready.popleft()
+
+            if c.handleInput(budget):
+                ready.append(c)
+                self.carried += 1
+            else:
+                queued.discard(c)
+
+    def stats(self):
+        """
+        Devuelve (ticks, conexiones atendidas por tick, maximo de conexiones
+        en espera, veces que una conexion paso al tick siguiente) desde la
+        ultima llamada.
+        """
+
+        ret = (self.ticks, float(self.served) / self.ticks \
+            if self.ticks else 0.0, self.maxReady, self.carried)
+
+        self.ticks = self.served = self.maxReady = self.carried = 0
+
+        return ret
@@ -24,60 +24,337 @@ Funciones y clases para cargar un mapa desde los map/inf/dat a memoria.
 La idea es mantener este módulo lo más limpio posible. Acá solamente se cargan
 los datos desde los archivos, para inicializar los NPCs y otras yerbas hacerlo
 desde el que llama.
+
+Además de los map/inf/dat originales, un mapa se puede guardar "compilado"
+en un solo archivo binario (ver saveCompiledMap y tools/mapcompiler.py) que
+se lee con unas pocas operaciones en bloque.
 """
 
-import os
+import os, sys, time, marshal, mmap, ctypes
+from array import array
 from ConfigParser import NoOptionError
 
-from bytequeue import ByteQueue
+from bytequeue import ByteQueue, ByteQueueInsufficientData, getStruct
 from constants import MAP_SIZE_X, MAP_SIZE_Y
 import util, corevars
 
-       
+# Headers de los archivos .map e .inf.
+MAP_HEADER = getStruct('<h255sll')
+MAP_HEADER_TAIL = getStruct('<d')
+INF_HEADER = getStruct('<dh')
+
+def _tileStructs(bits, sizes, base=0):
+    """
+    Arma una tabla indexada por los flags de un tile con el Struct que lee
+    todos los campos presentes, para leerlos en una sola llamada.
+    """
+
+    tbl = []
+    for flags in xrange(1 << len(bits)):
+        n = base + sum([sz for b, sz in zip(bits, sizes) if flags & b])
+        tbl.append(getStruct('<' + 'h' * n))
+    return tbl
+
+# .map: layer 1 (siempre), layers 2, 3 y 4, trigger. Indexado por
+# (flags >> 1) & 15.
+MAP_TILE_STRUCTS = _tileStructs([1, 2, 4, 8], [1, 1, 1, 1], 1)
+
+# .inf: exit (map, x, y), npc, obj (index, amount). Indexado por flags & 7.
+INF_TILE_STRUCTS = _tileStructs([1, 2, 4], [3, 1, 2])
+
+# Largo en bytes de un tile del .map, con el byte de flags, indexado por los
+# flags. Alcanza para saltear un tile sin decodificarlo.
+MAP_TILE_SIZES = [1 + MAP_TILE_STRUCTS[(f >> 1) & 15].size \
+    for f in xrange(256)]
+
+MAP_TILES = MAP_SIZE_X * MAP_SIZE_Y
+
+def arraySize(a):
+    """
+    Bytes de un array de los tiles. sys.getsizeof de un array de ctypes
+    mide solamente el objeto, no los datos a los que apunta.
+    """
+
+    if isinstance(a, ctypes.Array):
+        return sys.getsizeof(a) + ctypes.sizeof(a)
+    return sys.getsizeof(a)
+
 class MapFileTile(object):
-    __slots__ = ('blocked', 'layers', 'trigger', 'exit', 'npc', 'objidx', 'objcant')
-    def __init__(self):
-        self.blocked = False
-        self.layers = [None] * 4
-        self.trigger = 0
-        self.exit = None
-        self.npc = None
-        self.objidx = None
-        self.objcant = 0
+    """
+    Vista liviana de un tile de un MapFile. Los datos se leen y se escriben
+    directamente en los arrays del MapFile.
+    """
+
+    __slots__ = ('mf', 'idx', )
+
+    attrs = ('blocked', 'layers', 'trigger', 'exit', 'npc', 'objidx', \
+        'objcant')
+
+    def __init__(self, mf, idx):
+        self.mf = mf
+        self.idx = idx
 
     def __repr__(self):
-        return "MapFileTile<" + ', '.join(["%s=%s" % (x, str(getattr(self, x))) for x in MapFileTile.__slots__]) + ">"
+        return "MapFileTile<" + ', '.join(["%s=%s" % (x, str(getattr(self, x))) for x in MapFileTile.attrs]) + ">"
 
     __str__ = __repr__
     
     def __unicode__(self):
         return unicode(str(self))
 
+    def _getBlocked(self):
+        return self.mf.blocked[self.idx] != 0
+
+    def _setBlocked(self, v):
+        self.mf.blocked[self.idx] = 1 if v else 0
+
+    blocked = property(_getBlocked, _setBlocked)
+
+    def _getLayers(self):
+        """Las capas 2, 3 y 4 son None si el tile no las tiene."""
+
+        mf, idx = self.mf, self.idx
+        mf.decodeTile(idx)
+        return [mf.layers[0][idx]] + [(l[idx] or None) for l in mf.layers[1:]]
+
+    layers = property(_getLayers)
+
+    def _getTrigger(self):
+        self.mf.decodeTile(self.idx)
+        return self.mf.trigger[self.idx]
+
+    def _setTrigger(self, v):
+        self.mf.decodeTile(self.idx)
+        self.mf.trigger[self.idx] = v
+
+    trigger = property(_getTrigger, _setTrigger)
+
+    def _getExit(self):
+        return self.mf.exits.get(self.idx)
+
+    def _setExit(self, v):
+        if v is None:
+            self.mf.exits.pop(self.idx, None)
+        else:
+            self.mf.exits[self.idx] = tuple(v)
+
+    exit = property(_getExit, _setExit)
+
+    def _getNpc(self):
+        return self.mf.npc[self.idx] or None
+
+    def _setNpc(self, v):
+        self.mf.npc[self.idx] = v or 0
+
+    npc = property(_getNpc, _setNpc)
+
+    def _getObjIdx(self):
+        return self.mf.objidx[self.idx] or None
+
+    def _setObjIdx(self, v):
+        self.mf.objidx[self.idx] = v or 0
+
+    objidx = property(_getObjIdx, _setObjIdx)
+
+    def _getObjCant(self):
+        return self.mf.objcant[self.idx]
+
+    def _setObjCant(self, v):
+        self.mf.objcant[self.idx] = v
+
+    objcant = property(_getObjCant, _setObjCant)
+
     def objdata(self):
-        if self.objidx is not None:
-            return corevars.objData[self.objidx]
+        objidx = self.mf.objidx[self.idx]
+        if objidx:
+            return corevars.objData[objidx]
         return None
 
 class MapFile(object):
-    __slots__ = ('mapNum', 'tiles', 'opts', 'mapDesc', 'mapVers', 'mapCrc', 'mapMagicWord')
+    """
+    Los datos de los tiles se guardan por columnas ("struct of arrays"):
+    un array por cada dato, indexado por (x - 1) + (y - 1) * MAP_SIZE_X.
+    Un 0 en layers[1..3], npc u objidx significa que el tile no lo tiene.
+    Las salidas, que son pocas, van en un dict.
+
+    mf[x, y] devuelve un MapFileTile para acceder a un tile como objeto.
+
+    Si el mapa se cargó con mmap (ver loadCompiledMap) blocked, layers,
+    trigger y npc son arrays de ctypes sobre el archivo compartido.
+
+    Si se cargó con loadMapFile(..., lazy=True) layers y trigger de cada
+    fila se decodifican recién con decodeRow; quien los lea directamente de
+    los arrays tiene que llamar antes a decodeRow, decodeTile o decodeAll.
+    MapFileTile ya lo hace.
+    """
+
+    __slots__ = ('mapNum', 'opts', 'mapDesc', 'mapVers', 'mapCrc', \
+        'mapMagicWord', 'blocked', 'layers', 'trigger', 'npc', 'objidx', \
+        'objcant', 'exits', '_mapData', '_rowOffsets', '_rowsPending')
     def __init__(self, mapNum):
         self.mapNum = mapNum
-        self.tiles = []
         self.opts = {}
 
+        self.blocked = bytearray(MAP_TILES)
+        self.layers = [array('h', [0]) * MAP_TILES for x in xrange(4)]
+        self.trigger = array('h', [0]) * MAP_TILES
+        self.npc = array('h', [0]) * MAP_TILES
+        self.objidx = array('h', [0]) * MAP_TILES
+        self.objcant = array('h', [0]) * MAP_TILES
+        self.exits = {}
+
+        # Datos del .map y posicion de cada fila todavia sin decodificar
+        # (-1 si ya se decodifico), con lazy=True. None si no falta nada.
+        self._mapData = None
+        self._rowOffsets = None
+        self._rowsPending = 0
+
     def __getitem__(self, p):
         x, y = p
 
         assert x >= 1 and x <= MAP_SIZE_X
         assert y >= 1 and y <= MAP_SIZE_Y
 
-        return self.tiles[(x - 1) + (y - 1) * MAP_SIZE_X]
+        return MapFileTile(self, (x - 1) + (y - 1) * MAP_SIZE_X)
 
     def __str__(self):
-        return "MapFile<n=%d>" % self.n
+        return "MapFile<n=%d>" % self.mapNum
+
+    def decodeRow(self, y):
+        """Decodifica layers y trigger de la fila y si todavia no se hizo."""
+
+        if self._mapData is None:
+            return
+
+        pos = self._rowOffsets[y - 1]
+        if pos < 0:
+            return
+
+        _decodeMapRow(self, self._mapData, pos, y - 1)
+        self._rowOffsets[y - 1] = -1
+        self._rowsPending -= 1
+
+        if not self._rowsPending:
+            self._mapData = None
+            self._rowOffsets = None
+
+    def decodeTile(self, idx):
+        """decodeRow para la fila del tile idx."""
+
+        if self._mapData is not None:
+            self.decodeRow(idx // MAP_SIZE_X + 1)
+
+    def decodeAll(self):
+        """Decodifica todas las filas que falten."""
+
+        if self._mapData is not None:
+            for y in xrange(1, MAP_SIZE_Y + 1):
+                self.decodeRow(y)
+
+    def rowsPending(self):
+        """Cantidad de filas todavia sin decodificar."""
+        return self._rowsPending
+
+    def memoryUsage(self):
+        """
+        Bytes ocupados por los datos de los tiles. De los arrays mapeados
+        (ver loadCompiledMap) se cuentan los bytes del mapeo, aunque otros
+        procesos compartan las mismas paginas.
+        """
+
+        arrays = [self.blocked] + self.layers + [self.trigger, self.npc, \
+            self.objidx, self.objcant]
+        total = sys.getsizeof(self.layers) + \
+            sum([arraySize(a) for a in arrays]) + \
+            sys.getsizeof(self.exits)
+        for k, v in self.exits.iteritems():
+            total += sys.getsizeof(k) + sys.getsizeof(v) + \
+                sum([sys.getsizeof(x) for x in v])
+        if self._mapData is not None:
+            total += sys.getsizeof(self._mapData) + \
+                sys.getsizeof(self._rowOffsets)
+        return total
+
+def _decodeMapRow(mf, data, pos, row):
+    """
+    Decodifica los tiles de la fila row (desde 0) del .map, que empieza en
+    la posicion pos de data. Devuelve la posicion de la fila siguiente.
+    """
+
+    structs = MAP_TILE_STRUCTS
+    blocked = mf.blocked
+    layer1, layer2, layer3, layer4 = mf.layers
+    trigger = mf.trigger
+
+    for idx in xrange(row * MAP_SIZE_X, (row + 1) * MAP_SIZE_X):
+        tileFlags = data[pos]
+
+        blocked[idx] = tileFlags & 1
+
+        # Graphics: la capa 1 siempre esta, el resto segun los flags.
+        st = structs[(tileFlags >> 1) & 15]
+        vals = st.unpack_from(data, pos + 1)
+        pos += 1 + st.size
+
+        layer1[idx] = vals[0]
+        if tileFlags & 30:
+            i = 1
+            if tileFlags & 2:
+                layer2[idx] = vals[i]
+                i += 1
+            if tileFlags & 4:
+                layer3[idx] = vals[i]
+                i += 1
+            if tileFlags & 8:
+                layer4[idx] = vals[i]
+                i += 1
+
+            # Trigger.
+            if tileFlags & 16:
+                trigger[idx] = vals[i]
+
+    return pos
+
+def _scanMapRows(mf, data, pos):
+    """
+    Recorre los tiles del .map leyendo solamente los flags: carga blocked y
+    deja en mf la posicion de cada fila, para decodificar el resto con
+    decodeRow. Devuelve la posicion del final de los tiles.
+    """
+
+    sizes = MAP_TILE_SIZES
+    blocked = mf.blocked
+    offsets = []
+
+    try:
+        for row in xrange(MAP_SIZE_Y):
+            offsets.append(pos)
+            for idx in xrange(row * MAP_SIZE_X, (row + 1) * MAP_SIZE_X):
+                tileFlags = data[pos]
+                blocked[idx] = tileFlags & 1
+                pos += sizes[tileFlags]
+    except IndexError:
+        raise ByteQueueInsufficientData()
+
+    if pos > len(data):
+        raise ByteQueueInsufficientData()
+
+    mf._mapData = data
+    mf._rowOffsets = offsets
+    mf._rowsPending = MAP_SIZE_Y
 
-def loadMapFile(mapNum, fileNameBasePath):
-    """Carga un mapa"""
+    return pos
+
+def loadMapFile(mapNum, fileNameBasePath, lazy=False):
+    """
+    Carga un mapa.
+
+    Con lazy=True el .map se recorre una sola vez leyendo los flags de cada
+    tile (blocked) y las capas y el trigger de cada fila se decodifican con
+    el primer acceso (ver MapFile.decodeRow). Del .inf salen las salidas,
+    NPCs y objetos, que el GameMap necesita enseguida, asi que se lee
+    completo igual que antes.
+    """
 
 
     fileNameMap = os.path.join(fileNameBasePath, 'Mapa%d.map' % mapNum)
@@ -100,10 +377,8 @@ def loadMapFile(mapNum, fileNameBasePath):
     mf = MapFile(mapNum)
 
     # Map header
-    mf.mapVers = mapData.readInt16()
-    mf.mapDesc = mapData.readStringFixed(255)
-    mf.mapCrc = mapData.readInt32()
-    mf.mapMagicWord = mapData.readInt32()
+    mf.mapVers, mf.mapDesc, mf.mapCrc, mf.mapMagicWord = \
+        mapData.readStruct(MAP_HEADER)
 
     # Dat data
     datSection = "Mapa%d" % mapNum
@@ -132,53 +407,281 @@ def loadMapFile(mapNum, fileNameBasePath):
         pass
 
     # ???
-    mapData.readDouble()
+    mapData.readStruct(MAP_HEADER_TAIL)
 
     # Inf header
     # FIXME: ???
-    infData.readDouble()
-    infData.readInt16()
+    infData.readStruct(INF_HEADER)
 
-    for y in xrange(1, MAP_SIZE_Y+1):
-        for x in xrange(1, MAP_SIZE_X+1):
-            tile = MapFileTile()
+    # Tiles del .map, directamente sobre el buffer.
+    if lazy:
+        _scanMapRows(mf, mapData.data, mapData.pos)
+    else:
+        pos = mapData.pos
+        for row in xrange(MAP_SIZE_Y):
+            pos = _decodeMapRow(mf, mapData.data, pos, row)
 
-            tileFlags = mapData.readInt8()
+    readInf = infData.readStruct
+    readInfFlags = infData.readInt8
 
-            tile.blocked = bool(tileFlags & 1)
-
-            # Graphics.
-            tile.layers[0] = mapData.readInt16()
-            if tileFlags & 2:
-                tile.layers[1] = mapData.readInt16()
-            if tileFlags & 4:
-                tile.layers[2] = mapData.readInt16()
-            if tileFlags & 8:
-                tile.layers[3] = mapData.readInt16()
+    npc, objidx, objcant = mf.npc, mf.objidx, mf.objcant
 
-            # Trigger.
-            if tileFlags & 16:
-                tile.trigger = mapData.readInt16()
+    for idx in xrange(MAP_TILES):
+        tileFlags = readInfFlags()
 
-            tileFlags = infData.readInt8()
+        if tileFlags & 7:
+            vals = readInf(INF_TILE_STRUCTS[tileFlags & 7])
+            i = 0
 
-            # Exit.
+            # Exit: Map, X, Y.
             if tileFlags & 1:
-                # Map, X, Y.
-                tile.exit = (infData.readInt16(), infData.readInt16(), \
-                    infData.readInt16())
+                mf.exits[idx] = vals[0:3]
+                i = 3
 
-            # NPC.
+            # NPC: NpcIndex
             if tileFlags & 2:
-                # NpcIndex
-                tile.npc = infData.readInt16()
+                npc[idx] = vals[i]
+                i += 1
 
-            # Obj.
+            # Obj: Index, Amount.
             if tileFlags & 4:
-                # Index, Amount.
-                tile.objidx, tile.objcant = (infData.readInt16(), infData.readInt16())
+                objidx[idx], objcant[idx] = vals[i], vals[i + 1]
 
-            mf.tiles.append(tile)
+    return mf
+
+# Mapas compilados.
+#
+# Formato (little endian):
+#
+#   header: magic, version, largo del bloque de metadatos.
+#   metadatos: dict serializado con marshal (mapNum, mapVers, mapDesc, mapCrc,
+#       mapMagicWord, opts, exits y los mtime de los archivos fuente),
+#       completado con ceros hasta un múltiplo de 8 bytes.
+#   blocked: MAP_TILES bytes.
+#   layers 1 a 4, trigger, npc, objidx, objcant: MAP_TILES int16 cada uno.
+#
+# Los datos de los tiles quedan alineados, para poder usarlos directamente
+# desde un mmap del archivo (ver loadCompiledMap).
+
+COMPILED_MAGIC = 'AOMC'
+COMPILED_VERSION = 2
+COMPILED_HEADER = getStruct('<4sHl')
+
+def _compiledDataOffset(metaLen):
+    pos = COMPILED_HEADER.size + metaLen
+    return (pos + 7) & ~7
+
+def compiledMapFileName(mapNum, compiledBasePath):
+    return os.path.join(compiledBasePath, 'Mapa%d.aomc' % mapNum)
+
+def sourceMtimes(mapNum, fileNameBasePath):
+    """Fechas de modificación de los map/inf/dat de un mapa."""
+
+    return tuple([os.path.getmtime(os.path.join(fileNameBasePath, \
+        'Mapa%d.%s' % (mapNum, ext))) for ext in ('map', 'inf', 'dat')])
+
+def _tileArrays(mf):
+    mf.decodeAll()
+    return mf.layers + [mf.trigger, mf.npc, mf.objidx, mf.objcant]
+
+def _mapMeta(mf, srcMtimes=None):
+    return {'mapNum': mf.mapNum, 'mapVers': mf.mapVers,
+        'mapDesc': mf.mapDesc, 'mapCrc': mf.mapCrc,
+        'mapMagicWord': mf.mapMagicWord, 'opts': mf.opts,
+        'exits': mf.exits, 'srcMtimes': srcMtimes}
+
+def dumpCompiledMap(mf, srcMtimes=None):
+    """Devuelve mf serializado en el formato compilado, como string."""
+
+    meta = marshal.dumps(_mapMeta(mf, srcMtimes))
+
+    ret = [COMPILED_HEADER.pack(COMPILED_MAGIC, COMPILED_VERSION, len(meta)),
+        meta, '\0' * (_compiledDataOffset(len(meta)) - \
+            COMPILED_HEADER.size - len(meta)),
+        str(bytearray(mf.blocked))]
+
+    for a in _tileArrays(mf):
+        a = array('h', a)
+        if sys.byteorder == 'big':
+            a.byteswap()
+        ret.append(a.tostring())
+
+    return ''.join(ret)
+
+def saveCompiledMap(mf, fileName, srcMtimes=None):
+    """Guarda mf en el formato compilado."""
+
+    # Los procesos que ya tenian mapeado el archivo anterior siguen usandolo
+    # sin problemas.
+    util.writeFileAtomic(fileName, [dumpCompiledMap(mf, srcMtimes)])
+
+def loadCompiledMap(fileName, srcMtimes=None, shared=False):
+    """
+    Carga un mapa compilado. Si srcMtimes no es None y no coincide con los
+    mtime guardados al compilarlo devuelve None, indicando que hay que
+    recompilarlo.
+
+    Con shared=True el archivo se abre con mmap y blocked, layers, trigger
+    y npc son vistas (ctypes) sobre el mapeo, sin copiar nada: todos los
+    procesos que cargan el mismo mapa comparten las mismas páginas
+    físicas, y "cargar" el mapa se reduce a los page faults de los datos
+    que realmente se leen. El mapeo es copy-on-write, asi que si algo
+    modifica esos datos el cambio queda en el proceso que lo hizo.
+    objidx y objcant, que cambian durante el juego, se copian siempre.
+    """
+
+    if shared and sys.byteorder != 'little':
+        shared = False
+
+    with open(fileName, 'rb') as f:
+        if shared:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        else:
+            data = f.read()
+
+    return parseCompiledMap(data, srcMtimes, shared)
+
+def parseCompiledMap(data, srcMtimes=None, shared=False):
+    """
+    Arma un MapFile a partir de data, en el formato compilado (un string o,
+    con shared=True, un mmap). Ver loadCompiledMap.
+    """
+
+    magic, version, metaLen = COMPILED_HEADER.unpack_from(data, 0)
+    if magic != COMPILED_MAGIC or version != COMPILED_VERSION:
+        return None
+
+    pos = COMPILED_HEADER.size
+    meta = marshal.loads(data[pos:pos + metaLen])
+    pos = _compiledDataOffset(metaLen)
+
+    if srcMtimes is not None and meta['srcMtimes'] != srcMtimes:
+        return None
+
+    mf = MapFile(meta['mapNum'])
+    for k in ('mapVers', 'mapDesc', 'mapCrc', 'mapMagicWord', 'opts', \
+        'exits'):
+        setattr(mf, k, meta[k])
+
+    if shared:
+        mf.blocked = (ctypes.c_uint8 * MAP_TILES).from_buffer(data, pos)
+    else:
+        mf.blocked = bytearray(data[pos:pos + MAP_TILES])
+    pos += MAP_TILES
+
+    arrays = []
+    for x in xrange(8):
+        # Los ultimos dos son objidx y objcant.
+        if shared and x < 6:
+            a = (ctypes.c_int16 * MAP_TILES).from_buffer(data, pos)
+        else:
+            a = array('h')
+            a.fromstring(data[pos:pos + MAP_TILES * a.itemsize])
+            if sys.byteorder == 'big':
+                a.byteswap()
+        arrays.append(a)
+        pos += MAP_TILES * 2
+
+    mf.layers = arrays[:4]
+    mf.trigger, mf.npc, mf.objidx, mf.objcant = arrays[4:]
 
     return mf
 
+def compileMap(mapNum, fileNameBasePath, compiledBasePath, force=False):
+    """
+    Compila un mapa si el compilado no existe o si cambió alguno de los
+    archivos fuente. Devuelve el MapFile y True si hubo que compilarlo.
+    """
+
+    srcMtimes = sourceMtimes(mapNum, fileNameBasePath)
+    fileName = compiledMapFileName(mapNum, compiledBasePath)
+
+    if not force and os.path.isfile(fileName):
+        mf = loadCompiledMap(fileName, srcMtimes)
+        if mf is not None:
+            return mf, False
+
+    mf = loadMapFile(mapNum, fileNameBasePath)
+    saveCompiledMap(mf, fileName, srcMtimes)
+    return mf, True
+
+def loadMap(mapNum, fileNameBasePath, compiledBasePath=None, shared=False, \
+    lazy=False):
+    """
+    Carga un mapa. Si compiledBasePath no es None usa el mapa compilado,
+    generándolo antes si no existe o está desactualizado. shared indica
+    si se usa mmap (ver loadCompiledMap). lazy se usa solamente sin
+    compilados (ver loadMapFile).
+    """
+
+    if not compiledBasePath:
+        return loadMapFile(mapNum, fileNameBasePath, lazy)
+
+    if not os.path.isdir(compiledBasePath):
+        try:
+            os.makedirs(compiledBasePath)
+        except OSError:
+            # Otro thread lo pudo haber creado recien.
+            if not os.path.isdir(compiledBasePath):
+                raise
+
+    if shared:
+        fileName = compiledMapFileName(mapNum, compiledBasePath)
+        srcMtimes = sourceMtimes(mapNum, fileNameBasePath)
+
+        if os.path.isfile(fileName):
+            mf = loadCompiledMap(fileName, srcMtimes, True)
+            if mf is not None:
+                return mf
+
+        compileMap(mapNum, fileNameBasePath, compiledBasePath, True)
+        return loadCompiledMap(fileName, None, True)
+
+    return compileMap(mapNum, fileNameBasePath, compiledBasePath)[0]
+
+def loadMapMeta(mapNum, fileNameBasePath, compiledBasePath=None):
+    """
+    Devuelve los datos de un mapa salvo los tiles (mapVers, opts, exits,
+    etc) como dict. Con compiledBasePath se leen solamente los metadatos
+    del mapa compilado, compilandolo antes si hace falta.
+    """
+
+    if not compiledBasePath:
+        # Los metadatos no incluyen las capas: no hace falta decodificarlas.
+        return _mapMeta(loadMapFile(mapNum, fileNameBasePath, True))
+
+    fileName = compiledMapFileName(mapNum, compiledBasePath)
+    srcMtimes = sourceMtimes(mapNum, fileNameBasePath)
+
+    if os.path.isfile(fileName):
+        with open(fileName, 'rb') as f:
+            magic, version, metaLen = COMPILED_HEADER.unpack( \
+                f.read(COMPILED_HEADER.size))
+            if magic == COMPILED_MAGIC and version == COMPILED_VERSION:
+                meta = marshal.loads(f.read(metaLen))
+                if meta['srcMtimes'] == srcMtimes:
+                    return meta
+
+    return _mapMeta(loadMap(mapNum, fileNameBasePath, compiledBasePath), \
+        srcMtimes)
+
+def loadMapWorker(args):
+    """
+    Para usar con multiprocessing: carga el mapa en el proceso hijo y
+    devuelve (mapNum, el mapa serializado con dumpCompiledMap, segundos).
+    Con shared solamente se asegura de que el compilado este al dia y
+    devuelve None en lugar del mapa, ya que el proceso principal lo abre
+    con mmap.
+    """
+
+    mapNum, fileNameBasePath, compiledBasePath, shared = args
+
+    t = time.time()
+    if shared:
+        compileMap(mapNum, fileNameBasePath, compiledBasePath)
+        data = None
+    else:
+        data = dumpCompiledMap(loadMap(mapNum, fileNameBasePath, \
+            compiledBasePath))
+
+    return mapNum, data, time.time() - t
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Indice de los objetos que hay en el piso de un mapa.
+
+Los objetos viven en los tiles del MapFile; este indice guarda solamente los
+tiles que tienen algo, asi las consultas cuestan en funcion de la cantidad
+de objetos y no del tamaño del mapa. GameMap lo mantiene sincronizado y lo
+usa para armar los ObjectCreate de cada sector y para levantar objetos sin
+tocar los tiles. Ademas guarda en que tiles esta cada objidx, para buscar
+el tile mas cercano con un objeto dado (nearest).
+
+SectorPackets guarda los ObjectCreate ya serializados de un sector. Tambien
+esta la busqueda de un tile donde dejar un objeto (findDropPos).
+"""
+
+import sys, util
+from constants import MAP_SIZE_X, MAP_SIZE_Y, MAXINVITEMS
+
+# Estados de un tile para dejar objetos (ver GameMap._dropState).
+DROP_NO = 0         # Bloqueado, con un jugador o con una pila llena.
+DROP_EMPTY = 1      # Libre y sin objetos.
+DROP_STACK = 2      # Libre y con un objeto que se puede apilar.
+
+# Desplazamientos (dx, dy, didx) en el orden de util.espiral, calculados
+# una sola vez. didx es el desplazamiento en indice de tile.
+SPIRAL_OFFSETS = tuple([(x, y, x + y * MAP_SIZE_X) \
+    for x, y in util.espiral((0, 0))])
+
+# Radio de la espiral: si pos esta a mas de esto de los bordes no hace falta
+# revisar los limites del mapa.
+SPIRAL_RADIUS = max([max(abs(x), abs(y)) for x, y, d in SPIRAL_OFFSETS])
+
+class MapObjectsIndex(object):
+    """
+    byPos: (x, y) -> (objidx, cantidad)
+    byObj: objidx -> set([(x, y), ...])
+    """
+
+    __slots__ = ('byPos', 'byObj', )
+
+    def __init__(self):
+        self.byPos = {}
+        self.byObj = {}
+
+    def __len__(self):
+        return len(self.byPos)
+
+    def __contains__(self, pos):
+        return tuple(pos) in self.byPos
+
+    def get(self, x, y):
+        """Devuelve (objidx, cantidad) o None si el tile esta vacio."""
+        return self.byPos.get((x, y))
+
+    def set(self, x, y, objidx, amount):
+        """Actualiza el tile (x, y). Con objidx None se vacia."""
+
+        pos = (x, y)
+        old = self.byPos.get(pos)
+
+        if old is not None and old[0] != objidx:
+            positions = self.byObj[old[0]]
+            positions.discard(pos)
+            if not positions:
+                del self.byObj[old[0]]
+
+        if objidx is None:
+            if old is not None:
+                del self.byPos[pos]
+        else:
+            self.byPos[pos] = (objidx, amount)
+            self.byObj.setdefault(objidx, set()).add(pos)
+
+    def memoryUsage(self):
+        """
+        Bytes aproximados de los dos dicts y de las tuplas y sets que
+        guardan. Las tuplas (x, y) son las mismas en byPos y byObj, y los
+        numeros chicos son compartidos: no se cuentan.
+        """
+
+        total = sys.getsizeof(self.byPos) + sys.getsizeof(self.byObj)
+        if self.byPos:
+            pos, obj = next(self.byPos.iteritems())
+            total += len(self.byPos) * (sys.getsizeof(pos) + \
+                sys.getsizeof(obj))
+        for positions in self.byObj.itervalues():
+            total += sys.getsizeof(positions)
+        return total
+
+    def items(self):
+        """Lista de (x, y, objidx, cantidad)."""
+        return [(p[0], p[1], o[0], o[1]) for p, o in self.byPos.iteritems()]
+
+    def inRect(self, x1, y1, x2, y2):
+        """
+        Lista de (x, y, objidx, cantidad) dentro del rectangulo, bordes
+        incluidos.
+        """
+
+        return [(p[0], p[1], o[0], o[1]) for p, o in self.byPos.iteritems() \
+            if x1 <= p[0] <= x2 and y1 <= p[1] <= y2]
+
+    def positionsOf(self, objidx):
+        """Lista de los (x, y) que tienen el objeto objidx."""
+        return list(self.byObj.get(objidx, ()))
+
+    def nearest(self, objidx, pos):
+        """
+        Devuelve el (x, y) mas cercano a pos (distancia Manhattan) que tenga
+        el objeto objidx, o None si no hay ninguno en el mapa.
+        """
+
+        positions = self.byObj.get(objidx)
+        if not positions:
+            return None
+
+        x, y = pos
+        return min(positions, key=lambda p: abs(p[0] - x) + abs(p[1] - y))
+
+class SectorPackets(object):
+    """
+    Paquetes ya serializados de los objetos de un sector (los ObjectCreate),
+    uno por tile y todos de size bytes, seguidos en un bytearray. Poner,
+    cambiar o sacar el paquete de un tile modifica solamente su registro:
+    al sacar uno, el ultimo pasa a ocupar su lugar.
+
+    data: los paquetes, listos para enviar.
+    slots: (x, y) -> numero de registro del tile en data.
+    order: numero de registro -> (x, y).
+    """
+
+    __slots__ = ('size', 'data', 'slots', 'order', )
+
+    def __init__(self, size):
+        self.size = size
+        self.data = bytearray()
+        self.slots = {}
+        self.order = []
+
+    def __len__(self):
+        return len(self.order)
+
+    def memoryUsage(self):
+        """Bytes de los paquetes y de los indices."""
+
+        total = sys.getsizeof(self.data) + sys.getsizeof(self.slots) + \
+            sys.getsizeof(self.order)
+        if self.order:
+            total += len(self.order) * sys.getsizeof(self.order[0])
+        return total
+
+    def set(self, pos, packet):
+        assert len(packet) == self.size
+
+        n = self.slots.get(pos)
+        if n is None:
+            self.slots[pos] = len(self.order)
+            self.order.append(pos)
+            self.data += packet
+        else:
+            self.data[n * self.size:(n + 1) * self.size] = packet
+
+    def remove(self, pos):
+        n = self.slots.pop(pos, None)
+        if n is None:
+            return
+
+        size = self.size
+        data = self.data
+        last = len(self.order) - 1
+        lastPos = self.order.pop()
+
+        if n != last:
+            data[n * size:(n + 1) * size] = data[last * size:]
+            self.order[n] = lastPos
+            self.slots[lastPos] = n
+
+        del data[last * size:]
+
+def findDropPos(dropState, objidxs, objcants, objidx, amount, pos):
+    """
+    Busca en espiral alrededor de pos un tile donde dejar amount del objeto
+    objidx: uno vacio o uno con el mismo objeto y lugar para apilarlo.
+    dropState, objidxs y objcants estan indexados por indice de tile.
+    Devuelve el indice del tile o None.
+    """
+
+    x, y = pos
+    start = (x - 1) + (y - 1) * MAP_SIZE_X
+
+    if SPIRAL_RADIUS < x <= MAP_SIZE_X - SPIRAL_RADIUS and \
+        SPIRAL_RADIUS < y <= MAP_SIZE_Y - SPIRAL_RADIUS:
+        # Lejos de los bordes: no hace falta revisar los limites.
+        for dx, dy, d in SPIRAL_OFFSETS:
+            idx = start + d
+            s = dropState[idx]
+            if s == DROP_EMPTY:
+                return idx
+            if s == DROP_STACK and objidxs[idx] == objidx and \
+                objcants[idx] + amount <= MAXINVITEMS:
+                return idx
+    else:
+        for dx, dy, d in SPIRAL_OFFSETS:
+            nx, ny = x + dx, y + dy
+            if nx < 1 or nx > MAP_SIZE_X or ny < 1 or ny > MAP_SIZE_Y:
+                continue
+            idx = start + d
+            s = dropState[idx]
+            if s == DROP_EMPTY:
+                return idx
+            if s == DROP_STACK and objidxs[idx] == objidx and \
+                objcants[idx] + amount <= MAXINVITEMS:
+                return idx
+
+    return None
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Capa de red: el loop de eventos, los timers y el servidor TCP.
+
+Hay dos backends, que se eligen con NetworkBackend en serversettings.txt:
+
+    Twisted: el reactor de Twisted (epoll en Linux, IOCP en Windows).
+    asyncio: trollius, el port de asyncio para Python 2.
+
+Las conexiones son siempre AoProtocol, que ve un transport con la interfaz
+de Twisted (write, loseConnection, abortConnection, getPeer,
+registerProducer y pauseProducing/resumeProducing para dejar de leer) y
+recibe makeConnection, dataReceived, connectionLost y, para el control de
+flujo de salida, pauseProducing/resumeProducing. Con asyncio el adaptador
+es AsyncioConnection.
+
+Los dos backends necesitan Twisted instalado: los resultados asincronicos
+(deferToThread, y la carga de mapas y el grafo del mundo en core.py) son
+Deferreds de twisted.internet.defer. Con asyncio solamente no se usa el
+reactor de Twisted.
+
+Los timers de loopingCall siguen corriendo aunque una llamada tire una
+excepcion: se muestra el traceback y se vuelve a programar.
+"""
+
+import sys, collections, traceback
+
+from twisted.internet import defer
+
+from util import debug_print
+
+def createBackend(name):
+    """Crea el backend de nombre name (sin importar mayusculas)."""
+
+    backends = {'twisted': TwistedBackend, 'asyncio': AsyncioBackend}
+
+    try:
+        cls = backends[name.lower()]
+    except KeyError:
+        raise ValueError("Backend de red desconocido: " + name)
+
+    return cls()
+
+def _logErrors(f):
+    """
+    Devuelve una funcion que llama a f y muestra sus excepciones en lugar de
+    propagarlas: task.LoopingCall deja de llamar a f despues de un error.
+    """
+
+    def call():
+        try:
+            f()
+        except Exception:
+            debug_print("Excepcion en un timer:", f.__name__)
+            traceback.print_exc()
+
+    return call
+
+class TwistedBackend(object):
+    name = 'Twisted'
+
+    def __init__(self):
+        # El reactor se instala antes del primer import de
+        # twisted.internet.reactor.
+        if sys.platform == 'linux2': # yeah!
+            # En Linux usamos el reactor epoll() que es lo más.
+            from twisted.internet import epollreactor
+            epollreactor.install()
+        elif sys.platform == 'win32': # rulz!
+            # En Windows usamos el reactor IOCP que es lo más.
+            from twisted.internet import iocpreactor
+            iocpreactor.install()
+
+        from twisted.internet import reactor
+        self.reactor = reactor
+
+    def describe(self):
+        return "Twisted, reactor: " + self.reactor.__class__.__name__
+
+    def listen(self, port, protocolClass):
+        from twisted.internet.protocol import Factory
+
+        factory = Factory()
+        factory.protocol = protocolClass
+        self.reactor.listenTCP(port, factory)
+
+    def callLater(self, delay, f, *args):
+        return self.reactor.callLater(delay, f, *args)
+
+    def loopingCall(self, interval, f):
+        """Llama a f ahora y despues cada interval segundos."""
+
+        from twisted.internet import task
+        task.LoopingCall(_logErrors(f)).start(interval)
+
+    def deferToThread(self, f, *args):
+        from twisted.internet import threads
+        return threads.deferToThread(f, *args)
+
+    def run(self):
+        self.reactor.run()
+
+    def stop(self):
+        self.reactor.stop()
+
+def _importAsyncio():
+    try:
+        import trollius
+    except ImportError:
+        raise ImportError("El backend asyncio requiere trollius")
+
+    return trollius
+
+Peer = collections.namedtuple('Peer', 'type host port')
+
+class AsyncioConnection(object):
+    """
+    Protocolo de asyncio que le presenta a un AoProtocol un transport con
+    la interfaz de Twisted.
+    """
+
+    __slots__ = ('prot', 'transport', )
+
+    def __init__(self, prot):
+        self.prot = prot
+        self.transport = None
+
+    # asyncio.Protocol
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.prot.makeConnection(self)
+
+    def data_received(self, data):
+        self.prot.dataReceived(data)
+
+    def eof_received(self):
+        # Cierra la conexion.
+        return False
+
+    def connection_lost(self, exc):
+        self.prot.connectionLost(exc)
+
+    def pause_writing(self):
+        self.prot.pauseProducing()
+
+    def resume_writing(self):
+        self.prot.resumeProducing()
+
+    # Transport para AoProtocol
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def loseConnection(self):
+        self.transport.close()
+
+    def abortConnection(self):
+        self.transport.abort()
+
+    def getPeer(self):
+        host, port = self.transport.get_extra_info('peername')[:2]
+        return Peer('TCP', host, port)
+
+    def registerProducer(self, producer, streaming):
+        # asyncio siempre avisa con pause_writing y resume_writing.
+        pass
+
+    def pauseProducing(self):
+        self.transport.pause_reading()
+
+    def resumeProducing(self):
+        self.transport.resume_reading()
+
+class AsyncioBackend(object):
+    name = 'asyncio'
+
+    def __init__(self):
+        self.asyncio = _importAsyncio()
+        self.loop = self.asyncio.get_event_loop()
+
+    def describe(self):
+        return "asyncio, loop: " + self.loop.__class__.__name__
+
+    def listen(self, port, protocolClass):
+        self.loop.run_until_complete(self.loop.create_server( \
+            lambda: AsyncioConnection(protocolClass()), port=port))
+
+    def callLater(self, delay, f, *args):
+        return self.loop.call_later(delay, f, *args)
+
+    def loopingCall(self, interval, f):
+        """
+        Llama a f ahora y despues cada interval segundos, como
+        task.LoopingCall: si una llamada se atrasa se saltean los
+        intervalos perdidos en lugar de acumularlos.
+        """
+
+        loop = self.loop
+        start = loop.time()
+        call = _logErrors(f)
+
+        def tick(n):
+            call()
+            n = max(n + 1, int((loop.time() - start) / interval) + 1)
+            loop.call_at(start + n * interval, tick, n)
+
+        loop.call_soon(tick, 0)
+
+    def deferToThread(self, f, *args):
+        d = defer.Deferred()
+
+        def done(future):
+            e = future.exception()
+            if e is not None:
+                d.errback(e)
+            else:
+                d.callback(future.result())
+
+        self.loop.run_in_executor(None, f, *args).add_done_callback(done)
+        return d
+
+    def run(self):
+        self.loop.run_forever()
+
+    def stop(self):
+        self.loop.stop()
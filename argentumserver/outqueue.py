@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Cola de salida con reemplazos, para las conexiones atrasadas.
+
+Cuando un cliente no lee lo que se le envia, muchos de los paquetes que se
+le acumulan quedan viejos antes de salir: cada CharacterMove de un mismo
+personaje reemplaza al anterior, y de UpdateHP, UpdateSta, etc. solamente
+importa el ultimo valor. Cada paquete de SUPERSEDE_KEYS tiene una clave
+(el PacketID mas los campos de la clave); al agregar uno nuevo se borra el
+pendiente con la misma clave y el nuevo va al final. El resto de los
+paquetes mantiene su orden.
+"""
+
+from aoprotocol import serverPackets, serverPacketsSchema, SCHEMA_TYPES
+from bytequeue import getStruct
+
+# Paquetes que se pueden reemplazar y los campos de la clave, que tienen
+# que ser los primeros del paquete.
+SUPERSEDE_KEYS = {
+    'CharacterMove': ('chridx', ),
+    'CharacterChange': ('chridx', ),
+    'PosUpdate': (),
+    'UpdateSta': (),
+    'UpdateMana': (),
+    'UpdateHP': (),
+    'UpdateGold': (),
+    'UpdateExp': (),
+    'UpdateUserStats': (),
+    'UpdateHungerAndThirst': (),
+}
+
+def _supersedeTable():
+    """
+    Arma la tabla PacketID -> (largo de la clave, largo del paquete). La
+    clave de un paquete son sus primeros bytes.
+    """
+
+    tbl = {}
+
+    for name, keyFields in SUPERSEDE_KEYS.iteritems():
+        fields = serverPacketsSchema[name]
+        assert tuple([f for f, t in fields[:len(keyFields)]]) == keyFields
+        assert 'String' not in [t for f, t in fields]
+
+        fmt = ''.join([SCHEMA_TYPES[t] for f, t in fields])
+        keyFmt = ''.join([SCHEMA_TYPES[t] for f, t in fields[:len(keyFields)]])
+
+        tbl[serverPackets[name]] = (getStruct('<B' + keyFmt).size, \
+            getStruct('<B' + fmt).size)
+
+    return tbl
+
+SUPERSEDE_TABLE = _supersedeTable()
+
+class CoalescingQueue(object):
+    """
+    Cola de paquetes ya serializados. add() recibe lo que escribio el
+    encoder para un paquete; si son varios paquetes juntos (un sendRaw) no
+    se reemplazan.
+    """
+
+    __slots__ = ('packets', 'keys', 'size', 'superseded', )
+
+    def __init__(self):
+        self.packets = []
+        self.keys = {}
+        self.size = 0
+        self.superseded = 0
+
+    def __len__(self):
+        """Bytes pendientes."""
+        return self.size
+
+    def add(self, data):
+        packets = self.packets
+
+        info = SUPERSEDE_TABLE.get(ord(data[0]))
+        if info is not None and len(data) == info[1]:
+            key = data[:info[0]]
+            old = self.keys.get(key)
+            if old is not None:
+                self.size -= len(packets[old])
+                packets[old] = None
+                self.superseded += 1
+            self.keys[key] = len(packets)
+
+        packets.append(data)
+        self.size += len(data)
+
+    def drain(self):
+        """Devuelve todos los paquetes pendientes juntos y vacia la cola."""
+
+        data = ''.join([x for x in self.packets if x is not None])
+        self.clear()
+        return data
+
+    def clear(self):
+        self.packets = []
+        self.keys = {}
+        self.size = 0
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Busqueda de caminos dentro de un mapa, para mover NPCs.
+
+MapNavigation trabaja sobre los tiles bloqueados del MapFile y sobre una
+secuencia de ocupacion (la grilla de colisiones del GameMap), ambas
+indexadas por (x - 1) + (y - 1) * MAP_SIZE_X. Los movimientos son en las 4
+direcciones.
+
+- Al crearse etiqueta las componentes conexas de los tiles no bloqueados,
+  asi reachable() descarta en O(1) los destinos imposibles sin correr A*.
+- findPath() es A* con distancia Manhattan; los tiles ocupados se evitan,
+  salvo el destino.
+- distanceField() es un BFS desde un tile (por ejemplo, un jugador al que
+  persiguen varios NPCs) que queda guardado hasta que cambie un tile que
+  lo afecte (ver tileChanged). stepToward() lo usa para dar un paso.
+
+Las componentes se calculan con los tiles bloqueados del MapFile, que no
+cambian mientras el mapa esta cargado.
+"""
+
+import sys, heapq, collections
+from array import array
+
+from constants import MAP_SIZE_X, MAP_SIZE_Y
+
+MAP_TILES = MAP_SIZE_X * MAP_SIZE_Y
+
+# Cantidad de campos de distancia guardados por mapa.
+MAX_DISTANCE_FIELDS = 16
+
+def _buildNeighbours():
+    ret = []
+    for idx in xrange(MAP_TILES):
+        x, y = idx % MAP_SIZE_X, idx // MAP_SIZE_X
+        n = []
+        if y > 0:
+            n.append(idx - MAP_SIZE_X)
+        if x < MAP_SIZE_X - 1:
+            n.append(idx + 1)
+        if y < MAP_SIZE_Y - 1:
+            n.append(idx + MAP_SIZE_X)
+        if x > 0:
+            n.append(idx - 1)
+        ret.append(tuple(n))
+    return ret
+
+# NEIGHBOURS[idx]: indices de los tiles vecinos de idx.
+NEIGHBOURS = _buildNeighbours()
+
+def posToIdx(pos):
+    return (pos[0] - 1) + (pos[1] - 1) * MAP_SIZE_X
+
+def idxToPos(idx):
+    return (idx % MAP_SIZE_X + 1, idx // MAP_SIZE_X + 1)
+
+class MapNavigation(object):
+    """
+    blocked: los tiles bloqueados del MapFile; no cambian.
+    occupied: secuencia donde un valor verdadero indica un tile ocupado.
+    """
+
+    __slots__ = ('blocked', 'occupied', 'components', '_fields', \
+        'hits', 'misses')
+
+    def __init__(self, blocked, occupied):
+        self.blocked = blocked
+        self.occupied = occupied
+        self.components = self._labelComponents()
+
+        # idx destino -> array de distancias, en orden de uso.
+        self._fields = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _labelComponents(self):
+        """
+        components[idx] es el numero de componente del tile, o 0 si esta
+        bloqueado.
+        """
+
+        blocked = self.blocked
+        comp = array('h', [0]) * MAP_TILES
+        label = 0
+
+        for start in xrange(MAP_TILES):
+            if comp[start] or blocked[start]:
+                continue
+
+            label += 1
+            comp[start] = label
+            stack = [start]
+            while stack:
+                idx = stack.pop()
+                for n in NEIGHBOURS[idx]:
+                    if not comp[n] and not blocked[n]:
+                        comp[n] = label
+                        stack.append(n)
+
+        return comp
+
+    def reachable(self, src, dst):
+        """True si se puede ir de src a dst ignorando la ocupacion."""
+
+        c = self.components[posToIdx(src)]
+        return c != 0 and c == self.components[posToIdx(dst)]
+
+    def findPath(self, src, dst, maxNodes=MAP_TILES):
+        """
+        Camino de src a dst como lista de posiciones, sin incluir src. None
+        si no hay camino o si se expandieron mas de maxNodes tiles.
+        """
+
+        if not self.reachable(src, dst):
+            return None
+
+        start, goal = posToIdx(src), posToIdx(dst)
+        if start == goal:
+            return []
+
+        occupied = self.occupied
+        blocked = self.blocked
+        gx, gy = goal % MAP_SIZE_X, goal // MAP_SIZE_X
+
+        prev = {start: None}
+        cost = {start: 0}
+        heap = [(abs(start % MAP_SIZE_X - gx) + \
+            abs(start // MAP_SIZE_X - gy), start)]
+        expanded = 0
+
+        while heap:
+            f, idx = heapq.heappop(heap)
+            if idx == goal:
+                path = []
+                while idx != start:
+                    path.append(idxToPos(idx))
+                    idx = prev[idx]
+                path.reverse()
+                return path
+
+            expanded += 1
+            if expanded > maxNodes:
+                return None
+
+            g = cost[idx] + 1
+            for n in NEIGHBOURS[idx]:
+                if blocked[n] or (occupied[n] and n != goal):
+                    continue
+                if n not in cost or g < cost[n]:
+                    cost[n] = g
+                    prev[n] = idx
+                    heapq.heappush(heap, (g + abs(n % MAP_SIZE_X - gx) + \
+                        abs(n // MAP_SIZE_X - gy), n))
+
+        return None
+
+    def distanceField(self, target):
+        """
+        Distancias (en pasos) desde cada tile hasta target, evitando los
+        tiles ocupados salvo el propio target. -1 si no se llega.
+        """
+
+        goal = posToIdx(target)
+        fields = self._fields
+
+        field = fields.pop(goal, None)
+        if field is not None:
+            self.hits += 1
+            fields[goal] = field
+            return field
+
+        self.misses += 1
+
+        blocked = self.blocked
+        occupied = self.occupied
+        field = array('h', [-1]) * MAP_TILES
+        field[goal] = 0
+        q = collections.deque([goal])
+
+        while q:
+            idx = q.popleft()
+            d = field[idx] + 1
+            for n in NEIGHBOURS[idx]:
+                if field[n] == -1 and not blocked[n] and not occupied[n]:
+                    field[n] = d
+                    q.append(n)
+
+        fields[goal] = field
+        if len(fields) > MAX_DISTANCE_FIELDS:
+            fields.popitem(False)
+
+        return field
+
+    def stepToward(self, pos, target):
+        """
+        Siguiente posicion para acercarse desde pos a target usando el campo
+        de distancias de target, o None si no hay un paso que acerque.
+        """
+
+        if not self.reachable(pos, target):
+            return None
+
+        field = self.distanceField(target)
+        occupied = self.occupied
+        idx = posToIdx(pos)
+
+        best, bestDist = None, field[idx]
+        if bestDist == -1:
+            bestDist = MAP_TILES
+
+        for n in NEIGHBOURS[idx]:
+            d = field[n]
+            if d != -1 and d < bestDist and (d == 0 or not occupied[n]):
+                best, bestDist = n, d
+
+        if best is None:
+            return None
+        return idxToPos(best)
+
+    def memoryUsage(self):
+        """Bytes de las componentes y de los campos de distancia."""
+
+        return sys.getsizeof(self.components) + \
+            sys.getsizeof(self._fields) + \
+            sum([sys.getsizeof(f) for f in self._fields.itervalues()])
+
+    def tileChanged(self, idx):
+        """
+        El tile idx paso de libre a ocupado o al reves. Descarta solamente
+        los campos de distancia que pueden cambiar: los que llegaban a idx,
+        si se ocupo, o a alguno de sus vecinos, si se libero.
+        """
+
+        fields = self._fields
+        if not fields:
+            return
+
+        # El propio destino siempre esta a distancia 0, ocupado o no.
+        if self.occupied[idx]:
+            stale = [goal for goal, field in fields.iteritems() \
+                if goal != idx and field[idx] != -1]
+        else:
+            near = NEIGHBOURS[idx]
+            stale = [goal for goal, field in fields.iteritems() \
+                if goal != idx and any(field[n] != -1 for n in near)]
+
+        for goal in stale:
+            del fields[goal]
+
+    def invalidate(self):
+        """Descarta todos los campos de distancia."""
+        self._fields.clear()
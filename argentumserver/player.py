@@ -142,6 +142,8 @@ class PlayerInventory(object):
         else:
             invs[1] -= amount
 
+        return objidx
+
     def sortItems(self):
         self.items.sort(key=(lambda x: sys.maxint if x[0] is None else x[0]))
 
@@ -168,6 +170,10 @@ class Player(object):
 
         self.closing = False
 
+        # True mientras se carga el mapa al que se esta moviendo; en ese
+        # tiempo map es None.
+        self.transferring = False
+
         cv.gameServer.playerJoin(self)
 
     def __repr__(self):
@@ -181,12 +187,16 @@ class Player(object):
 
     def start(self):
         
-        self.pos = [50, 50]
+        self.pos = list(HOME_POS)
         self.heading = DIR_S
         self.map = None # Cuando no esta en ningun mapa es None.
 
-        cv.mapData[1].playerJoin(self)
+        # Como en un cambio de mapa, si HOME_MAP no esta cargado se carga en
+        # otro thread. El resto del login se envia al entrar al mapa, asi el
+        # cliente recibe los paquetes en el mismo orden.
+        cv.mapData.playerTransfer(self, HOME_MAP, self.sendLoginData)
 
+    def sendLoginData(self):
         self.sendUpdateHungerAndThirst()
         self.sendUpdateUserStats()
         self.sendInventory()
@@ -202,7 +212,8 @@ class Player(object):
     def quit(self):
         if not self.closing:
             self.closing = True
-            self.map.playerLeave(self)
+            if self.map is not None:
+                self.map.playerLeave(self)
             cv.gameServer.playerLeave(self)
 
             self.prot.loseConnection()
@@ -292,6 +303,38 @@ class Player(object):
 
         return d
 
+    def onHome(self):
+        if self.map.mapNum == HOME_MAP:
+            self.m("Ya estas en tu hogar.")
+            return
+
+        cv.mapData.worldGraph().addCallback(self._homeRoute)
+
+    def _homeRoute(self, graph):
+        # Mientras se esperaba el grafo o el mapa el jugador pudo
+        # desconectarse o estar cambiando de mapa.
+        if self.closing or self.map is None:
+            return
+
+        route = graph.route(self.map.mapNum, HOME_MAP)
+        if route is None:
+            self.m("No hay camino hacia tu hogar.")
+            return
+
+        cv.mapData.load(HOME_MAP).addCallback(self._goHome, len(route))
+
+    def _goHome(self, m, distance):
+        if self.closing or self.map is None or self.map is m:
+            return
+
+        pos = m.closestFreePos(HOME_POS)
+        if pos is None:
+            self.m("No hay lugar libre en tu hogar.")
+            return
+
+        self.m("Volviendo a tu hogar, a %d mapas de distancia." % distance)
+        self.map.playerTeleport(self, HOME_MAP, pos)
+
     def onLookAtTile(self, x, y):
         self.cmdout.sendConsoleMsg("Nada.", FONTTYPES['INFO'])
 
@@ -316,17 +359,17 @@ class Player(object):
             self.onCustomCmd(msg[3:])
             return
 
-        for p in cv.gameServer.playersList():
-            p.cmdout.sendConsoleMsg(self.playerName + " %s (%d, %d): " % (act, self.pos[0], self.pos[1]) + msg, FONTTYPES['TALK'])
+        cv.gameServer.broadcast().sendConsoleMsg(self.playerName + " %s (%d, %d): " % (act, self.pos[0], self.pos[1]) + msg, FONTTYPES['TALK'])
 
     def doPickUp(self):
 
-        tile = self.map.mapFile[self.pos]
-        if tile.objidx is None:
+        found = self.map.objects.get(self.pos[0], self.pos[1])
+        if found is None:
             self.m("No hay nada para levantar.")
             return
 
-        objidx, amount = tile.objidx, tile.objcant
+        objidx, amount = found
+        tile = self.map.mapFile[self.pos]
         r, amount_left = self.inventario.addItem(objidx, amount)
         if amount_left > 0:
             self.m("No se pudieron levantar todos los items.")
@@ -334,6 +377,8 @@ class Player(object):
             tile.objidx = None
         tile.objcant = amount_left
 
+        self.map.onTileObjUpdated(self.pos)
+
         for x in r:
             self.sendInventory(x)
 
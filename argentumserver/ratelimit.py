@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Limites de paquetes por segundo de cada cliente, por tipo de paquete.
+
+Cada conexion tiene un token bucket por cada PacketID limitado: se llena a
+razon de "por segundo" tokens hasta "rafaga", y cada paquete consume uno.
+Si no hay tokens se aplica la accion configurada (ver RATE_ACTIONS). Los
+buckets se revisan en ClientCommandsDecoder.handleData.
+"""
+
+from aoprotocol import clientPackets
+
+RATE_DROP = 0
+RATE_DELAY = 1
+RATE_DISCONNECT = 2
+
+# drop: el paquete se descarta.
+# delay: el paquete y los que le siguen quedan en el buffer de entrada
+#   hasta el proximo tick (ver GameServer.inputDelayed).
+# disconnect: se cierra la conexion.
+RATE_ACTIONS = {'drop': RATE_DROP, 'delay': RATE_DELAY, \
+    'disconnect': RATE_DISCONNECT}
+
+def parseRateLimits(items):
+    """
+    Arma la tabla de limites a partir de items, una lista de (nombre del
+    paquete, "por segundo, rafaga, accion") como la devuelve
+    ConfigParser.items. Devuelve una lista indexada por PacketID con
+    (por segundo, rafaga, accion) o None si el paquete no tiene limite.
+    """
+
+    # ConfigParser devuelve los nombres en minusculas.
+    packets = dict([(k.lower(), v) for k, v in clientPackets.iteritems()])
+
+    limits = [None] * (max(clientPackets.values()) + 1)
+
+    for name, value in items:
+        if name.lower() not in packets:
+            raise ValueError("Paquete desconocido: " + name)
+
+        try:
+            rate, burst, action = [x.strip() for x in value.split(',')]
+            rate, burst = float(rate), float(burst)
+            action = RATE_ACTIONS[action.lower()]
+        except (ValueError, KeyError):
+            raise ValueError("Limite invalido para %s: %s" % (name, value))
+
+        if rate <= 0 or burst < 1:
+            raise ValueError("Limite invalido para %s: %s" % (name, value))
+
+        limits[packets[name.lower()]] = (rate, burst, action)
+
+    return limits
+
+class TokenBuckets(object):
+    """Los token buckets de una conexion, indexados por PacketID."""
+
+    __slots__ = ('tokens', 'stamps', 'hits', 'delayed', )
+
+    def __init__(self, limits, now):
+        self.tokens = [(lim[1] if lim is not None else 0.0) \
+            for lim in limits]
+        self.stamps = [now] * len(limits)
+
+        # PacketID -> veces que se aplico el limite.
+        self.hits = {}
+
+        # El primer paquete del buffer de entrada ya fue demorado (RATE_DELAY)
+        # y contado en hits; se vuelve a decodificar en cada reintento.
+        self.delayed = False
+
+    def take(self, cmd, limit, now):
+        """
+        Consume un token del paquete cmd, con limit = (por segundo, rafaga,
+        accion). Devuelve False si no habia. Los reintentos de un paquete
+        demorado no vuelven a contar en hits.
+        """
+
+        rate, burst = limit[0], limit[1]
+
+        tokens = self.tokens[cmd] + (now - self.stamps[cmd]) * rate
+        if tokens > burst:
+            tokens = burst
+        self.stamps[cmd] = now
+
+        if tokens >= 1.0:
+            self.tokens[cmd] = tokens - 1.0
+            self.delayed = False
+            return True
+
+        self.tokens[cmd] = tokens
+        if not self.delayed:
+            self.hits[cmd] = self.hits.get(cmd, 0) + 1
+        return False
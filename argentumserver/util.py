@@ -22,6 +22,7 @@
 Aca va todo lo que no encaja en otros modulos.
 """
 
+import os, tempfile
 from ConfigParser import SafeConfigParser
 
 def debug_print(*args):
@@ -58,6 +59,32 @@ def espiral(pos, lim=100):
         s = s * -1
         d = d + 1
 
+def writeFileAtomic(fileName, chunks):
+    """
+    Escribe los strings de chunks en fileName a traves de un temporal de
+    nombre unico en el mismo directorio, que despues se renombra: quien lee
+    nunca ve un archivo a medio escribir, y dos procesos o threads que
+    escriben el mismo archivo a la vez no se pisan el temporal.
+    """
+
+    fd, tmpName = tempfile.mkstemp(prefix=os.path.basename(fileName) + '.', \
+        suffix='.tmp', dir=os.path.dirname(fileName) or '.')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for c in chunks:
+                f.write(c)
+
+        # mkstemp crea el archivo con permisos 0600.
+        os.chmod(tmpName, 0644)
+        os.rename(tmpName, fileName)
+    except:
+        try:
+            os.remove(tmpName)
+        except OSError:
+            pass
+        raise
+
 class MyConfigParser(SafeConfigParser):
     def read(self, *args, **kwargs):
         ret = SafeConfigParser.read(self, *args, **kwargs)
@@ -96,6 +123,9 @@ class positiverolist(object):
             raise IndexError('negative')
         return self.data[i]
 
+    def __len__(self):
+        return len(self.data)
+
     def __setitem__(self, i, v):
         raise TypeError('read only list')
 
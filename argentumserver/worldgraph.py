@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Grafo del mundo: que mapas se conectan con cuales a traves de los tiles de
+salida.
+
+Se arma una sola vez, en otro thread al iniciar el servidor (ver
+GameMapList.buildWorldGraph), y responde consultas de caminos entre mapas
+sin recorrer tiles. Los caminos desde cada mapa de origen se calculan la
+primera vez que se piden y quedan guardados.
+"""
+
+import collections
+
+import mapfile
+
+class WorldGraph(object):
+    """
+    exits: mapNum -> lista de (x, y, mapa destino, x destino, y destino).
+    neighbours: mapNum -> tupla de mapas a los que se llega en un paso.
+    """
+
+    __slots__ = ('exits', 'neighbours', '_firstExit', '_trees', )
+
+    def __init__(self, exits):
+        self.exits = exits
+        self.neighbours = {}
+
+        # (origen, destino) -> primera salida de origen hacia destino.
+        self._firstExit = {}
+
+        # origen -> {mapa: mapa anterior en el camino desde origen}.
+        self._trees = {}
+
+        for m, mapExits in exits.iteritems():
+            for e in mapExits:
+                if e[2] != m:
+                    self._firstExit.setdefault((m, e[2]), e)
+            self.neighbours[m] = tuple(sorted(set([e[2] for e in mapExits \
+                if e[2] != m])))
+
+    def __len__(self):
+        return len(self.exits)
+
+    def _tree(self, src):
+        """Arbol de caminos minimos (en cantidad de mapas) desde src."""
+
+        tree = self._trees.get(src)
+        if tree is None:
+            tree = {src: None}
+            q = collections.deque([src])
+            neighbours = self.neighbours
+            while q:
+                m = q.popleft()
+                for m2 in neighbours.get(m, ()):
+                    if m2 not in tree:
+                        tree[m2] = m
+                        q.append(m2)
+            self._trees[src] = tree
+        return tree
+
+    def distance(self, src, dst):
+        """Cantidad de salidas a tomar para ir de src a dst, o None."""
+
+        tree = self._tree(src)
+        if dst not in tree:
+            return None
+
+        n = 0
+        while dst != src:
+            dst = tree[dst]
+            n += 1
+        return n
+
+    def route(self, src, dst):
+        """
+        Camino mas corto de src a dst: lista de salidas (mapa, x, y, mapa
+        destino, x destino, y destino), vacia si src == dst. None si no
+        hay camino.
+        """
+
+        tree = self._tree(src)
+        if dst not in tree:
+            return None
+
+        ret = []
+        while dst != src:
+            prev = tree[dst]
+            ret.append((prev, ) + self._firstExit[prev, dst])
+            dst = prev
+        ret.reverse()
+        return ret
+
+    def nearestExit(self, src, dst, pos):
+        """
+        La salida de src hacia el mapa vecino dst mas cercana a pos
+        (distancia Manhattan), o None.
+        """
+
+        x, y = pos
+        candidates = [e for e in self.exits.get(src, ()) if e[2] == dst]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda e: abs(e[0] - x) + abs(e[1] - y))
+
+def mapExits(exits):
+    """
+    Convierte las salidas de un MapFile (indice de tile -> (mapa, x, y)) en
+    una lista de (x, y, mapa, x, y).
+    """
+
+    ret = []
+    for idx, e in sorted(exits.iteritems()):
+        ret.append((idx % mapfile.MAP_SIZE_X + 1, \
+            idx // mapfile.MAP_SIZE_X + 1) + tuple(e))
+    return ret
+
+def loadWorldGraph(mapCount, fileNameBasePath, compiledBasePath=None, \
+    loadedExits=None):
+    """
+    Arma el grafo leyendo las salidas de los mapas 1 a mapCount. Con
+    compiledBasePath se leen solamente los metadatos de los mapas
+    compilados, sin cargar los tiles. loadedExits es un dict mapNum ->
+    salidas del MapFile para los mapas que ya estan en memoria, que no se
+    vuelven a leer. Los mapas que no existen se omiten.
+    """
+
+    exits = {}
+
+    for mapNum in xrange(1, mapCount + 1):
+        if loadedExits and mapNum in loadedExits:
+            exits[mapNum] = mapExits(loadedExits[mapNum])
+            continue
+
+        try:
+            exits[mapNum] = mapExits(mapfile.loadMapMeta(mapNum, \
+                fileNameBasePath, compiledBasePath)['exits'])
+        except (IOError, OSError):
+            continue
+
+    return WorldGraph(exits)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests de la decodificacion de los comandos del cliente
+(ClientCommandsDecoder.handleData).
+"""
+
+import sys, os, unittest, struct
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.aocommands import ClientCommandsDecoder, \
+    CriticalDecoderException
+from argentumserver.aoprotocol import clientPackets, lastClientPacketID
+from argentumserver.bytequeue import ByteQueue
+from argentumserver.ratelimit import parseRateLimits
+from argentumserver import corevars
+
+WALK = clientPackets['Walk']
+TALK = clientPackets['Talk']
+WHISPER = clientPackets['Whisper']
+
+def walk(heading):
+    return struct.pack('<BB', WALK, heading)
+
+def talk(msg):
+    return struct.pack('<Bh', TALK, len(msg)) + msg
+
+def whisper(target, msg):
+    return struct.pack('<Bhh', WHISPER, target, len(msg)) + msg
+
+class FakeProt(object):
+    """Lo que handleData usa de un AoProtocol."""
+
+    def __init__(self):
+        self._ao_inbuff = ByteQueue()
+        self._ao_closing = False
+        self.rateBuckets = None
+        self.player = None
+        self.lastHandledPacket = None
+
+class FakeGameServer(object):
+    def __init__(self):
+        self.delayed = []
+
+    def inputDelayed(self, prot):
+        self.delayed.append(prot)
+
+class HandleDataTest(unittest.TestCase):
+    def setUp(self):
+        self.decoder = ClientCommandsDecoder()
+        self.prot = FakeProt()
+        self.calls = []
+
+        # Los handlers se reemplazan para registrar los campos decodificados.
+        for cmd in (WALK, TALK, WHISPER):
+            self.decoder.cmds[cmd] = self.recorder(cmd)
+
+        self.oldGameServer = corevars.gameServer
+        corevars.gameServer = FakeGameServer()
+
+    def tearDown(self):
+        corevars.gameServer = self.oldGameServer
+
+    def recorder(self, cmd):
+        def handler(prot, *args):
+            self.assertTrue(prot is self.prot)
+            self.calls.append((cmd,) + args)
+        return handler
+
+    def feed(self, data, budget=None):
+        self.prot._ao_inbuff.addData(data)
+        return self.decoder.handleData(self.prot, budget)
+
+    def test_fields(self):
+        self.assertFalse(self.feed(walk(3) + talk('hola') + \
+            whisper(7, 'che') + talk('')))
+        self.assertEqual(self.calls, [(WALK, 3), (TALK, 'hola'), \
+            (WHISPER, 7, 'che'), (TALK, '')])
+        self.assertEqual(len(self.prot._ao_inbuff), 0)
+        self.assertTrue(self.prot.lastHandledPacket is not None)
+
+    def test_split(self):
+        # Paquetes cortados en dos lecturas en cualquier posicion.
+        data = whisper(1, 'hola') + walk(2) + talk('chau')
+        expected = [(WHISPER, 1, 'hola'), (WALK, 2), (TALK, 'chau')]
+
+        for n in xrange(len(data) + 1):
+            self.setUp()
+            self.feed(data[:n])
+            self.feed(data[n:])
+            self.assertEqual(self.calls, expected, n)
+            self.assertEqual(len(self.prot._ao_inbuff), 0)
+
+    def test_byteByByte(self):
+        packets = [talk('hola'), walk(1), whisper(300, 'x' * 40)]
+        data = ''.join(packets)
+
+        # Cada handler se llama recien con el ultimo byte de su paquete.
+        ends = [len(''.join(packets[:n + 1])) for n in xrange(len(packets))]
+
+        for n, c in enumerate(data):
+            self.feed(c)
+            self.assertEqual(len(self.calls), \
+                len([e for e in ends if e <= n + 1]), n)
+
+        self.assertEqual(self.calls, [(TALK, 'hola'), (WALK, 1), \
+            (WHISPER, 300, 'x' * 40)])
+        self.assertEqual(len(self.prot._ao_inbuff), 0)
+
+    def test_incompleteNotHandled(self):
+        self.feed(walk(1) + talk('hola')[:-1])
+        self.assertEqual(self.calls, [(WALK, 1)])
+        self.assertEqual(len(self.prot._ao_inbuff), len(talk('hola')) - 1)
+
+    def test_negativeStringLength(self):
+        self.assertRaises(CriticalDecoderException, self.feed, \
+            struct.pack('<Bh', TALK, -1) + 'hola')
+        self.assertEqual(self.calls, [])
+
+    def test_unknownPacket(self):
+        self.assertRaises(CriticalDecoderException, self.feed, \
+            walk(1) + chr(lastClientPacketID + 1))
+        self.assertEqual(self.calls, [(WALK, 1)])
+
+    def test_packetWithoutHandler(self):
+        self.decoder.cmds[WALK] = None
+        self.assertRaises(CriticalDecoderException, self.feed, walk(1))
+
+    def test_budget(self):
+        data = walk(1) + walk(2) + walk(3)
+
+        self.assertTrue(self.feed(data, 2))
+        self.assertEqual(self.calls, [(WALK, 1), (WALK, 2)])
+        self.assertEqual(str(self.prot._ao_inbuff.data[ \
+            self.prot._ao_inbuff.pos:]), walk(3))
+
+        self.assertFalse(self.feed('', 2))
+        self.assertEqual(self.calls, [(WALK, 1), (WALK, 2), (WALK, 3)])
+        self.assertEqual(len(self.prot._ao_inbuff), 0)
+
+    def test_rateLimitDrop(self):
+        self.decoder.setRateLimits(parseRateLimits([('Walk', \
+            '0.01, 1, drop')]))
+
+        self.feed(walk(1) + walk(2) + talk('hola') + walk(3))
+        self.assertEqual(self.calls, [(WALK, 1), (TALK, 'hola')])
+        self.assertEqual(len(self.prot._ao_inbuff), 0)
+        self.assertEqual(self.prot.rateBuckets.hits, {WALK: 2})
+        self.assertEqual(corevars.gameServer.delayed, [])
+
+    def test_rateLimitDelay(self):
+        self.decoder.setRateLimits(parseRateLimits([('Walk', \
+            '0.01, 1, delay')]))
+
+        rest = walk(2) + talk('hola')
+        self.feed(walk(1) + rest)
+        self.assertEqual(self.calls, [(WALK, 1)])
+        self.assertEqual(len(self.prot._ao_inbuff), len(rest))
+        self.assertEqual(corevars.gameServer.delayed, [self.prot])
+        self.assertTrue(self.prot.rateBuckets.delayed)
+
+        # Cada reintento vuelve a demorar el mismo paquete sin contarlo.
+        self.feed('')
+        self.assertEqual(self.calls, [(WALK, 1)])
+        self.assertEqual(self.prot.rateBuckets.hits, {WALK: 1})
+
+    def test_rateLimitDisconnect(self):
+        self.decoder.setRateLimits(parseRateLimits([('Walk', \
+            '0.01, 1, disconnect')]))
+
+        self.assertRaises(CriticalDecoderException, self.feed, \
+            walk(1) + walk(2))
+        self.assertEqual(self.calls, [(WALK, 1)])
+
+    def test_closing(self):
+        self.prot._ao_closing = True
+        self.feed(walk(1))
+        self.assertEqual(self.calls, [])
+
+if __name__ == '__main__':
+    unittest.main()
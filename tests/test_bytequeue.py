@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests de ByteQueue: lecturas sobre el buffer y compactacion en commit().
+
+Se corren desde la raiz del repositorio con:
+
+    python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.bytequeue import ByteQueue, ByteQueueInsufficientData, \
+    COMPACT_MIN_BYTES
+
+class CommitTest(unittest.TestCase):
+    def test_nothingRead(self):
+        q = ByteQueue('abc')
+        q.commit()
+        self.assertEqual((q.pos, len(q.data), len(q)), (0, 3, 3))
+
+    def test_smallNotCompacted(self):
+        q = ByteQueue('abcdef')
+        q.readRaw(4)
+        q.commit()
+        self.assertEqual((q.pos, len(q.data)), (4, 6))
+        self.assertEqual(q.readRaw(), 'ef')
+
+    def test_rollbackStopsAtCommit(self):
+        q = ByteQueue('abcdef')
+        q.readRaw(2)
+        q.commit()
+        q.readRaw(2)
+        q.rollback()
+        self.assertEqual(q.readRaw(), 'cdef')
+
+    def test_compactWhenHalfConsumed(self):
+        n = COMPACT_MIN_BYTES
+        q = ByteQueue('x' * n + 'tail')
+        q.readRaw(n)
+        q.commit()
+        self.assertEqual((q.pos, q.markpos), (0, 0))
+        self.assertEqual(str(q.data), 'tail')
+
+    def test_noCompactWhenLessThanHalf(self):
+        n = COMPACT_MIN_BYTES
+        q = ByteQueue('x' * n + 'y' * (n + 1))
+        q.readRaw(n)
+        q.commit()
+        self.assertEqual(q.pos, n)
+        self.assertEqual(len(q), n + 1)
+
+    def test_fullyConsumed(self):
+        q = ByteQueue('x' * (COMPACT_MIN_BYTES * 2))
+        q.readRaw()
+        q.commit()
+        self.assertEqual((q.pos, len(q.data), len(q)), (0, 0, 0))
+
+    def test_fullyConsumedSmallKeepsBuffer(self):
+        q = ByteQueue('abc')
+        q.readRaw()
+        q.commit()
+        self.assertEqual((q.pos, len(q.data), len(q)), (3, 3, 0))
+
+    def test_readAfterCompactAndAdd(self):
+        # readRaw corta de una vista que tiene que seguir al bytearray
+        # despues de que commit y addData le cambian el tamaño.
+        q = ByteQueue('x' * COMPACT_MIN_BYTES + 'ab')
+        q.readRaw(COMPACT_MIN_BYTES)
+        q.commit()
+        q.addData('cd' * COMPACT_MIN_BYTES)
+        self.assertEqual(q.readRaw(4), 'abcd')
+        self.assertEqual(len(q), 2 * COMPACT_MIN_BYTES - 2)
+
+class ReadTest(unittest.TestCase):
+    def test_readRawType(self):
+        q = ByteQueue('abc')
+        self.assertTrue(type(q.readRaw(1)) is str)
+        self.assertTrue(type(q.readRaw()) is str)
+
+    def test_readRawInsufficient(self):
+        q = ByteQueue('abc')
+        self.assertRaises(ByteQueueInsufficientData, q.readRaw, 4)
+        self.assertEqual(q.pos, 0)
+
+    def test_takeFrom(self):
+        q = ByteQueue('abcdef')
+        q.readRaw(1)
+        self.assertEqual(q.takeFrom(2), 'def')
+        self.assertEqual(q.readRaw(), 'bc')
+
+    def test_roundTrip(self):
+        q = ByteQueue()
+        q.writeInt8(7)
+        q.writeInt16(-2)
+        q.writeInt32(1 << 20)
+        q.writeString('hola')
+        self.assertEqual((q.readInt8(), q.readInt16(), q.readInt32(), \
+            q.readString()), (7, -2, 1 << 20, 'hola'))
+        self.assertEqual(len(q), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests de la grilla de colisiones (ver collision.py).
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.collision import CollisionGrid, BLOCKED, OCCUPIED
+from argentumserver.constants import MAP_SIZE_X, MAP_SIZE_Y
+
+def idxOf(x, y):
+    return (x - 1) + (y - 1) * MAP_SIZE_X
+
+class CollisionGridTest(unittest.TestCase):
+    def setUp(self):
+        blocked = bytearray(MAP_SIZE_X * MAP_SIZE_Y)
+        blocked[idxOf(3, 3)] = 1
+        self.grid = CollisionGrid(blocked)
+
+    def test_blocked(self):
+        self.assertEqual(self.grid.grid[idxOf(3, 3)], BLOCKED)
+        self.assertFalse(self.grid.isFree((3, 3)))
+        self.assertTrue(self.grid.isFree((3, 4)))
+
+    def test_outside(self):
+        for pos in ((0, 1), (1, 0), (MAP_SIZE_X + 1, 1), (1, MAP_SIZE_Y + 1)):
+            self.assertFalse(self.grid.isFree(pos))
+        self.assertTrue(self.grid.isFree((MAP_SIZE_X, MAP_SIZE_Y)))
+
+    def test_occupied(self):
+        g = self.grid
+        g.setOccupied(idxOf(5, 5), True)
+        self.assertEqual(g.grid[idxOf(5, 5)], OCCUPIED)
+        self.assertFalse(g.isFree((5, 5)))
+        g.setOccupied(idxOf(5, 5), False)
+        self.assertTrue(g.isFree((5, 5)))
+
+    def test_occupiedKeepsBlocked(self):
+        # Liberar un tile bloqueado no lo deja libre.
+        g = self.grid
+        g.setOccupied(idxOf(3, 3), True)
+        self.assertEqual(g.grid[idxOf(3, 3)], BLOCKED | OCCUPIED)
+        g.setOccupied(idxOf(3, 3), False)
+        self.assertEqual(g.grid[idxOf(3, 3)], BLOCKED)
+
+    def test_canMove(self):
+        g = self.grid
+        g.setOccupied(idxOf(4, 3), True)
+        self.assertEqual(g.canMove([(3, 3), (4, 3), (3, 2), (0, 3)]), \
+            [False, False, True, False])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests del planificador de comandos por ticks (ver inputsched.py).
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.inputsched import FairInputScheduler
+
+class FakeConnection(object):
+    """Conexion con pending comandos; anota en log cada comando ejecutado."""
+
+    def __init__(self, name, pending, log):
+        self.name = name
+        self.pending = pending
+        self.log = log
+
+    def handleInput(self, budget):
+        n = min(budget, self.pending)
+        self.pending -= n
+        self.log.extend([self.name] * n)
+        return self.pending > 0
+
+class FairInputSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.log = []
+        self.s = FairInputScheduler(2)
+
+    def conn(self, name, pending):
+        return FakeConnection(name, pending, self.log)
+
+    def test_roundRobin(self):
+        s = self.s
+        big, small = self.conn('a', 5), self.conn('b', 1)
+        s.add(big)
+        s.add(small)
+
+        s.runTick()
+        self.assertEqual(self.log, ['a', 'a', 'b'])
+        self.assertEqual(len(s), 1)
+
+        s.runTick()
+        s.runTick()
+        self.assertEqual(self.log, ['a', 'a', 'b', 'a', 'a', 'a'])
+        self.assertEqual(len(s), 0)
+
+    def test_addTwice(self):
+        s = self.s
+        c = self.conn('a', 1)
+        s.add(c)
+        s.add(c)
+        self.assertEqual(len(s), 1)
+
+        s.runTick()
+        # Ya atendida, se puede volver a anotar.
+        c.pending = 1
+        s.add(c)
+        self.assertEqual(len(s), 1)
+
+    def test_carriedConnectionNotDuplicated(self):
+        # Una conexion que paso al tick siguiente sigue anotada: recibir
+        # mas datos no la pone dos veces en la cola.
+        s = self.s
+        c = self.conn('a', 3)
+        s.add(c)
+        s.runTick()
+        s.add(c)
+        self.assertEqual(len(s), 1)
+
+    def test_addedDuringTickWaitsNextTick(self):
+        s = self.s
+        late = self.conn('b', 1)
+
+        class Adder(FakeConnection):
+            def handleInput(self, budget):
+                s.add(late)
+                return FakeConnection.handleInput(self, budget)
+
+        s.add(Adder('a', 1, self.log))
+        s.runTick()
+        self.assertEqual(self.log, ['a'])
+        s.runTick()
+        self.assertEqual(self.log, ['a', 'b'])
+
+    def test_stats(self):
+        s = self.s
+        s.add(self.conn('a', 3))
+        s.add(self.conn('b', 1))
+        s.runTick()
+        s.runTick()
+
+        self.assertEqual(s.stats(), (2, 1.5, 2, 1))
+        self.assertEqual(s.stats(), (0, 0.0, 0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
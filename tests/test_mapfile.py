@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests del formato compilado de los mapas (ver mapfile.dumpCompiledMap).
+"""
+
+import sys, os, unittest, tempfile, shutil, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import mapfile
+from argentumserver.mapfile import MapFile, MAP_TILES, COMPILED_HEADER
+
+def makeMapFile(mapNum=3):
+    mf = MapFile(mapNum)
+    mf.mapVers = 1
+    mf.mapDesc = 'Mapa de prueba'
+    mf.mapCrc = 1234
+    mf.mapMagicWord = 5678
+    mf.opts = {'Name': 'Prueba', 'Pk': 0}
+
+    for idx in xrange(0, MAP_TILES, 7):
+        mf.blocked[idx] = 1
+    for idx in xrange(0, MAP_TILES, 13):
+        mf.layers[idx % 4][idx] = idx
+        mf.trigger[idx] = idx % 5
+        mf.npc[idx] = idx % 300
+        mf.objidx[idx] = idx % 1000
+        mf.objcant[idx] = idx % 10000
+
+    mf.exits = {0: (1, 50, 50), MAP_TILES - 1: (4, 10, 20)}
+    return mf
+
+class CompiledMapTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertSameMap(self, a, b):
+        for k in ('mapNum', 'mapVers', 'mapDesc', 'mapCrc', 'mapMagicWord', \
+            'opts', 'exits'):
+            self.assertEqual(getattr(a, k), getattr(b, k), k)
+
+        self.assertEqual(list(a.blocked), list(b.blocked))
+        for x in xrange(4):
+            self.assertEqual(list(a.layers[x]), list(b.layers[x]))
+        for k in ('trigger', 'npc', 'objidx', 'objcant'):
+            self.assertEqual(list(getattr(a, k)), list(getattr(b, k)), k)
+
+    def test_roundTrip(self):
+        mf = makeMapFile()
+        self.assertSameMap(mf, mapfile.parseCompiledMap( \
+            mapfile.dumpCompiledMap(mf)))
+
+    def test_tilesAligned(self):
+        data = mapfile.dumpCompiledMap(makeMapFile())
+        metaLen = COMPILED_HEADER.unpack_from(data, 0)[2]
+        offset = mapfile._compiledDataOffset(metaLen)
+        self.assertEqual(offset % 8, 0)
+        self.assertEqual(len(data), offset + MAP_TILES * 17)
+
+    def test_wrongVersion(self):
+        data = mapfile.dumpCompiledMap(makeMapFile())
+        data = COMPILED_HEADER.pack('AOMC', mapfile.COMPILED_VERSION + 1, \
+            COMPILED_HEADER.unpack_from(data, 0)[2]) + \
+            data[COMPILED_HEADER.size:]
+        self.assertTrue(mapfile.parseCompiledMap(data) is None)
+
+    def test_srcMtimes(self):
+        data = mapfile.dumpCompiledMap(makeMapFile(), (1.0, 2.0, 3.0))
+        self.assertTrue(mapfile.parseCompiledMap(data, (1.0, 2.0, 3.0)) \
+            is not None)
+        self.assertTrue(mapfile.parseCompiledMap(data, (1.0, 2.0, 4.0)) \
+            is None)
+
+    def test_shared(self):
+        mf = makeMapFile()
+        fileName = os.path.join(self.dir, 'Mapa3.aomc')
+        mapfile.saveCompiledMap(mf, fileName)
+        self.assertEqual(os.listdir(self.dir), ['Mapa3.aomc'])
+
+        mf2 = mapfile.loadCompiledMap(fileName, shared=True)
+        self.assertSameMap(mf, mf2)
+
+        # objidx y objcant cambian durante el juego: no comparten el mapeo.
+        mf2.objidx[0] = 99
+        mf3 = mapfile.loadCompiledMap(fileName, shared=True)
+        self.assertEqual(mf3.objidx[0], mf.objidx[0])
+
+    def test_sharedMemoryUsage(self):
+        # Los datos mapeados se cuentan igual que los de una copia.
+        mf = makeMapFile()
+        fileName = os.path.join(self.dir, 'Mapa3.aomc')
+        mapfile.saveCompiledMap(mf, fileName)
+        mf2 = mapfile.loadCompiledMap(fileName, shared=True)
+        self.assertTrue(mf2.memoryUsage() >= MAP_TILES * 17)
+
+    def test_concurrentSaves(self):
+        # Varios threads compilando el mismo mapa a la vez: cada uno usa su
+        # propio temporal y el archivo final siempre es valido.
+        mf = makeMapFile()
+        fileName = os.path.join(self.dir, 'Mapa3.aomc')
+        errors = []
+
+        def save():
+            try:
+                for x in xrange(5):
+                    mapfile.saveCompiledMap(mf, fileName)
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save) for x in xrange(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.dir), ['Mapa3.aomc'])
+        self.assertSameMap(mf, mapfile.loadCompiledMap(fileName))
+
+    def test_loadMapMeta(self):
+        # Solamente se leen los metadatos del compilado; los fuentes se
+        # usan para comparar las fechas.
+        for ext in ('map', 'inf', 'dat'):
+            open(os.path.join(self.dir, 'Mapa3.' + ext), 'wb').close()
+
+        mf = makeMapFile()
+        mapfile.saveCompiledMap(mf, mapfile.compiledMapFileName(3, \
+            self.dir), mapfile.sourceMtimes(3, self.dir))
+
+        meta = mapfile.loadMapMeta(3, self.dir, self.dir)
+        self.assertEqual(meta['exits'], mf.exits)
+        self.assertEqual(meta['opts'], mf.opts)
+
+if __name__ == '__main__':
+    unittest.main()
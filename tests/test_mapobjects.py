@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests del indice de objetos en el piso y de los paquetes por sector (ver
+mapobjects.py).
+"""
+
+import sys, os, unittest, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.mapobjects import MapObjectsIndex, SectorPackets
+
+class MapObjectsIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.idx = MapObjectsIndex()
+
+    def test_setAndGet(self):
+        idx = self.idx
+        idx.set(3, 4, 10, 5)
+        self.assertEqual(idx.get(3, 4), (10, 5))
+        self.assertTrue((3, 4) in idx)
+        self.assertTrue(idx.get(4, 3) is None)
+        self.assertEqual(len(idx), 1)
+
+    def test_amountChangeKeepsReverse(self):
+        idx = self.idx
+        idx.set(3, 4, 10, 5)
+        idx.set(3, 4, 10, 7)
+        self.assertEqual(idx.get(3, 4), (10, 7))
+        self.assertEqual(idx.positionsOf(10), [(3, 4)])
+
+    def test_replaceObject(self):
+        idx = self.idx
+        idx.set(3, 4, 10, 5)
+        idx.set(3, 4, 11, 1)
+        self.assertEqual(idx.positionsOf(10), [])
+        self.assertEqual(idx.positionsOf(11), [(3, 4)])
+        self.assertFalse(10 in idx.byObj)
+
+    def test_remove(self):
+        idx = self.idx
+        idx.set(3, 4, 10, 5)
+        idx.set(5, 6, 10, 1)
+        idx.set(3, 4, None, 0)
+        self.assertTrue(idx.get(3, 4) is None)
+        self.assertEqual(idx.positionsOf(10), [(5, 6)])
+
+        idx.set(5, 6, None, 0)
+        self.assertEqual((len(idx), idx.byObj), (0, {}))
+
+        # Vaciar un tile vacio no hace nada.
+        idx.set(5, 6, None, 0)
+        self.assertEqual(len(idx), 0)
+
+    def test_inRect(self):
+        idx = self.idx
+        idx.set(1, 1, 10, 1)
+        idx.set(5, 5, 11, 2)
+        idx.set(10, 10, 12, 3)
+        self.assertEqual(sorted(idx.inRect(1, 1, 5, 5)), \
+            [(1, 1, 10, 1), (5, 5, 11, 2)])
+        self.assertEqual(idx.inRect(6, 6, 9, 9), [])
+
+    def test_nearest(self):
+        idx = self.idx
+        self.assertTrue(idx.nearest(10, (50, 50)) is None)
+
+        idx.set(10, 10, 10, 1)
+        idx.set(60, 52, 10, 1)
+        idx.set(51, 50, 11, 1)
+        self.assertEqual(idx.nearest(10, (50, 50)), (60, 52))
+        self.assertEqual(idx.nearest(10, (20, 20)), (10, 10))
+
+        idx.set(60, 52, None, 0)
+        self.assertEqual(idx.nearest(10, (50, 50)), (10, 10))
+
+    def test_reverseMatchesByPos(self):
+        # El indice inverso tiene que coincidir con byPos despues de
+        # cualquier secuencia de cambios.
+        rnd = random.Random(1)
+        idx = self.idx
+
+        for i in xrange(2000):
+            x, y = rnd.randint(1, 10), rnd.randint(1, 10)
+            if rnd.random() < 0.3:
+                idx.set(x, y, None, 0)
+            else:
+                idx.set(x, y, rnd.randint(1, 4), rnd.randint(1, 100))
+
+        expected = {}
+        for x, y, objidx, amount in idx.items():
+            expected.setdefault(objidx, set()).add((x, y))
+        self.assertEqual(idx.byObj, expected)
+
+class SectorPacketsTest(unittest.TestCase):
+    def setUp(self):
+        self.s = SectorPackets(3)
+
+    def packets(self):
+        """Los paquetes de data, ordenados."""
+        data = str(self.s.data)
+        return sorted([data[i:i + 3] for i in xrange(0, len(data), 3)])
+
+    def test_setAndReplace(self):
+        s = self.s
+        s.set((1, 1), 'aaa')
+        s.set((2, 1), 'bbb')
+        s.set((1, 1), 'ccc')
+        self.assertEqual(len(s), 2)
+        self.assertEqual(str(s.data), 'cccbbb')
+
+    def test_removeMovesLast(self):
+        s = self.s
+        for i, c in enumerate('abcd'):
+            s.set((i, 0), c * 3)
+        s.remove((1, 0))
+        self.assertEqual(str(s.data), 'aaadddccc')
+        self.assertEqual(s.slots[(3, 0)], 1)
+
+        # El registro movido se sigue pudiendo cambiar y sacar.
+        s.set((3, 0), 'eee')
+        s.remove((0, 0))
+        self.assertEqual(str(s.data), 'ccceee')
+
+    def test_removeLastAndMissing(self):
+        s = self.s
+        s.set((1, 1), 'aaa')
+        s.remove((2, 2))
+        s.remove((1, 1))
+        self.assertEqual((len(s), str(s.data)), (0, ''))
+
+    def test_randomMatchesDict(self):
+        rnd = random.Random(2)
+        s = self.s
+        expected = {}
+
+        for i in xrange(2000):
+            pos = (rnd.randint(1, 9), rnd.randint(1, 9))
+            if rnd.random() < 0.4:
+                s.remove(pos)
+                expected.pop(pos, None)
+            else:
+                p = chr(rnd.randint(65, 90)) * 3
+                s.set(pos, p)
+                expected[pos] = p
+
+            if i % 100 == 0:
+                self.assertEqual(self.packets(), sorted(expected.values()))
+                for pos, n in s.slots.iteritems():
+                    self.assertEqual(s.order[n], pos)
+                    self.assertEqual(str(s.data[n * 3:n * 3 + 3]), \
+                        expected[pos])
+
+if __name__ == '__main__':
+    unittest.main()
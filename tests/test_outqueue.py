@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests de la cola de salida con reemplazos (ver outqueue.py).
+"""
+
+import sys, os, unittest, struct
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.outqueue import CoalescingQueue
+from argentumserver.aoprotocol import serverPackets, serverPacketsSchema, \
+    SCHEMA_TYPES
+
+def packet(name, *args):
+    """Serializa un paquete sin Strings, como lo haria el encoder."""
+
+    fmt = ''.join([SCHEMA_TYPES[t] for f, t in serverPacketsSchema[name]])
+    return struct.pack('<B' + fmt, serverPackets[name], *args)
+
+class CoalescingQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.q = CoalescingQueue()
+
+    def test_keepsOrder(self):
+        a = packet('CreateFX', 1, 2, 3)
+        b = packet('CreateFX', 1, 2, 3)
+        self.q.add(a)
+        self.q.add(b)
+        self.assertEqual(len(self.q), len(a) + len(b))
+        self.assertEqual(self.q.drain(), a + b)
+
+    def test_supersedeByKey(self):
+        q = self.q
+        m1 = packet('CharacterMove', 7, 10, 10)
+        other = packet('CharacterMove', 8, 10, 11)
+        fx = packet('CreateFX', 1, 2, 7)
+        m2 = packet('CharacterMove', 7, 11, 10)
+
+        for p in (m1, other, fx, m2):
+            q.add(p)
+
+        # El movimiento viejo de 7 se borra y el nuevo va al final.
+        self.assertEqual(q.superseded, 1)
+        self.assertEqual(len(q), len(other) + len(fx) + len(m2))
+        self.assertEqual(q.drain(), other + fx + m2)
+
+    def test_supersedeWithoutKeyFields(self):
+        q = self.q
+        for hp in (10, 9, 8):
+            q.add(packet('UpdateHP', hp))
+        self.assertEqual(q.superseded, 2)
+        self.assertEqual(q.drain(), packet('UpdateHP', 8))
+
+    def test_severalPacketsNotSuperseded(self):
+        # Lo escrito por un sendRaw (varios paquetes juntos) no se reemplaza.
+        q = self.q
+        both = packet('UpdateHP', 10) + packet('UpdateHP', 9)
+        q.add(both)
+        q.add(packet('UpdateHP', 8))
+        self.assertEqual(q.superseded, 0)
+        self.assertEqual(q.drain(), both + packet('UpdateHP', 8))
+
+    def test_drainClears(self):
+        q = self.q
+        q.add(packet('UpdateHP', 10))
+        q.drain()
+        self.assertEqual((len(q), q.drain()), (0, ''))
+
+        # Despues de vaciarla las claves viejas no apuntan a nada.
+        q.add(packet('UpdateHP', 7))
+        self.assertEqual(q.drain(), packet('UpdateHP', 7))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests de MapNavigation: componentes, A*, campos de distancia y su
+invalidacion (ver pathfinding.py).
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.pathfinding import MapNavigation, NEIGHBOURS, \
+    posToIdx, idxToPos, MAP_TILES
+from argentumserver.constants import MAP_SIZE_X, MAP_SIZE_Y
+
+def blockedWith(positions):
+    blocked = bytearray(MAP_TILES)
+    for pos in positions:
+        blocked[posToIdx(pos)] = 1
+    return blocked
+
+class MapNavigationTest(unittest.TestCase):
+    def test_posIdx(self):
+        for pos in ((1, 1), (MAP_SIZE_X, 1), (1, MAP_SIZE_Y), (37, 64)):
+            self.assertEqual(idxToPos(posToIdx(pos)), pos)
+
+    def test_neighboursAtBorders(self):
+        self.assertEqual(sorted(NEIGHBOURS[posToIdx((1, 1))]), \
+            sorted([posToIdx((2, 1)), posToIdx((1, 2))]))
+        self.assertEqual(len(NEIGHBOURS[posToIdx((MAP_SIZE_X, 50))]), 3)
+        self.assertEqual(len(NEIGHBOURS[posToIdx((50, 50))]), 4)
+
+    def test_openMap(self):
+        nav = MapNavigation(bytearray(MAP_TILES), bytearray(MAP_TILES))
+        self.assertEqual(max(nav.components), 1)
+        self.assertTrue(nav.reachable((1, 1), (MAP_SIZE_X, MAP_SIZE_Y)))
+
+    def test_wall(self):
+        # Una pared vertical en x = 50 parte el mapa en dos.
+        nav = MapNavigation(blockedWith([(50, y) \
+            for y in xrange(1, MAP_SIZE_Y + 1)]), bytearray(MAP_TILES))
+        self.assertEqual(max(nav.components), 2)
+        self.assertTrue(nav.reachable((1, 1), (49, MAP_SIZE_Y)))
+        self.assertFalse(nav.reachable((49, 1), (51, 1)))
+
+    def test_noDiagonals(self):
+        # Un tile encerrado por sus 4 vecinos queda aislado aunque las
+        # diagonales esten libres.
+        nav = MapNavigation(blockedWith([(10, 9), (11, 10), (10, 11), \
+            (9, 10)]), bytearray(MAP_TILES))
+        self.assertFalse(nav.reachable((10, 10), (11, 11)))
+        self.assertTrue(nav.reachable((10, 10), (10, 10)))
+
+    def test_blocked(self):
+        nav = MapNavigation(blockedWith([(5, 5)]), bytearray(MAP_TILES))
+        self.assertEqual(nav.components[posToIdx((5, 5))], 0)
+        self.assertFalse(nav.reachable((5, 5), (5, 5)))
+        self.assertFalse(nav.reachable((1, 1), (5, 5)))
+
+class PathTest(unittest.TestCase):
+    def setUp(self):
+        self.occupied = bytearray(MAP_TILES)
+        self.nav = MapNavigation(blockedWith([(10, y) \
+            for y in xrange(1, 20)]), self.occupied)
+
+    def occupy(self, pos, v=1):
+        idx = posToIdx(pos)
+        self.occupied[idx] = v
+        self.nav.tileChanged(idx)
+
+    def test_findPath(self):
+        path = self.nav.findPath((5, 5), (15, 5))
+        # Hay que rodear la pared por y = 20.
+        self.assertEqual(len(path), 10 + 2 * 15)
+        self.assertEqual(path[-1], (15, 5))
+        prev = (5, 5)
+        for pos in path:
+            self.assertEqual(abs(pos[0] - prev[0]) + abs(pos[1] - prev[1]), 1)
+            self.assertFalse(pos[0] == 10 and pos[1] < 20)
+            prev = pos
+
+    def test_findPathTrivial(self):
+        self.assertEqual(self.nav.findPath((5, 5), (5, 5)), [])
+        self.assertEqual(self.nav.findPath((5, 5), (5, 6)), [(5, 6)])
+
+    def test_findPathOccupied(self):
+        # Los tiles ocupados se evitan, salvo el destino.
+        self.occupy((6, 5))
+        path = self.nav.findPath((5, 5), (7, 5))
+        self.assertEqual(len(path), 4)
+        self.assertFalse((6, 5) in path)
+        self.assertEqual(self.nav.findPath((5, 5), (6, 5)), [(6, 5)])
+
+    def test_findPathUnreachable(self):
+        # Descartado por componente, sin expandir nada.
+        nav = MapNavigation(blockedWith([(10, y) \
+            for y in xrange(1, MAP_SIZE_Y + 1)]), self.occupied)
+        self.assertTrue(nav.findPath((5, 5), (15, 5)) is None)
+        self.assertTrue(nav.findPath((5, 5), (10, 5)) is None)
+
+    def test_findPathMaxNodes(self):
+        self.assertTrue(self.nav.findPath((5, 5), (15, 5), 10) is None)
+
+    def test_distanceFieldCached(self):
+        nav = self.nav
+        field = nav.distanceField((15, 5))
+        self.assertEqual(field[posToIdx((15, 5))], 0)
+        self.assertEqual(field[posToIdx((5, 5))], 40)
+        self.assertEqual(field[posToIdx((10, 5))], -1)
+        self.assertTrue(nav.distanceField((15, 5)) is field)
+        self.assertEqual((nav.misses, nav.hits), (1, 1))
+
+    def test_stepToward(self):
+        nav = self.nav
+        self.assertEqual(nav.stepToward((9, 5), (15, 5)), (9, 6))
+        self.assertEqual(nav.stepToward((14, 5), (15, 5)), (15, 5))
+        self.assertTrue(nav.stepToward((15, 5), (15, 5)) is None)
+
+    def test_occupyInvalidatesReached(self):
+        nav = self.nav
+        nav.distanceField((15, 5))
+        self.occupy((3, 3))
+        nav.distanceField((15, 5))
+        self.assertEqual(nav.misses, 2)
+
+    def test_occupyTargetKeepsField(self):
+        nav = self.nav
+        field = nav.distanceField((15, 5))
+        self.occupy((15, 5))
+        self.assertTrue(nav.distanceField((15, 5)) is field)
+
+    def test_occupyUnreachedKeepsField(self):
+        # Un tile que el campo no alcanza (del otro lado de una pared
+        # completa) no cambia ninguna distancia.
+        occupied = bytearray(MAP_TILES)
+        nav = MapNavigation(blockedWith([(10, y) \
+            for y in xrange(1, MAP_SIZE_Y + 1)]), occupied)
+        field = nav.distanceField((5, 5))
+        occupied[posToIdx((15, 5))] = 1
+        nav.tileChanged(posToIdx((15, 5)))
+        self.assertTrue(nav.distanceField((5, 5)) is field)
+
+    def test_freeInvalidatesOnlyNear(self):
+        nav = self.nav
+        self.occupy((12, 5))
+        self.occupy((30, 30))
+        field = nav.distanceField((15, 5))
+        self.assertEqual(field[posToIdx((12, 5))], -1)
+
+        # Liberar un tile ocupado vecino de tiles alcanzados cambia el campo.
+        self.occupy((12, 5), 0)
+        field2 = nav.distanceField((15, 5))
+        self.assertFalse(field2 is field)
+        self.assertEqual(field2[posToIdx((12, 5))], 3)
+
+    def test_freeEnclosedKeepsField(self):
+        # Un tile encerrado por bloqueados: liberarlo no cambia el campo.
+        occupied = bytearray(MAP_TILES)
+        nav = MapNavigation(blockedWith([(30, 29), (31, 30), (30, 31), \
+            (29, 30)]), occupied)
+        idx = posToIdx((30, 30))
+        occupied[idx] = 1
+        field = nav.distanceField((5, 5))
+        occupied[idx] = 0
+        nav.tileChanged(idx)
+        self.assertTrue(nav.distanceField((5, 5)) is field)
+
+if __name__ == '__main__':
+    unittest.main()
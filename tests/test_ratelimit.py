@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests de los limites de paquetes por segundo (ver ratelimit.py).
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.ratelimit import parseRateLimits, TokenBuckets, \
+    RATE_DROP, RATE_DELAY
+from argentumserver.aoprotocol import clientPackets
+
+WALK = clientPackets['Walk']
+TALK = clientPackets['Talk']
+
+class ParseRateLimitsTest(unittest.TestCase):
+    def test_parse(self):
+        # ConfigParser devuelve los nombres en minusculas.
+        limits = parseRateLimits([('walk', '10, 5, delay'), \
+            ('Talk', '2,1,DROP')])
+        self.assertEqual(limits[WALK], (10.0, 5.0, RATE_DELAY))
+        self.assertEqual(limits[TALK], (2.0, 1.0, RATE_DROP))
+        self.assertEqual(len(limits), max(clientPackets.values()) + 1)
+        self.assertEqual(len([x for x in limits if x is not None]), 2)
+
+    def test_invalid(self):
+        for item in [('NoExiste', '1, 1, drop'), ('Walk', '1, 1'), \
+            ('Walk', 'x, 1, drop'), ('Walk', '1, 1, kick'), \
+            ('Walk', '0, 1, drop'), ('Walk', '1, 0.5, drop')]:
+            self.assertRaises(ValueError, parseRateLimits, [item])
+
+class TokenBucketsTest(unittest.TestCase):
+    def setUp(self):
+        self.limits = parseRateLimits([('Walk', '2, 3, delay'), \
+            ('Talk', '1, 1, disconnect')])
+        self.walk = self.limits[WALK]
+        self.b = TokenBuckets(self.limits, 100.0)
+
+    def test_burst(self):
+        b = self.b
+        self.assertEqual([b.take(WALK, self.walk, 100.0) \
+            for x in xrange(4)], [True, True, True, False])
+        self.assertEqual(b.hits, {WALK: 1})
+
+    def test_refill(self):
+        b = self.b
+        for x in xrange(3):
+            b.take(WALK, self.walk, 100.0)
+        self.assertFalse(b.take(WALK, self.walk, 100.25))
+        # A 2 por segundo, medio segundo despues hay un token.
+        self.assertTrue(b.take(WALK, self.walk, 100.5))
+        self.assertFalse(b.take(WALK, self.walk, 100.5))
+
+    def test_refillCappedAtBurst(self):
+        b = self.b
+        results = [b.take(WALK, self.walk, 1000.0) for x in xrange(4)]
+        self.assertEqual(results, [True, True, True, False])
+
+    def test_bucketsAreIndependent(self):
+        b = self.b
+        for x in xrange(3):
+            b.take(WALK, self.walk, 100.0)
+        self.assertTrue(b.take(TALK, self.limits[TALK], 100.0))
+        self.assertEqual(b.hits, {})
+
+    def test_delayedCountedOnce(self):
+        # Un paquete demorado se vuelve a decodificar en cada tick hasta
+        # que haya token; cuenta una sola vez.
+        b = self.b
+        for x in xrange(3):
+            b.take(WALK, self.walk, 100.0)
+
+        self.assertFalse(b.take(WALK, self.walk, 100.0))
+        b.delayed = True
+        self.assertFalse(b.take(WALK, self.walk, 100.1))
+        self.assertFalse(b.take(WALK, self.walk, 100.2))
+        self.assertEqual(b.hits, {WALK: 1})
+
+        self.assertTrue(b.take(WALK, self.walk, 100.6))
+        self.assertFalse(b.delayed)
+
+        # El paquete siguiente es otro, y si no hay token cuenta de nuevo.
+        self.assertFalse(b.take(WALK, self.walk, 100.6))
+        self.assertEqual(b.hits, {WALK: 2})
+
+if __name__ == '__main__':
+    unittest.main()
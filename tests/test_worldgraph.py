@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Tests del grafo del mundo (ver worldgraph.py).
+"""
+
+import sys, os, unittest, tempfile, shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import worldgraph, mapfile
+
+# 1 <-> 2 <-> 3, 1 -> 4 (sin vuelta), 5 aislado. Las salidas son
+# (x, y, mapa destino, x destino, y destino).
+EXITS = {
+    1: [(10, 1, 2, 10, 99), (90, 1, 2, 90, 99), (1, 50, 4, 99, 50)],
+    2: [(10, 100, 1, 10, 2), (100, 50, 3, 2, 50), (20, 20, 2, 30, 30)],
+    3: [(1, 50, 2, 99, 50)],
+    4: [],
+    5: [],
+}
+
+class WorldGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.g = worldgraph.WorldGraph(EXITS)
+
+    def test_neighbours(self):
+        self.assertEqual(self.g.neighbours[1], (2, 4))
+        # Las salidas al mismo mapa no cuentan.
+        self.assertEqual(self.g.neighbours[2], (1, 3))
+        self.assertEqual(self.g.neighbours[4], ())
+
+    def test_route(self):
+        self.assertEqual(self.g.route(1, 1), [])
+        self.assertEqual(self.g.route(1, 3), [(1, 10, 1, 2, 10, 99), \
+            (2, 100, 50, 3, 2, 50)])
+        self.assertEqual(self.g.distance(3, 1), 2)
+
+    def test_noRoute(self):
+        self.assertTrue(self.g.route(4, 1) is None)
+        self.assertTrue(self.g.route(1, 5) is None)
+        self.assertTrue(self.g.distance(1, 6) is None)
+
+    def test_nearestExit(self):
+        self.assertEqual(self.g.nearestExit(1, 2, (80, 5)), \
+            (90, 1, 2, 90, 99))
+        self.assertTrue(self.g.nearestExit(1, 3, (80, 5)) is None)
+
+    def test_mapExits(self):
+        self.assertEqual(worldgraph.mapExits({0: (2, 5, 6), \
+            mapfile.MAP_SIZE_X + 2: (3, 7, 8)}), \
+            [(1, 1, 2, 5, 6), (3, 2, 3, 7, 8)])
+
+class LoadWorldGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_loadedExitsAndMissingMaps(self):
+        # Los mapas 1 y 2 ya estan en memoria; 3 no existe y se omite sin
+        # que haga falta leer nada del disco.
+        g = worldgraph.loadWorldGraph(3, self.dir, None, \
+            {1: {0: (2, 5, 5)}, 2: {4: (1, 1, 1)}})
+        self.assertEqual(len(g), 2)
+        self.assertEqual(g.route(1, 2), [(1, 1, 1, 2, 5, 5)])
+
+if __name__ == '__main__':
+    unittest.main()
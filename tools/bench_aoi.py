@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Benchmark de trafico por jugador con y sin areas de vision.
+
+Simula N jugadores caminando al azar por un mapa vacio, a un paso por
+segundo cada uno, y cuenta los bytes que recibe cada jugador por segundo
+enviando los CharacterMove a todo el mapa (como antes) o solamente a los
+que ven el tile, con los CharacterCreate/CharacterRemove/AreaChanged al
+cambiar de sector.
+
+Forma de uso: bench_aoi.py [segundos]
+"""
+
+import sys, os, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.aocommands import PacketSerializer
+from argentumserver.areas import AreaGrid
+from argentumserver.constants import MAP_SIZE_X, MAP_SIZE_Y
+
+def packetSizes():
+    ps = PacketSerializer()
+
+    ps.sendCharacterMove(1, 50, 50)
+    move = len(ps.getData())
+
+    ps.sendCharacterCreate(1, 1, 1, 1, 50, 50, 0, 0, 0, 0, 0, \
+        'Jugador', 1, 0)
+    create = len(ps.getData())
+
+    ps.sendCharacterRemove(1)
+    remove = len(ps.getData())
+
+    ps.sendAreaChanged(50, 50)
+    areaChanged = len(ps.getData())
+
+    return move, create, remove, areaChanged
+
+def simulate(n, seconds, sizes):
+    move, create, remove, areaChanged = sizes
+
+    rnd = random.Random(n)
+    pos = [[rnd.randint(1, MAP_SIZE_X), rnd.randint(1, MAP_SIZE_Y)] \
+        for x in xrange(n)]
+    grid = AreaGrid()
+    for i, p in enumerate(pos):
+        grid.add(i, p[0], p[1])
+
+    fullBytes = 0
+    aoiBytes = 0
+
+    for t in xrange(seconds):
+        for i in xrange(n):
+            x, y = pos[i]
+            dx, dy = rnd.choice(((0, 1), (1, 0), (0, -1), (-1, 0)))
+            nx, ny = x + dx, y + dy
+            if not (1 <= nx <= MAP_SIZE_X and 1 <= ny <= MAP_SIZE_Y):
+                continue
+
+            pos[i] = [nx, ny]
+            fullBytes += move * (n - 1)
+
+            changed = grid.move(i, (x, y), (nx, ny))
+            if changed is None:
+                aoiBytes += move * (len(grid.playersAround(nx, ny)) - 1)
+                continue
+
+            lost, gained = changed
+            viewers = len(grid.playersAround(nx, ny)) - 1
+            newViewers = len(grid.playersIn(gained))
+            aoiBytes += move * (viewers - newViewers) + areaChanged
+            aoiBytes += remove * len(grid.playersIn(lost))
+            aoiBytes += create * newViewers * 2
+
+    return (float(fullBytes) / n / seconds, float(aoiBytes) / n / seconds)
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    sizes = packetSizes()
+
+    print "%9s %16s %16s %8s" % ('jugadores', 'todo el mapa', 'areas', \
+        'ahorro')
+    for n in (10, 25, 50, 100, 200, 400):
+        full, aoi = simulate(n, seconds, sizes)
+        print "%9d %12.0f B/s %12.0f B/s %7.1fx" % (n, full, aoi, \
+            full / aoi if aoi else 0.0)
+
+if __name__ == '__main__':
+    main()
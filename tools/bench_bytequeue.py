@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Microbenchmark de ByteQueue.
+
+Compara la implementacion actual (bytearray) contra la anterior basada en
+concatenacion de str, agregando datos de a 1 byte, 10 bytes y 4 KB, y
+consumiendolos de a poco como lo hace el servidor con un socket. El patron
+decode imita a handleData, que lee los paquetes directamente del buffer.
+
+Forma de uso: bench_bytequeue.py [cantidad_de_bytes]
+"""
+
+import sys, os, time, struct
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.bytequeue import ByteQueue, ByteQueueInsufficientData
+
+class StrByteQueue(object):
+    """La ByteQueue original, con los datos en un str inmutable."""
+
+    __slots__ = ('data', 'pos', 'markpos', )
+    def __init__(self, data=""):
+        self.data = data
+        self.pos = 0
+        self.markpos = 0
+
+    def __len__(self):
+        return len(self.data) - self.pos
+
+    def addData(self, data):
+        self.data += data
+
+    def commit(self):
+        if self.pos != 0:
+            self.data = self.data[self.pos:]
+            self.pos = 0
+            self.markpos = 0
+
+    def mark(self):
+        self.markpos = self.pos
+
+    def peekFmt(self, fmt):
+        tam = struct.calcsize(fmt)
+        if tam > len(self):
+            raise ByteQueueInsufficientData()
+        return struct.unpack(fmt, buffer(self.data, self.pos, tam))
+
+    def read(self, fmt):
+        ret = self.peekFmt(fmt)
+        self.pos += struct.calcsize(fmt)
+        return ret
+
+    def readRaw(self, cant=None):
+        if cant is None:
+            cant = len(self)
+        ret = self.data[self.pos:self.pos+cant]
+        self.pos += cant
+        return ret
+
+    def readInt8(self):
+        return self.read('<B')[0]
+
+def runStream(queueClass, chunkSize, totalBytes):
+    """
+    Entrada de un socket: agrega totalBytes en pedazos de chunkSize y despues
+    de cada addData consume la mitad de lo pendiente y hace commit, asi
+    siempre queda un resto en el buffer (un paquete TCP incompleto).
+    """
+
+    chunk = "\x01" * chunkSize
+    q = queueClass()
+
+    t = time.time()
+
+    for x in xrange(totalBytes // chunkSize):
+        q.addData(chunk)
+        q.mark()
+        q.readRaw(len(q) // 2)
+        q.commit()
+
+    return time.time() - t
+
+def runDecode(queueClass, chunkSize, totalBytes):
+    """
+    Entrada del servidor: igual que handleData, despues de cada addData se
+    decodifican con unpack_from todos los paquetes completos de 3 bytes
+    directamente sobre el buffer y se hace un solo commit. Un paquete
+    partido entre dos chunks queda pendiente.
+    """
+
+    chunk = "\x01" * chunkSize
+    st = struct.Struct('<BBB')
+    q = queueClass()
+
+    t = time.time()
+
+    for x in xrange(totalBytes // chunkSize):
+        q.addData(chunk)
+        data = q.data
+        pos = q.pos
+        end = len(data)
+        while end - pos >= 3:
+            st.unpack_from(data, pos)
+            pos += 3
+        q.pos = pos
+        q.commit()
+
+    return time.time() - t
+
+def runBurst(queueClass, chunkSize, totalBytes):
+    """
+    Salida hacia un socket: se encolan totalBytes en pedazos de chunkSize y
+    recien despues se leen todos juntos.
+    """
+
+    chunk = "\x01" * chunkSize
+    q = queueClass()
+
+    t = time.time()
+
+    for x in xrange(totalBytes // chunkSize):
+        q.addData(chunk)
+
+    q.readRaw()
+    q.commit()
+
+    return time.time() - t
+
+def main():
+    totalBytes = int(sys.argv[1]) if len(sys.argv) > 1 else 1 << 20
+
+    print "Bytes por patron:", totalBytes
+    print
+    print "%-8s %-8s %14s %14s %8s" % ("patron", "chunk", "str (s)", \
+        "bytearray (s)", "x")
+
+    for patName, pat in [("stream", runStream), ("decode", runDecode), \
+        ("burst", runBurst)]:
+        for chunkSize in [1, 10, 4096]:
+            tOld = pat(StrByteQueue, chunkSize, totalBytes)
+            tNew = pat(ByteQueue, chunkSize, totalBytes)
+
+            print "%-8s %-8d %14.4f %14.4f %8.2f" % (patName, chunkSize, \
+                tOld, tNew, tOld / tNew if tNew > 0 else 0.0)
+
+if __name__ == '__main__':
+    main()
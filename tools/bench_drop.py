@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Benchmark de la busqueda de tile para dejar objetos.
+
+Compara la busqueda anterior de GameMap.dropObjAt (util.espiral + validPos +
+MapFileTile por cada candidato) contra mapobjects.findDropPos sobre un mapa
+real lleno de jugadores y objetos, como en un saqueo despues de una pelea.
+
+Forma de uso: bench_drop.py RutaDeLosMapas NumeroDeMapa [busquedas]
+"""
+
+import sys, os, time, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import mapfile, util
+from argentumserver.mapobjects import findDropPos, DROP_NO, DROP_EMPTY, \
+    DROP_STACK
+from argentumserver.constants import MAP_SIZE_X, MAP_SIZE_Y, MAXINVITEMS
+
+def oldValidPos(mf, players, pos):
+    x, y = pos
+
+    if x < 1 or x > MAP_SIZE_X:
+        return False
+    if y < 1 or y > MAP_SIZE_Y:
+        return False
+    if mf[x, y].blocked:
+        return False
+    if players[(x - 1) + (y - 1) * MAP_SIZE_X] is not None:
+        return False
+    return True
+
+def oldFindDropPos(mf, players, objidx, amount, pos):
+    for p in util.espiral(pos):
+        if not oldValidPos(mf, players, p):
+            continue
+
+        tile = mf[p]
+        if tile.objidx is None:
+            return p
+        if tile.objidx == objidx and tile.objcant + amount <= MAXINVITEMS:
+            return p
+    return None
+
+def main():
+    if len(sys.argv) < 3:
+        print __doc__
+        sys.exit(1)
+
+    mf = mapfile.loadMapFile(int(sys.argv[2]), sys.argv[1])
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    rnd = random.Random(0)
+
+    # Una zona de 30x30 con muchos jugadores y objetos tirados.
+    players = [None] * (MAP_SIZE_X * MAP_SIZE_Y)
+    for i in xrange(600):
+        x, y = rnd.randint(35, 65), rnd.randint(35, 65)
+        players[(x - 1) + (y - 1) * MAP_SIZE_X] = i + 1
+    for i in xrange(800):
+        x, y = rnd.randint(35, 65), rnd.randint(35, 65)
+        t = mf[x, y]
+        if not t.blocked:
+            t.objidx = rnd.randint(1, 20)
+            t.objcant = rnd.choice((1, 10, MAXINVITEMS))
+
+    dropState = bytearray(len(players))
+    for idx in xrange(len(players)):
+        if mf.blocked[idx] or players[idx] is not None:
+            dropState[idx] = DROP_NO
+        elif not mf.objidx[idx]:
+            dropState[idx] = DROP_EMPTY
+        elif mf.objcant[idx] >= MAXINVITEMS:
+            dropState[idx] = DROP_NO
+        else:
+            dropState[idx] = DROP_STACK
+
+    drops = [((rnd.randint(35, 65), rnd.randint(35, 65)), \
+        rnd.randint(1, 20), rnd.randint(1, 100)) for x in xrange(count)]
+
+    t = time.time()
+    for pos, objidx, amount in drops:
+        oldFindDropPos(mf, players, objidx, amount, pos)
+    old = time.time() - t
+
+    t = time.time()
+    for pos, objidx, amount in drops:
+        findDropPos(dropState, mf.objidx, mf.objcant, objidx, amount, pos)
+    new = time.time() - t
+
+    print "espiral + validPos: %8.0f busquedas/s" % (count / old)
+    print "findDropPos:        %8.0f busquedas/s" % (count / new)
+    print "Aceleracion: %.1fx" % (old / new)
+
+if __name__ == '__main__':
+    main()
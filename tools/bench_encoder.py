@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Benchmark de los encoders de paquetes del servidor.
+
+Mide paquetes por segundo de CharacterMove, CharacterCreate y ConsoleMsg
+con los encoders generados a partir del esquema (aoprotocol) contra los
+encoders escritos a mano campo por campo.
+
+Forma de uso: bench_encoder.py [cantidad_de_paquetes]
+"""
+
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver.bytequeue import ByteQueue
+from argentumserver.aoprotocol import serverPackets
+from argentumserver.aocommands import ServerCommandsEncoder
+
+class DummyProtocol(object):
+    """Hace de AoProtocol sin socket: flushOutBuf descarta los datos."""
+
+    def __init__(self):
+        self.outbuf = ByteQueue()
+
+    def flushOutBuf(self):
+        self.outbuf.readRaw()
+        self.outbuf.commit()
+
+class HandWrittenEncoder(object):
+    """Los encoders como estaban antes de usar el esquema."""
+
+    __slots__ = ('buf', 'prot', )
+
+    def __init__(self, prot):
+        self.buf = prot.outbuf
+        self.prot = prot
+
+    def sendConsoleMsg(self, msg, font):
+        self.buf.writeInt8(serverPackets['ConsoleMsg'])
+        self.buf.writeString(msg)
+        self.buf.writeInt8(font)
+        self.prot.flushOutBuf()
+
+    def sendCharacterCreate(self, chridx, body, head, heading, x, y, weapon, shield, helmet, fx, fxloops, name, nickColor, priv):
+        self.buf.writeInt8(serverPackets['CharacterCreate'])
+        self.buf.writeInt16(chridx)
+        self.buf.writeInt16(body)
+        self.buf.writeInt16(head)
+        self.buf.writeInt8(heading)
+        self.buf.writeInt8(x)
+        self.buf.writeInt8(y)
+        self.buf.writeInt16(weapon)
+        self.buf.writeInt16(shield)
+        self.buf.writeInt16(helmet)
+        self.buf.writeInt16(fx)
+        self.buf.writeInt16(fxloops)
+        self.buf.writeString(name)
+        self.buf.writeInt8(nickColor)
+        self.buf.writeInt8(priv)
+        self.prot.flushOutBuf()
+
+    def sendCharacterMove(self, chridx, x, y):
+        self.buf.writeInt8(serverPackets['CharacterMove'])
+        self.buf.writeInt16(chridx)
+        self.buf.writeInt8(x)
+        self.buf.writeInt8(y)
+        self.prot.flushOutBuf()
+
+def benchPackets(encoderClass, n):
+    enc = encoderClass(DummyProtocol())
+    ret = []
+
+    t = time.time()
+    for x in xrange(n):
+        enc.sendCharacterMove(x & 0x7fff, 50, 51)
+    ret.append(('CharacterMove', time.time() - t))
+
+    t = time.time()
+    for x in xrange(n):
+        enc.sendCharacterCreate(x & 0x7fff, 1, 1, 3, 50, 51, 0, 0, 0, 0, 0, \
+            "Jugador", 2, 1)
+    ret.append(('CharacterCreate', time.time() - t))
+
+    t = time.time()
+    for x in xrange(n):
+        enc.sendConsoleMsg("Jugador dice (50, 51): hola", 1)
+    ret.append(('ConsoleMsg', time.time() - t))
+
+    return ret
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    before = benchPackets(HandWrittenEncoder, n)
+    after = benchPackets(ServerCommandsEncoder, n)
+
+    print "Paquetes por tipo:", n
+    print
+    print "%-16s %14s %14s %8s" % ("paquete", "antes (pkt/s)", \
+        "despues (pkt/s)", "x")
+
+    for (name, tOld), (name2, tNew) in zip(before, after):
+        print "%-16s %14.0f %14.0f %8.2f" % (name, n / tOld, n / tNew, \
+            tOld / tNew)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Benchmark de carga de mapas.
+
+Compara el tiempo de cargar los mapas desde los map/inf/dat, completos y
+con lazy=True (solamente el recorrido de los flags), contra cargarlos desde
+los compilados. Los compilados se generan antes en un directorio
+temporal, asi que los archivos del servidor no se modifican.
+
+Forma de uso: bench_mapload.py RutaDeLosMapas CantidadDeMapas [repeticiones]
+"""
+
+import sys, os, time, shutil, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import mapfile
+
+def bench(name, mapNums, load, repeat):
+    best = None
+    for x in xrange(repeat):
+        t = time.time()
+        for mapNum in mapNums:
+            load(mapNum)
+        t = time.time() - t
+        best = t if best is None else min(best, t)
+
+    print "%-12s %8.3f s  %8.2f ms/mapa" % (name, best, \
+        best * 1000.0 / len(mapNums))
+    return best
+
+def main():
+    if len(sys.argv) < 3:
+        print __doc__
+        sys.exit(1)
+
+    mapsPath = sys.argv[1]
+    mapCount = int(sys.argv[2])
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    mapNums = [n for n in xrange(1, mapCount + 1) \
+        if os.path.isfile(os.path.join(mapsPath, 'Mapa%d.map' % n))]
+
+    if not mapNums:
+        print "No se encontraron mapas en " + mapsPath
+        sys.exit(1)
+
+    compiledPath = tempfile.mkdtemp()
+    try:
+        for mapNum in mapNums:
+            mapfile.compileMap(mapNum, mapsPath, compiledPath, True)
+
+        print "%d mapas, mejor de %d" % (len(mapNums), repeat)
+
+        src = bench('map/inf/dat', mapNums, \
+            lambda n: mapfile.loadMapFile(n, mapsPath), repeat)
+        lazy = bench('lazy', mapNums, \
+            lambda n: mapfile.loadMapFile(n, mapsPath, True), repeat)
+        comp = bench('compilados', mapNums, \
+            lambda n: mapfile.loadMap(n, mapsPath, compiledPath), repeat)
+
+        print "Aceleracion lazy: %.1fx" % (src / lazy)
+        print "Aceleracion compilados: %.1fx" % (src / comp)
+    finally:
+        shutil.rmtree(compiledPath)
+
+if __name__ == '__main__':
+    main()
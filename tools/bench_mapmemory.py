@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Reporte de memoria de los mapas.
+
+Compara los bytes por mapa de MapFile (arrays por columna) contra el formato
+anterior: un objeto MapFileTile por tile, cada uno con su lista de layers.
+
+Forma de uso: bench_mapmemory.py RutaDeLosMapas [mapa1 mapa2 ...]
+"""
+
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import mapfile
+from argentumserver.constants import MAP_SIZE_X, MAP_SIZE_Y
+
+class OldMapFileTile(object):
+    """El MapFileTile anterior, con un objeto por tile."""
+
+    __slots__ = ('blocked', 'layers', 'trigger', 'exit', 'npc', 'objidx', \
+        'objcant')
+
+def oldLayoutUsage(mf):
+    """
+    Arma los tiles con el formato anterior a partir de mf y devuelve los
+    bytes que ocupan: objetos, listas, tuplas y enteros no compartidos.
+    """
+
+    tiles = []
+    for y in xrange(1, MAP_SIZE_Y + 1):
+        for x in xrange(1, MAP_SIZE_X + 1):
+            t = mf[x, y]
+            o = OldMapFileTile()
+            o.blocked = t.blocked
+            o.layers = t.layers
+            o.trigger = t.trigger
+            o.exit = t.exit
+            o.npc = t.npc
+            o.objidx = t.objidx
+            o.objcant = t.objcant
+            tiles.append(o)
+
+    seen = set()
+    total = sys.getsizeof(tiles)
+
+    def size(obj):
+        if id(obj) in seen or obj is None or type(obj) is bool:
+            return 0
+        # Los enteros chicos estan cacheados por el interprete.
+        if type(obj) is int and -5 <= obj <= 256:
+            return 0
+        seen.add(id(obj))
+        return sys.getsizeof(obj)
+
+    for o in tiles:
+        total += size(o) + size(o.layers) + size(o.trigger) + size(o.npc) + \
+            size(o.objidx) + size(o.objcant)
+        total += sum([size(l) for l in o.layers])
+        if o.exit is not None:
+            total += size(o.exit) + sum([size(v) for v in o.exit])
+
+    return total
+
+def main():
+    if len(sys.argv) < 2:
+        print "Forma de uso: bench_mapmemory.py RutaDeLosMapas [mapa1 mapa2 ...]"
+        sys.exit(1)
+
+    basePath = sys.argv[1]
+    mapNums = [int(x) for x in sys.argv[2:]] or [1]
+
+    print "%-6s %14s %14s %8s" % ("mapa", "antes (bytes)", "ahora (bytes)", \
+        "x")
+
+    totalOld = totalNew = 0
+
+    for n in mapNums:
+        mf = mapfile.loadMapFile(n, basePath)
+        old, new = oldLayoutUsage(mf), mf.memoryUsage()
+        totalOld += old
+        totalNew += new
+
+        print "%-6d %14d %14d %8.2f" % (n, old, new, float(old) / new)
+
+    if len(mapNums) > 1:
+        print "%-6s %14d %14d %8.2f" % ("total", totalOld, totalNew, \
+            float(totalOld) / totalNew)
+
+if __name__ == '__main__':
+    main()
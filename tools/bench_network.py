@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+
+"""
+Benchmark de carga de los backends de red (ver argentumserver/network.py).
+
+Levanta el servidor una vez con cada backend, con una copia del archivo de
+configuracion, y mide:
+
+  - conexiones por segundo: conectar, loguear un personaje, esperar la
+    primer respuesta y cerrar, con varias conexiones en paralelo.
+  - paquetes por segundo: con varios clientes logueados, cada uno envia
+    RequestPositionUpdate seguidos y espera todos los PosUpdate.
+
+En la copia de la configuracion se sacan los limites de paquetes por segundo,
+se usa InputMode Immediate y se suben los limites de conexiones y jugadores.
+El servidor se ejecuta en el directorio del archivo de configuracion.
+
+Forma de uso: bench_network.py ArchivoDeConfiguracion [backends] [conexiones]
+    [paralelas] [clientes] [paquetes]
+
+backends va separado por comas, por defecto "Twisted,asyncio".
+"""
+
+import sys, os, time, socket, select, struct, subprocess, tempfile
+from ConfigParser import RawConfigParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from argentumserver.aoprotocol import clientPackets, serverPackets
+
+# PacketID, x, y.
+POS_UPDATE_LEN = 3
+
+def playerName(n):
+    """Nombres validos (solo letras) distintos para cada n."""
+
+    s = ''
+    n += 26 * 26
+    while n:
+        s = chr(ord('a') + n % 26) + s
+        n //= 26
+    return 'Bot' + s
+
+def loginPacket(name):
+    return chr(clientPackets['LoginExistingChar']) + \
+        struct.pack('<h', len(name)) + name + struct.pack('<h', 1) + 'x' + \
+        '\x00\x0d\x00'
+
+def writeConfig(src, dst, backend):
+    # Sin codecs: los valores quedan en UTF-8 tal cual.
+    cfg = RawConfigParser()
+    cfg.optionxform = str
+    cfg.read([src])
+
+    cfg.set('Core', 'NetworkBackend', backend)
+    cfg.set('Core', 'InputMode', 'Immediate')
+    for opt in ('ConnectionsCountLimit', 'ConnectionsCountLimitPerIP', \
+        'PlayersCountLimit'):
+        cfg.set('Core', opt, '100000')
+    cfg.remove_section('RateLimits')
+
+    with open(dst, 'wb') as f:
+        cfg.write(f)
+
+    return cfg.getint('Core', 'ListenPort')
+
+def startServer(configFile, port):
+    devnull = open(os.devnull, 'wb')
+    proc = subprocess.Popen([sys.executable, \
+        os.path.join(ROOT, 'runserver.py'), configFile], \
+        cwd=os.path.dirname(os.path.abspath(sys.argv[1])), \
+        stdout=devnull, stderr=subprocess.STDOUT)
+
+    end = time.time() + 60
+    while time.time() < end:
+        if proc.poll() is not None:
+            raise Exception("El servidor termino al iniciar")
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return proc
+        except socket.error:
+            time.sleep(0.1)
+
+    proc.terminate()
+    raise Exception("El servidor no respondio")
+
+def benchConnections(port, total, parallel, firstName):
+    """Devuelve (conexiones por segundo, errores)."""
+
+    active = set()
+    started = done = errors = 0
+
+    t = time.time()
+
+    while done < total:
+        while len(active) < parallel and started < total:
+            s = socket.create_connection(('127.0.0.1', port))
+            s.sendall(loginPacket(playerName(firstName + started)))
+            active.add(s)
+            started += 1
+
+        r = select.select(list(active), [], [], 10)[0]
+        if not r:
+            raise Exception("Timeout esperando el login")
+
+        for s in r:
+            data = s.recv(65536)
+            if not data or ord(data[0]) == serverPackets['ErrorMsg']:
+                errors += 1
+            s.close()
+            active.remove(s)
+            done += 1
+
+    return total / (time.time() - t), errors
+
+def drain(socks, quiet=0.5):
+    """Lee todo lo que llegue hasta que no llegue nada por quiet segundos."""
+
+    while select.select(socks, [], [], quiet)[0]:
+        for s in select.select(socks, [], [], 0)[0]:
+            s.recv(65536)
+
+def benchPackets(port, clients, packets, firstName):
+    """Devuelve paquetes por segundo."""
+
+    socks = []
+    for n in xrange(clients):
+        s = socket.create_connection(('127.0.0.1', port))
+        s.sendall(loginPacket(playerName(firstName + n)))
+        socks.append(s)
+
+    drain(socks)
+
+    payload = chr(clientPackets['RequestPositionUpdate']) * packets
+    expected = packets * POS_UPDATE_LEN
+    received = dict([(s, 0) for s in socks])
+    pending = set(socks)
+
+    t = time.time()
+
+    for s in socks:
+        s.sendall(payload)
+
+    while pending:
+        r = select.select(list(pending), [], [], 10)[0]
+        if not r:
+            raise Exception("Timeout esperando los PosUpdate")
+        for s in r:
+            received[s] += len(s.recv(65536))
+            if received[s] >= expected:
+                pending.remove(s)
+
+    elapsed = time.time() - t
+
+    for s in socks:
+        s.close()
+
+    return clients * packets / elapsed
+
+def main():
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+
+    backends = sys.argv[2].split(',') if len(sys.argv) > 2 else \
+        ['Twisted', 'asyncio']
+    connections = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    parallel = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+    clients = int(sys.argv[5]) if len(sys.argv) > 5 else 20
+    packets = int(sys.argv[6]) if len(sys.argv) > 6 else 2000
+
+    print "%d conexiones (%d en paralelo); %d clientes x %d paquetes" % \
+        (connections, parallel, clients, packets)
+    print "%-10s %14s %14s" % ('backend', 'conexiones/s', 'paquetes/s')
+
+    fd, configFile = tempfile.mkstemp('.txt')
+    os.close(fd)
+
+    try:
+        for backend in backends:
+            port = writeConfig(sys.argv[1], configFile, backend)
+            proc = startServer(configFile, port)
+            try:
+                connRate, errors = benchConnections(port, connections, \
+                    parallel, 0)
+                packetRate = benchPackets(port, clients, packets, connections)
+            finally:
+                proc.terminate()
+                proc.wait()
+
+            print "%-10s %14.1f %14.1f%s" % (backend, connRate, packetRate, \
+                " (%d logins fallidos)" % errors if errors else '')
+    finally:
+        os.remove(configFile)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Benchmark de busqueda de caminos sobre un mapa real.
+
+Mide consultas por segundo de MapNavigation: A* entre pares de tiles al
+azar, destinos inalcanzables (descartados por componente) y pasos de
+persecucion con campos de distancia hacia unos pocos objetivos, con y sin
+cambios de ocupacion.
+
+Forma de uso: bench_pathfinding.py RutaDeLosMapas NumeroDeMapa [consultas]
+"""
+
+import sys, os, time, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import mapfile
+from argentumserver.pathfinding import MapNavigation, NEIGHBOURS, idxToPos, \
+    posToIdx, MAP_TILES
+
+def rate(name, n, t):
+    print "%-28s %10.0f consultas/s" % (name, n / t if t else 0.0)
+
+def main():
+    if len(sys.argv) < 3:
+        print __doc__
+        sys.exit(1)
+
+    mf = mapfile.loadMapFile(int(sys.argv[2]), sys.argv[1])
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    occupied = [None] * MAP_TILES
+
+    t = time.time()
+    nav = MapNavigation(mf.blocked, occupied)
+    print "Componentes: %d, etiquetado en %.1f ms" % \
+        (max(nav.components), (time.time() - t) * 1000)
+
+    rnd = random.Random(0)
+    free = [idxToPos(i) for i in xrange(MAP_TILES) if not mf.blocked[i]]
+    pairs = [(rnd.choice(free), rnd.choice(free)) for x in xrange(count)]
+
+    same = [(a, b) for a, b in pairs if nav.reachable(a, b)]
+    other = [(a, b) for a, b in pairs if not nav.reachable(a, b)]
+
+    t = time.time()
+    for a, b in pairs:
+        nav.reachable(a, b)
+    rate('reachable', len(pairs), time.time() - t)
+
+    if same:
+        t = time.time()
+        lengths = 0
+        for a, b in same:
+            lengths += len(nav.findPath(a, b) or ())
+        rate('A* alcanzable', len(same), time.time() - t)
+        print "  largo promedio: %.1f" % (float(lengths) / len(same))
+
+        near = [(a, b) for a, b in same if abs(a[0] - b[0]) + \
+            abs(a[1] - b[1]) <= 15]
+        if near:
+            t = time.time()
+            for a, b in near:
+                nav.findPath(a, b)
+            rate('A* cercano (<= 15 tiles)', len(near), time.time() - t)
+
+    if other:
+        t = time.time()
+        for a, b in other:
+            nav.findPath(a, b)
+        rate('A* inalcanzable', len(other), time.time() - t)
+
+    # Persecucion: muchos NPCs detras de pocos jugadores.
+    targets = [rnd.choice(free) for x in xrange(8)]
+    chasers = [rnd.choice(free) for x in xrange(count)]
+
+    t = time.time()
+    for i, c in enumerate(chasers):
+        nav.stepToward(c, targets[i % len(targets)])
+    rate('stepToward (8 objetivos)', len(chasers), time.time() - t)
+    print "  campos: %d calculados, %d reusados" % (nav.misses, nav.hits)
+
+    # Lo mismo, pero cada 50 pasos alguien se mueve un tile: solamente se
+    # recalculan los campos que llegaban a los tiles que cambiaron.
+    nav.hits = nav.misses = 0
+    walker = posToIdx(rnd.choice(free))
+
+    t = time.time()
+    for i, c in enumerate(chasers):
+        if i % 50 == 0:
+            occupied[walker] = None
+            nav.tileChanged(walker)
+            walker = rnd.choice([n for n in NEIGHBOURS[walker] \
+                if not mf.blocked[n]] or [walker])
+            occupied[walker] = 1
+            nav.tileChanged(walker)
+        nav.stepToward(c, targets[i % len(targets)])
+    rate('stepToward (con movimiento)', len(chasers), time.time() - t)
+    print "  campos: %d calculados, %d reusados" % (nav.misses, nav.hits)
+
+if __name__ == '__main__':
+    main()
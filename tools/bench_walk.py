@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Benchmark de validacion de movimientos (el paquete Walk).
+
+Compara la validacion original de GameMap.validPos (MapFileTile por tile mas
+getPos) contra la grilla de colisiones, de a una posicion (isFree) y en
+lote (canMove, las 4 direcciones de una vez).
+
+Forma de uso: bench_walk.py RutaDeLosMapas NumeroDeMapa [validaciones]
+"""
+
+import sys, os, time, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import mapfile
+from argentumserver.collision import CollisionGrid
+from argentumserver.constants import MAP_SIZE_X, MAP_SIZE_Y
+
+class OldValidation(object):
+    """validPos como estaba antes de la grilla de colisiones."""
+
+    def __init__(self, mf, players):
+        self.mapFile = mf
+        self._playersMatrix = players
+
+    def getPos(self, x, y):
+        assert x >= 1 and x <= MAP_SIZE_X
+        assert y >= 1 and y <= MAP_SIZE_Y
+
+        return self._playersMatrix[(x - 1) + (y - 1) * MAP_SIZE_X]
+
+    def validPos(self, pos):
+        x, y = pos
+
+        if x < 1 or x > MAP_SIZE_X:
+            return False
+
+        if y < 1 or y > MAP_SIZE_Y:
+            return False
+
+        if self.mapFile[x, y].blocked:
+            return False
+
+        if self.getPos(x, y) is not None:
+            return False
+
+        return True
+
+def main():
+    if len(sys.argv) < 3:
+        print __doc__
+        sys.exit(1)
+
+    mf = mapfile.loadMapFile(int(sys.argv[2]), sys.argv[1])
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 200000
+    rnd = random.Random(0)
+
+    players = [None] * (MAP_SIZE_X * MAP_SIZE_Y)
+    grid = CollisionGrid(mf.blocked)
+    for i in xrange(500):
+        idx = rnd.randrange(len(players))
+        players[idx] = i + 1
+        grid.setOccupied(idx, True)
+
+    old = OldValidation(mf, players)
+    positions = [(rnd.randint(1, MAP_SIZE_X), rnd.randint(1, MAP_SIZE_Y)) \
+        for x in xrange(count)]
+
+    assert [old.validPos(p) for p in positions] == \
+        [grid.isFree(p) for p in positions]
+
+    t = time.time()
+    for p in positions:
+        old.validPos(p)
+    tOld = time.time() - t
+
+    t = time.time()
+    for p in positions:
+        grid.isFree(p)
+    tNew = time.time() - t
+
+    # Lote: las 4 posiciones vecinas de cada tile, como un NPC que elige a
+    # donde moverse.
+    batches = [((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)) \
+        for x, y in positions[:count // 4]]
+
+    t = time.time()
+    for b in batches:
+        grid.canMove(b)
+    tBatch = time.time() - t
+
+    print "validPos anterior: %10.0f validaciones/s" % (count / tOld)
+    print "isFree:            %10.0f validaciones/s (%.1fx)" % \
+        (count / tNew, tOld / tNew)
+    print "canMove (de a 4):  %10.0f validaciones/s (%.1fx)" % \
+        (len(batches) * 4 / tBatch, tOld / (tBatch * 4 * len(batches) / count))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Benchmark de consultas al grafo del mundo.
+
+Arma el grafo a partir de los mapas y mide el tiempo de route() y
+distance() entre pares de mapas al azar, con los caminos ya calculados.
+
+Forma de uso: bench_worldgraph.py RutaDeLosMapas CantidadDeMapas [RutaDeLosCompilados]
+"""
+
+import sys, os, time, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import worldgraph
+
+def main():
+    if len(sys.argv) < 3:
+        print __doc__
+        sys.exit(1)
+
+    mapsPath = sys.argv[1]
+    mapCount = int(sys.argv[2])
+    compiledPath = sys.argv[3] if len(sys.argv) > 3 else None
+
+    t = time.time()
+    g = worldgraph.loadWorldGraph(mapCount, mapsPath, compiledPath)
+    print "Grafo: %d mapas, %d salidas, armado en %.3f s" % (len(g), \
+        sum([len(e) for e in g.exits.itervalues()]), time.time() - t)
+
+    maps = sorted(g.exits)
+    rnd = random.Random(0)
+    pairs = [(rnd.choice(maps), rnd.choice(maps)) for x in xrange(100000)]
+
+    # Primera pasada: calcula los arboles de caminos de cada origen.
+    t = time.time()
+    for a, b in pairs:
+        g.route(a, b)
+    print "route (primera vez): %.2f us/consulta" % \
+        ((time.time() - t) * 1e6 / len(pairs))
+
+    for name, f in (('route', g.route), ('distance', g.distance)):
+        t = time.time()
+        for a, b in pairs:
+            f(a, b)
+        print "%s: %.2f us/consulta" % (name, \
+            (time.time() - t) * 1e6 / len(pairs))
+
+    found = [g.distance(a, b) for a, b in pairs]
+    found = [d for d in found if d is not None]
+    if found:
+        print "Caminos encontrados: %d de %d, largo promedio %.2f" % \
+            (len(found), len(pairs), float(sum(found)) / len(found))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    AONX Server - Pequeño servidor de Argentum Online.
+    Copyright (C) 2011 Alejandro Santos <alejolp@alejolp.com.ar>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Compilador de mapas.
+
+Convierte los map/inf/dat de cada mapa al formato compilado de mapfile, que
+el servidor carga en lugar de los originales si MapsCompiledPath esta
+definido. Solamente recompila los mapas cuyos archivos fuente cambiaron,
+salvo que se use -f.
+
+Forma de uso: mapcompiler.py [-f] RutaDeLosMapas RutaDeLosCompilados CantidadDeMapas
+"""
+
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    '..'))
+
+from argentumserver import mapfile
+
+def main():
+    args = sys.argv[1:]
+    force = '-f' in args
+    args = [a for a in args if a != '-f']
+
+    if len(args) != 3:
+        print __doc__
+        sys.exit(1)
+
+    mapsPath, compiledPath, mapCount = args[0], args[1], int(args[2])
+
+    if not os.path.isdir(compiledPath):
+        os.makedirs(compiledPath)
+
+    compiled = 0
+    t = time.time()
+
+    for mapNum in xrange(1, mapCount + 1):
+        try:
+            mf, done = mapfile.compileMap(mapNum, mapsPath, compiledPath, \
+                force)
+        except (IOError, OSError), e:
+            print "Mapa %d: %s" % (mapNum, e)
+            continue
+
+        if done:
+            compiled += 1
+            print "Mapa %d compilado." % mapNum
+
+    print "%d mapas compilados en %.2f segundos." % (compiled, \
+        time.time() - t)
+
+if __name__ == '__main__':
+    main()